@@ -8,9 +8,7 @@ from pathlib import Path
 from typing import Optional
 
 from arrow import now
-from matplotlib.pyplot import close
 from matplotlib.pyplot import savefig
-from matplotlib.pyplot import subplots
 from matplotlib.pyplot import xticks
 from pandas import DataFrame
 from pandas import concat
@@ -18,25 +16,44 @@ from pandas import read_excel
 from pandas import read_html
 from plotly.express import bar
 from seaborn import barplot
-from plotly.io import to_html
-from markdown2 import markdown
 
-
-def get_excel_dataframe(io: str) -> DataFrame:
-    result_df = read_excel(io=io)
+from common import dataset_key
+from common import remember_dataset
+from figures import release
+from figures import subplots
+from plotly_html import write_page
+from report import build_site
+from sources import SOURCES
+from sources import fetch
+from sources import read_source
+from tracing import span
+from tracing import traced
+
+
+@traced(category='load')
+def get_excel_dataframe(name: str) -> DataFrame:
+    # the workbook comes straight out of the mirrored archive; nothing is extracted
+    result_df = remember_dataset(key=dataset_key(io=str(fetch(name=name)), reader='read_excel'),
+                                 loader=lambda: read_source(name=name, reader=read_excel))
     return result_df
 
 
-def get_html_dataframe(url: str, skiprows: Optional[int]) -> list[DataFrame]:
-    result_df = read_html(io=url, skiprows=skiprows)
+@traced(category='load')
+def get_html_dataframe(name: str, skiprows: Optional[int]) -> list[DataFrame]:
+    result_df = read_source(name=name, reader=read_html, skiprows=skiprows)
     return result_df
 
 
+def lynching_bar(data_frame: DataFrame):
+    return bar(barmode='group', color='Source', data_frame=data_frame, x='Year', y='Deaths', )
+
+
 DATA_FOLDER = './data/HAL/'
 FIGSIZE = (16, 9)
-HAL_FILE = './data/HAL/HAL.XLS'
+MARKDOWN_PAGE = '\n\n'.join(['# Lynching data from two sources', 'Here is the preamble text.',
+                              '{{chart:aggregate_bar}}', 'And here is the footer text.'])
 OUTPUT_FOLDER = './plot_lynching/'
-UMKC_URL = 'http://law2.umkc.edu/faculty/projects/ftrials/shipp/lynchingyear.html'
+UMKC_URL = SOURCES['umkc']['url']
 
 if __name__ == '__main__':
     TIME_START = now()
@@ -48,22 +65,24 @@ if __name__ == '__main__':
         LOGGER.info('creating folder %s if it does not exist', folder)
         Path(folder).mkdir(parents=True, exist_ok=True)
 
-    umkc_df = get_html_dataframe(url=UMKC_URL, skiprows=3)
-    umkc_df = umkc_df[0].dropna().iloc[0:87]
-    for column in umkc_df.columns:
-        umkc_df[column] = umkc_df[column].astype(int)
-    umkc_df['Year'] = umkc_df['Year'].astype(int)
-
-    df = get_excel_dataframe(io=HAL_FILE)
-    df = df[df['Year'] != '1900s']
-    columns = {'index': 'Year', 'Year': 'Deaths'}
-    hal_df = df['Year'].value_counts().to_frame().reset_index(level=0).rename(columns=columns).sort_values(by='Year')
-
-    first_df = umkc_df[['Year', 'Total']].rename(columns={'Total': 'Deaths'})
-    first_df['Source'] = 'UMKC'
-    second_df = hal_df
-    second_df['Source'] = 'HAL'
-    aggregate_df = concat([first_df, second_df], ignore_index=True)
+    umkc_df = get_html_dataframe(name='umkc', skiprows=3)
+    with span(name='combine sources', category='compute'):
+        umkc_df = umkc_df[0].dropna().iloc[0:87]
+        for column in umkc_df.columns:
+            umkc_df[column] = umkc_df[column].astype(int)
+        umkc_df['Year'] = umkc_df['Year'].astype(int)
+
+        df = get_excel_dataframe(name='hal')
+        df = df[df['Year'] != '1900s']
+        columns = {'index': 'Year', 'Year': 'Deaths'}
+        hal_df = df['Year'].value_counts().to_frame().reset_index(level=0).rename(columns=columns).sort_values(
+            by='Year')
+
+        first_df = umkc_df[['Year', 'Total']].rename(columns={'Total': 'Deaths'})
+        first_df['Source'] = 'UMKC'
+        second_df = hal_df
+        second_df['Source'] = 'HAL'
+        aggregate_df = concat([first_df, second_df], ignore_index=True)
 
     # seaborn version
     figure_barplot, axes_barplot = subplots(figsize=FIGSIZE)
@@ -71,22 +90,13 @@ if __name__ == '__main__':
     axes_barplot.legend(loc='upper right')
     xticks(rotation=90)
     savefig(format='png', fname=OUTPUT_FOLDER + 'aggregate_lynchings_barplot.png')
-    close(fig=figure_barplot)
+    release(figure=figure_barplot)
 
     # plotly version
-    plotly_bar = bar(barmode='group', color='Source', data_frame=aggregate_df, x='Year', y='Deaths', )
-    plotly_bar.write_html(OUTPUT_FOLDER + 'aggregate_lynchings_bar.html', )
-
-    div = to_html(fig=plotly_bar, full_html=False)
-    md_input = ['# Lynching data from two sources \n' +
-                'Here is the preamble text.',
-                'And here is the footer text.']
-
-    html_result = [markdown(text=item) for item in md_input]
+    write_page(figure=lynching_bar(data_frame=aggregate_df), path=OUTPUT_FOLDER + 'aggregate_lynchings_bar.html')
 
-    with open(file=OUTPUT_FOLDER + 'markdown_text_bar.html', mode='w') as output_fp:
-        output_fp.write(
-            ' '.join([html_result[0], div, html_result[1]])
-        )
+    # the same chart in a markdown page; an edit to the text rebuilds the page without drawing the chart again
+    build_site(charts={'aggregate_bar': {'chart': lynching_bar, 'data_frame': aggregate_df}}, folder=OUTPUT_FOLDER,
+               pages={'markdown_text_bar': MARKDOWN_PAGE}, title='Lynching data from two sources')
 
     LOGGER.info('total time: {:5.2f}s'.format((now() - TIME_START).total_seconds()))
@@ -8,9 +8,7 @@ from pathlib import Path
 from typing import Optional
 
 from arrow import now
-from matplotlib.pyplot import close
 from matplotlib.pyplot import savefig
-from matplotlib.pyplot import subplots
 from matplotlib.pyplot import tight_layout
 from numpy import nan
 from pandas import DataFrame
@@ -23,8 +21,12 @@ from seaborn import relplot
 from seaborn import scatterplot
 from seaborn import set_style
 
-from common import COLUMNS
-from common import read_excel_dataframe
+from common import stream_excel_dataframe
+from figures import release
+from figures import subplots
+from render import render_changed_jobs
+from sources import fetch
+from tracing import span
 
 
 def make_plots(column_name: str, column_short_name: str, input_df: DataFrame, fname_short: str,
@@ -38,32 +40,49 @@ def make_plots(column_name: str, column_short_name: str, input_df: DataFrame, fn
     _ = lineplot(ax=axes_, data=work_df, x='Year', y=column_short_name)
     fname_ = '{}{}_lineplot.png'.format(OUTPUT_FOLDER, fname_short)
     savefig(format='png', fname=fname_, )
-    close(fig=figure_)
+    release(figure=figure_)
     figure_, axes_ = subplots()
     _ = scatterplot(ax=axes_, data=work_df, x='Year', y=column_short_name)
     fname_ = '{}{}_scatterplot.png'.format(OUTPUT_FOLDER, fname_short)
     savefig(format='png', fname=fname_, )
-    close(fig=figure_)
-    figure_, axes_ = subplots()
-    _ = lmplot(data=work_df, line_kws={'color': 'orange'}, x='Year', y=column_short_name, )
+    release(figure=figure_)
+    grid_ = lmplot(data=work_df, line_kws={'color': 'orange'}, x='Year', y=column_short_name, )
     fname_ = '{}{}_lmplot.png'.format(OUTPUT_FOLDER, fname_short)
     savefig(format='png', fname=fname_, )
-    close(fig=figure_)
+    release(figure=grid_.figure)
     figure_, axes_ = subplots()
     _ = regplot(data=work_df, line_kws={'color': 'orange'}, x='Year', y=column_short_name, )
     fname_ = '{}{}_regplot.png'.format(OUTPUT_FOLDER, fname_short)
     savefig(format='png', fname=fname_, )
-    close(fig=figure_)
+    release(figure=figure_)
     rvalue = linregress(x=work_df['Year'], y=work_df[column_short_name]).rvalue
     return rvalue * rvalue
 
 
+def plot_lineplot(plot_df: DataFrame, fname: str, y: str, hue: str) -> None:
+    figure_, axes_ = subplots()
+    _ = lineplot(ax=axes_, data=plot_df, x='Year', y=y, hue=hue)
+    tight_layout()
+    savefig(format='png', fname=fname, )
+    release(figure=figure_)
+
+
+def plot_relplot(plot_df: DataFrame, fname: str) -> None:
+    result_relplot = relplot(col='variable', data=plot_df, kind='line', x='Year', y='Quantity', hue='Country',
+                             facet_kws={'sharey': False, 'sharex': True, 'legend_out': True, }, )
+    result_relplot.set(ylabel=None)
+    savefig(fname=fname, format='png')
+    release(figure=result_relplot.figure)
+
+
 DATA_FOLDER = './data/'
-INPUT_FILE = 'WPP2022_GEN_F01_DEMOGRAPHIC_INDICATORS_COMPACT_REV1.xlsx'
 OUTPUT_FOLDER = './plot/'
 SAVE_WORLD_DATA = False
 SEABORN_STYLE = 'darkgrid'
 USECOLS = [
+    'Crude Death Rate (deaths per 1,000 population)',
+    'Region, subregion, country or area *',
+    'Total Deaths (thousands)',
     'Year',
 ]
 WORLD_DATA_FILE = 'WPP2022_GEN_F01_DEMOGRAPHIC_INDICATORS_COMPACT_REV1_WORLD.xlsx'
@@ -78,64 +97,54 @@ if __name__ == '__main__':
         LOGGER.info('creating folder %s if it does not exist', folder)
         Path(folder).mkdir(parents=True, exist_ok=True)
 
-    data_file = DATA_FOLDER + INPUT_FILE
-    df = read_excel_dataframe(io=data_file, header=16, usecols=COLUMNS)
+    data_file = str(fetch(name='wpp'))
+    # Parent code 906
+    df = stream_excel_dataframe(io=data_file, header=16, usecols=USECOLS, parent_codes={906})
     LOGGER.info('loaded %d rows from %s', len(df), data_file)
 
     set_style(style=SEABORN_STYLE)
 
-    # Parent code 906
-    eastern_asia_df = df[df['Parent code'] == 906][[
-        'Year', 'Region, subregion, country or area *',
-        'Crude Death Rate (deaths per 1,000 population)',
-        'Total Deaths (thousands)',
-    ]].rename(columns={
-        'Crude Death Rate (deaths per 1,000 population)': 'Crude Death',
-        'Region, subregion, country or area *': 'Country',
-        'Total Deaths (thousands)': 'Deaths'
-    })
-    eastern_asia_df['Deaths'] = 1000 * eastern_asia_df['Deaths'].astype(int)
-    eastern_asia_df['Year'] = eastern_asia_df['Year'].astype(int)
-    # rename the countries so we get a small legend
-    eastern_asia_df['Country'].replace({'China, Hong Kong SAR': 'Hong Kong',
-                                        'China, Macao SAR': 'Macau',
-                                        'China, Taiwan Province of China': 'Taiwan',
-                                        'Dem. People\'s Republic of Korea': 'N. Korea',
-                                        'Republic of Korea': 'S. Korea'}, inplace=True)
+    with span(name='eastern asia', category='compute'):
+        eastern_asia_df = df.rename(columns={
+            'Crude Death Rate (deaths per 1,000 population)': 'Crude Death',
+            'Region, subregion, country or area *': 'Country',
+            'Total Deaths (thousands)': 'Deaths'
+        })
+        eastern_asia_df['Deaths'] = 1000 * eastern_asia_df['Deaths'].astype(int)
+        eastern_asia_df['Year'] = eastern_asia_df['Year'].astype(int)
+        # the names come back categorical; we want plain strings for the legend, renamed so we get a small legend
+        eastern_asia_df['Country'] = eastern_asia_df['Country'].astype(str).replace({
+            'China, Hong Kong SAR': 'Hong Kong',
+            'China, Macao SAR': 'Macau',
+            'China, Taiwan Province of China': 'Taiwan',
+            'Dem. People\'s Republic of Korea': 'N. Korea',
+            'Republic of Korea': 'S. Korea'})
 
-    figure_, axes_ = subplots()
-    _ = lineplot(ax=axes_, data=eastern_asia_df, x='Year', y='Crude Death', hue='Country')
-    fname_ = '{}{}_lineplot.png'.format(OUTPUT_FOLDER, 'eastern_asia_crude_death')
-    tight_layout()
-    savefig(format='png', fname=fname_, )
-    close(fig=figure_)
-    LOGGER.info('saved plot in %s', fname_)
+    lineplot_jobs = [{'fname': '{}{}_lineplot.png'.format(OUTPUT_FOLDER, 'eastern_asia_crude_death'), 'hue': 'Country',
+                      'plot_df': eastern_asia_df[['Year', 'Crude Death', 'Country']], 'y': 'Crude Death', }]
 
     plot_df = melt(frame=eastern_asia_df, id_vars=['Year', 'Country'], value_name='Quantity',
                    value_vars=['Crude Death', 'Deaths'])
-    figure_relplot, axes_relplot = subplots()
-    result_relplot = relplot(col='variable', data=plot_df, kind='line', x='Year', y='Quantity', hue='Country',
-                             facet_kws={'sharey': False, 'sharex': True, 'legend_out': True, }, )
-    result_relplot.set(ylabel=None)
-    savefig(fname=OUTPUT_FOLDER + 'eastern_asia_relplot.png', format='png')
-    close(fig=figure_relplot)
-
-    china_df = plot_df[
-        (plot_df['Country'] == 'China') & (plot_df['variable'] != 'Crude Death') & (plot_df['Year'] >= 1956) & (
-                plot_df['Year'] <= 1964)].copy(deep=True)
-    china_df['Interpolated'] = china_df.apply(axis=1,
-                                              func=lambda x: x['Quantity'] if x['Year'] not in {1959, 1960,
-                                                                                                1961} else nan)
-    china_df['Interpolated'] = china_df['Interpolated'].interpolate().astype(int)
-    LOGGER.info('excess deaths estimate: %d', china_df['Quantity'].sum() - china_df['Interpolated'].sum())
-    china_df['Actual'] = china_df['Quantity']
-    small_plot_df = melt(frame=china_df, id_vars=['Year'], value_vars=['Actual', 'Interpolated'], value_name='Deaths')
-    figure_, axes_ = subplots()
-    _ = lineplot(ax=axes_, data=small_plot_df, x='Year', y='Deaths', hue='variable')
-    fname_ = '{}{}_lineplot.png'.format(OUTPUT_FOLDER, 'china_interpolated')
-    tight_layout()
-    savefig(format='png', fname=fname_, )
-    close(fig=figure_)
-    LOGGER.info('saved plot in %s', fname_)
+    # only the plots whose data or plotting code changed since the last run get rendered again
+    render_changed_jobs(function=plot_relplot,
+                        jobs=[{'fname': OUTPUT_FOLDER + 'eastern_asia_relplot.png', 'plot_df': plot_df, }])
+
+    with span(name='china excess deaths', category='compute'):
+        china_df = plot_df[
+            (plot_df['Country'] == 'China') & (plot_df['variable'] != 'Crude Death') & (plot_df['Year'] >= 1956) & (
+                    plot_df['Year'] <= 1964)].copy(deep=True)
+        china_df['Interpolated'] = china_df.apply(axis=1,
+                                                  func=lambda x: x['Quantity'] if x['Year'] not in {1959, 1960,
+                                                                                                    1961} else nan)
+        china_df['Interpolated'] = china_df['Interpolated'].interpolate().astype(int)
+        LOGGER.info('excess deaths estimate: %d', china_df['Quantity'].sum() - china_df['Interpolated'].sum())
+        china_df['Actual'] = china_df['Quantity']
+        small_plot_df = melt(frame=china_df, id_vars=['Year'], value_vars=['Actual', 'Interpolated'],
+                             value_name='Deaths')
+    lineplot_jobs.append({'fname': '{}{}_lineplot.png'.format(OUTPUT_FOLDER, 'china_interpolated'), 'hue': 'variable',
+                          'plot_df': small_plot_df, 'y': 'Deaths', })
+    for fname, error in render_changed_jobs(function=plot_lineplot, jobs=lineplot_jobs):
+        if error is None:
+            LOGGER.info('saved plot in %s', fname)
 
     LOGGER.info('total time: {:5.2f}s'.format((now() - TIME_START).total_seconds()))
@@ -5,25 +5,19 @@ from logging import INFO
 from logging import basicConfig
 from logging import getLogger
 from pathlib import Path
-from typing import Optional
-from typing import Union
 
 from arrow import now
-from matplotlib.pyplot import close
 from matplotlib.pyplot import savefig
-from matplotlib.pyplot import subplots
-from pandas import DataFrame
 from pandas import melt
-from pandas import read_excel
 from seaborn import relplot
 from seaborn import set_style
 from seaborn import lineplot
 
-
-def read_excel_dataframe(io: str, header: int, usecols: Optional[Union[list, int]]) -> DataFrame:
-    result_df = read_excel(engine='openpyxl', header=header, io=io, usecols=usecols)
-    return result_df
-
+from common import stream_excel_dataframe
+from figures import release
+from figures import subplots
+from sources import fetch
+from tracing import span
 
 # todo move this to common
 COLUMNS = ['Index', 'Variant', 'Region, subregion, country or area *', 'Notes',
@@ -81,7 +75,6 @@ COLUMNS = ['Index', 'Variant', 'Region, subregion, country or area *', 'Notes',
            'Net Number of Migrants (thousands)',
            'Net Migration Rate (per 1,000 population)']
 DATA_FOLDER = './data/'
-INPUT_FILE = 'WPP2022_GEN_F01_DEMOGRAPHIC_INDICATORS_COMPACT_REV1.xlsx'
 OUTPUT_FOLDER = './plot/'
 SAVE_WORLD_DATA = False
 SEABORN_STYLE = 'darkgrid'
@@ -110,31 +103,31 @@ if __name__ == '__main__':
         LOGGER.info('creating folder %s if it does not exist', folder)
         Path(folder).mkdir(parents=True, exist_ok=True)
 
-    data_file = DATA_FOLDER + INPUT_FILE
-    df = read_excel_dataframe(io=data_file, header=16, usecols=USECOLS)
-    LOGGER.info('loaded %d rows from %s', len(df), data_file)
-    # filter for the data we want and make a copy because we need to add columns
-    world_df = df[df['Region, subregion, country or area *'] == 'WORLD'].copy(deep=True)
+    data_file = str(fetch(name='wpp'))
+    # the WORLD location code is 900
+    world_df = stream_excel_dataframe(io=data_file, header=16, usecols=USECOLS, location_codes={900})
+    LOGGER.info('loaded %d rows from %s', len(world_df), data_file)
 
     set_style(style=SEABORN_STYLE)
 
-    birth_death_df = world_df[['Year',
-                               'Crude Birth Rate (births per 1,000 population)',
-                               'Crude Death Rate (deaths per 1,000 population)',
-                               ]].rename(columns={
-        'Crude Birth Rate (births per 1,000 population)': 'Births',
-        'Crude Death Rate (deaths per 1,000 population)': 'Deaths',
-    })
-    plot_df = melt(frame=birth_death_df, id_vars=['Year'], value_name='Rate', value_vars=['Births', 'Deaths'])
+    with span(name='birth and death rates', category='compute'):
+        birth_death_df = world_df[['Year',
+                                   'Crude Birth Rate (births per 1,000 population)',
+                                   'Crude Death Rate (deaths per 1,000 population)',
+                                   ]].rename(columns={
+            'Crude Birth Rate (births per 1,000 population)': 'Births',
+            'Crude Death Rate (deaths per 1,000 population)': 'Deaths',
+        })
+        plot_df = melt(frame=birth_death_df, id_vars=['Year'], value_name='Rate', value_vars=['Births', 'Deaths'])
 
-    figure_relplot, axes_relplot = subplots()
-    result_relplot = relplot(col='variable', data=plot_df, kind='line', x='Year', y='Rate', )
-    savefig(fname=OUTPUT_FOLDER + 'birth_death_relplot.png', format='png')
-    close(fig=figure_relplot)
+    with span(name='birth and death plots', category='plot'):
+        result_relplot = relplot(col='variable', data=plot_df, kind='line', x='Year', y='Rate', )
+        savefig(fname=OUTPUT_FOLDER + 'birth_death_relplot.png', format='png')
+        release(figure=result_relplot.figure)
 
-    figure_lineplot, axes_lineplot = subplots()
-    result_lineplot = lineplot(data=plot_df, x='Year', y='Rate', hue='variable')
-    savefig(fname=OUTPUT_FOLDER + 'birth_death_lineplot.png', format='png')
-    close(fig=figure_lineplot)
+        figure_lineplot, axes_lineplot = subplots()
+        result_lineplot = lineplot(data=plot_df, x='Year', y='Rate', hue='variable')
+        savefig(fname=OUTPUT_FOLDER + 'birth_death_lineplot.png', format='png')
+        release(figure=figure_lineplot)
 
     LOGGER.info('total time: {:5.2f}s'.format((now() - TIME_START).total_seconds()))
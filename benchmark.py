@@ -0,0 +1,266 @@
+"""
+Time the hot paths against fixed inputs and compare the results with a stored baseline
+"""
+from argparse import ArgumentParser
+from json import dump
+from json import load
+from logging import INFO
+from logging import basicConfig
+from logging import getLogger
+from math import log10
+from pathlib import Path
+from statistics import median
+from sys import exit
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from tracemalloc import get_traced_memory
+from tracemalloc import start
+from tracemalloc import stop
+from typing import Callable
+
+from arrow import now
+from matplotlib import use
+from matplotlib.pyplot import close
+from matplotlib.pyplot import subplots
+from numpy.random import default_rng
+from pandas import DataFrame
+from pandas import Series
+from pandas import concat
+
+import common
+import continent
+import crude_death
+import main
+import read_cdc
+from render import render_jobs
+from synthetic import wpp_frames
+from synthetic import write_workbook
+
+
+def make_wpp_frame(countries: int, years: range) -> DataFrame:
+    # the same seed always gives the same sheet, typed the way the loaders type it
+    return common.apply_schema(input_df=common.typed_frame(input_df=concat(wpp_frames(
+        countries=countries, nan_rate=NAN_RATE, seed=SEED, sentinel_rate=SENTINEL_RATE, variants=['Estimates'],
+        years=years), ignore_index=True)))
+
+
+def setup_read_excel_dataframe(folder: str, scale: int) -> dict:
+    io = str(Path(folder) / 'wpp.xlsx')
+    write_workbook(path=io, frames=wpp_frames(countries=20 * scale, nan_rate=NAN_RATE, seed=SEED,
+                                              sentinel_rate=SENTINEL_RATE, variants=['Estimates'], years=YEARS))
+    return {'header': 16, 'io': io, 'use_cache': False, 'usecols': common.COLUMNS}
+
+
+def setup_reshape(folder: str, scale: int) -> dict:
+    input_df = make_wpp_frame(countries=200 * scale, years=YEARS)
+    return {'input_df': input_df, 'value_column_name': 'value', 'x_column': 'Year',
+            'y_column_name': 'indicator', 'y_columns': common.INDICATOR_COLUMNS[:20]}
+
+
+def reshape_concat(input_df: DataFrame, x_column: str, y_columns: list[str], y_column_name: str,
+                   value_column_name: str) -> DataFrame:
+    # the reshape common.py had before it built the long frame in one pass: one renamed copy per y column, then concat
+    return concat([input_df[[x_column, y_column]].rename(columns={y_column: value_column_name}).assign(
+        **{y_column_name: y_column}) for y_column in y_columns], ignore_index=True)
+
+
+def run_reshape_view(input_df: DataFrame, x_column: str, y_columns: list[str], y_column_name: str,
+                     value_column_name: str) -> float:
+    # a consumer that only needs one pass over the long rows never builds them
+    view = common.reshape_view(input_df=input_df, value_column_name=value_column_name, x_column=x_column,
+                               y_column_name=y_column_name, y_columns=y_columns)
+    return sum(float(block_df[value_column_name].sum()) for _, block_df in view.blocks())
+
+
+def setup_label_point(folder: str, scale: int) -> dict:
+    input_df = make_wpp_frame(countries=200 * scale, years=range(2000, 2001))
+    figure, axes = subplots()
+    axes.scatter(x=input_df[common.INDICATOR_COLUMNS[0]], y=input_df[common.INDICATOR_COLUMNS[1]])
+    return {'ax': axes, 'val': input_df['Region, subregion, country or area *'],
+            'x': input_df[common.INDICATOR_COLUMNS[0]], 'y': input_df[common.INDICATOR_COLUMNS[1]]}
+
+
+def run_label_point(ax, val: Series, x: Series, y: Series) -> None:
+    # labels cost time when they are placed and again when they are drawn, so time both
+    common.label_point(ax=ax, val=val, x=x, y=y)
+    ax.figure.canvas.draw()
+    # each run starts from the same axes, without the labels from the run before
+    for artist in list(ax.texts) + list(ax.collections)[1:]:
+        artist.remove()
+
+
+def setup_make_plots(folder: str, scale: int) -> dict:
+    main.OUTPUT_FOLDER = folder + '/'
+    input_df = make_wpp_frame(countries=0, years=range(YEARS.start, YEARS.start + len(YEARS) * scale))
+    return {'column_name': common.INDICATOR_COLUMNS[0], 'column_short_name': 'Population', 'fname_short': 'world',
+            'input_df': input_df[input_df['Type'] == 'World'].dropna(subset=[common.INDICATOR_COLUMNS[0]])}
+
+
+def setup_read_cdc(folder: str, scale: int) -> dict:
+    generator = default_rng(seed=SEED)
+    url = str(Path(folder) / 'wonder.txt')
+    rows = [(code, year) for code in range(1, 1 + 137 * scale) for year in range(1999, 2021)]
+    deaths = generator.integers(low=10, high=700000, size=len(rows))
+    # tab separated, quoted names and codes, and thousands separators, like a WONDER export
+    with open(file=url, mode='w') as output_fp:
+        output_fp.write('"Notes"\t"ICD-10 113 Cause List"\t"ICD-10 113 Cause List Code"\t"Year"\t"Year Code"\t'
+                        'Deaths\tPopulation\tCrude Rate\n')
+        for (code, year), count in zip(rows, deaths):
+            output_fp.write('\t"Cause {0} (A{0:02d})"\t"GR113-{0:03d}"\t"{1}"\t"{1}"\t{2:,}\t{3:,}\t{4:.1f}\n'.format(
+                code, year, count, 300000000, 100000 * count / 300000000))
+    return {'url': url}
+
+
+def run_read_cdc(url: str) -> DataFrame:
+    # the parse is memoized for the pipeline, so each run has to start from an empty memo
+    common.DATASETS.clear()
+    result_df = read_cdc.read_url_csv(url=url)
+    result_df = result_df.dropna()
+    for column in ['Year', 'Deaths', 'Population']:
+        result_df[column] = result_df[column].astype(int)
+    result_df['crude rate'] = read_cdc.SCALING * result_df['Deaths'] / result_df['Population']
+    result_df['log10 deaths'] = result_df['Deaths'].apply(log10)
+    return result_df
+
+
+def setup_continent_statistics(folder: str, scale: int) -> dict:
+    input_df = make_wpp_frame(countries=60 * scale, years=YEARS).rename(columns={
+        'Region, subregion, country or area *': 'Region', common.INDICATOR_COLUMNS[0]: 'Crude Death', })
+    # continent.py works with plain string names
+    input_df['Region'] = input_df['Region'].astype(str)
+    return {'input_df': input_df}
+
+
+def run_continent_statistics(input_df: DataFrame) -> DataFrame:
+    # the per-region statistics continent.py draws its scatterplots from
+    return common.group_statistics(input_df=input_df, by='Region', value_column='Crude Death')[
+        ['Region', 'mean', 'std']].rename(columns={'Region': 'country'}).replace(
+        {'country': continent.TO_REPLACE})
+
+
+def setup_crude_death(folder: str, scale: int) -> dict:
+    input_df = make_wpp_frame(countries=5 * scale, years=YEARS)
+    crude_df = input_df[input_df['Type'].isin({'Country/Area', 'World'})][
+        ['Year', 'Region, subregion, country or area *', common.INDICATOR_COLUMNS[0]]].rename(
+        columns={'Region, subregion, country or area *': 'Country', common.INDICATOR_COLUMNS[0]: 'Crude Death', })
+    crude_df['Country'] = crude_df['Country'].astype(str)
+    return {'crude_df': crude_df, 'folder': folder + '/'}
+
+
+def run_crude_death(crude_df: DataFrame, folder: str) -> list:
+    # the per-country loop: split the frame, pair each country with WORLD and render every plot
+    country_dfs = dict(list(crude_df.groupby(by='Country', sort=False)))
+    world_df = country_dfs['WORLD']
+    jobs = [{'fname': '{}{}-vs-World.png'.format(folder, country), 'graph_df': concat([world_df, country_df])}
+            for country, country_df in country_dfs.items() if country != 'WORLD']
+    return render_jobs(function=crude_death.plot_country_vs_world, jobs=jobs)
+
+
+def measure(function: Callable, inputs: dict, repeat: int) -> dict:
+    # time the runs without tracemalloc, which slows allocation down, and then take one traced run for the peak
+    seconds = list()
+    for _ in range(repeat):
+        time_start = perf_counter()
+        function(**inputs)
+        seconds.append(perf_counter() - time_start)
+        close('all')
+    start()
+    try:
+        function(**inputs)
+        _, peak = get_traced_memory()
+    finally:
+        stop()
+        close('all')
+    return {'peak_bytes': peak, 'repeat': repeat, 'seconds': median(seconds), 'seconds_min': min(seconds)}
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list[str]:
+    regressions = list()
+    for name, result in results.items():
+        if name not in baseline.keys():
+            LOGGER.info('%s has no baseline yet', name)
+            continue
+        if baseline[name].get('scale', 1) != result['scale']:
+            LOGGER.info('%s has no baseline at scale %d', name, result['scale'])
+            continue
+        for key in ['peak_bytes', 'seconds']:
+            ratio = result[key] / baseline[name][key] if baseline[name][key] else 1.0
+            LOGGER.info('%s %s: %0.4g against %0.4g (%+0.1f%%)', name, key, result[key], baseline[name][key],
+                        100 * (ratio - 1))
+            if ratio > 1 + threshold:
+                regressions.append('{} {} is {:0.1f}% over its baseline'.format(name, key, 100 * (ratio - 1)))
+    return regressions
+
+
+BASELINE_FILE = './benchmark/baseline.json'
+BENCHMARKS = {
+    'continent_statistics': (setup_continent_statistics, run_continent_statistics),
+    'crude_death_countries': (setup_crude_death, run_crude_death),
+    'label_point': (setup_label_point, run_label_point),
+    'make_plots': (setup_make_plots, main.make_plots),
+    'read_cdc': (setup_read_cdc, run_read_cdc),
+    'read_excel_dataframe': (setup_read_excel_dataframe, common.read_excel_dataframe),
+    'reshape': (setup_reshape, common.reshape),
+    'reshape_concat': (setup_reshape, reshape_concat),
+    'reshape_view': (setup_reshape, run_reshape_view),
+}
+NAN_RATE = 0.01
+RESULTS_FILE = './benchmark/results.json'
+SEED = 2022
+SENTINEL_RATE = 0.02
+THRESHOLD = 0.2
+YEARS = range(1950, 2022)
+
+if __name__ == '__main__':
+    TIME_START = now()
+    LOGGER = getLogger(__name__, )
+    basicConfig(format='%(asctime)s : %(name)s : %(levelname)s : %(message)s', level=INFO, )
+    LOGGER.info('started')
+
+    parser = ArgumentParser(description=__doc__.strip())
+    parser.add_argument('benchmarks', metavar='benchmark', nargs='*',
+                        help='benchmarks to run (default: all of them)')
+    parser.add_argument('--repeat', default=5, type=int, help='timed runs per benchmark')
+    parser.add_argument('--scale', default=1, type=int, help='multiply the size of every input by this much')
+    parser.add_argument('--save-baseline', action='store_true', help='store these results as the new baseline')
+    parser.add_argument('--threshold', default=THRESHOLD, type=float,
+                        help='fraction over the baseline that counts as a regression')
+    arguments = parser.parse_args()
+    for unknown in sorted(set(arguments.benchmarks) - set(BENCHMARKS.keys())):
+        parser.error('unknown benchmark {} (choose from {})'.format(unknown, ', '.join(sorted(BENCHMARKS.keys()))))
+    use('Agg')
+
+    benchmark_results = dict()
+    with TemporaryDirectory() as temporary_folder:
+        for benchmark in arguments.benchmarks or sorted(BENCHMARKS.keys()):
+            setup, run = BENCHMARKS[benchmark]
+            benchmark_results[benchmark] = measure(function=run, inputs=setup(temporary_folder, arguments.scale),
+                                                   repeat=arguments.repeat) | {'scale': arguments.scale}
+            LOGGER.info('%s: %0.4fs median, %d bytes peak', benchmark, benchmark_results[benchmark]['seconds'],
+                        benchmark_results[benchmark]['peak_bytes'])
+
+    Path(RESULTS_FILE).parent.mkdir(parents=True, exist_ok=True)
+    with open(file=RESULTS_FILE, mode='w') as results_fp:
+        dump(fp=results_fp, indent=2, obj=benchmark_results, sort_keys=True)
+    LOGGER.info('wrote %d results to %s', len(benchmark_results), RESULTS_FILE)
+
+    exit_code = 0
+    if arguments.save_baseline:
+        stored = dict()
+        if Path(BASELINE_FILE).exists():
+            with open(file=BASELINE_FILE, mode='r') as baseline_fp:
+                stored = load(fp=baseline_fp)
+        with open(file=BASELINE_FILE, mode='w') as baseline_fp:
+            dump(fp=baseline_fp, indent=2, obj=stored | benchmark_results, sort_keys=True)
+        LOGGER.info('saved %d results as the baseline in %s', len(benchmark_results), BASELINE_FILE)
+    elif Path(BASELINE_FILE).exists():
+        with open(file=BASELINE_FILE, mode='r') as baseline_fp:
+            found = compare(baseline=load(fp=baseline_fp), results=benchmark_results, threshold=arguments.threshold)
+        for regression in found:
+            LOGGER.warning(regression)
+        exit_code = 1 if found else 0
+    else:
+        LOGGER.info('no baseline in %s; run with --save-baseline to store one', BASELINE_FILE)
+
+    LOGGER.info('total time: {:5.2f}s'.format((now() - TIME_START).total_seconds()))
+    exit(exit_code)
@@ -0,0 +1,67 @@
+"""
+Dense cause x year array of CDC WONDER counts, with every missing cause and year filled in by policy
+"""
+from typing import Iterable
+from typing import Optional
+
+from numpy import arange
+from numpy import argsort
+from numpy import array
+from numpy import full
+from numpy import nan
+from numpy import ndarray
+from numpy import sort
+from pandas import DataFrame
+from pandas import factorize
+
+
+class CauseCube:
+    def __init__(self, input_df: DataFrame, code_column: str, name_column: str, year_column: str = 'Year',
+                 value_column: str = 'Deaths', fill: str = 'zero'):
+        rows_df = input_df.dropna(subset=[code_column, year_column])
+        # causes keep the order they first appear in, which is the order WONDER lists them
+        positions, codes = factorize(rows_df[code_column], sort=False)
+        years = rows_df[year_column].astype(int).to_numpy()
+        self.code_column = code_column
+        self.codes = array(codes, dtype=object)
+        self.name_column = name_column
+        self.value_column = value_column
+        self.year_column = year_column
+        self.years = arange(years.min(), years.max() + 1) if len(years) else arange(0)
+        # a cause with no row for a year gets the fill value: zero where no row means no deaths, NaN for a gap
+        self.values = full(fill_value=FILLS[fill], shape=(len(codes), len(self.years)))
+        self.values[positions, years - self.years[0]] = rows_df[value_column].to_numpy(dtype=float, na_value=nan)
+        first_rows = full(fill_value=-1, shape=len(codes))
+        first_rows[positions[::-1]] = arange(len(positions))[::-1]
+        self.names = rows_df[name_column].to_numpy(dtype=object)[first_rows]
+        self.code_index = {code: position for position, code in enumerate(self.codes)}
+        self.name_index = {name: position for position, name in enumerate(self.names)}
+
+    def positions(self, causes: Iterable[str]) -> ndarray:
+        # causes may be codes or names; the ones the data does not have are left out, in cube order
+        return sort(array([self.code_index.get(cause, self.name_index.get(cause)) for cause in causes if
+                           cause in self.code_index.keys() or cause in self.name_index.keys()], dtype=int))
+
+    def year_values(self, year: Optional[int] = None) -> ndarray:
+        # one column of the cube, the last year unless asked otherwise
+        return self.values[:, -1 if year is None else int(year) - self.years[0]]
+
+    def rank(self, year: Optional[int] = None, among: Optional[ndarray] = None) -> ndarray:
+        # positions from the most to the fewest deaths in the year; ties keep their cube order
+        among = arange(len(self.codes)) if among is None else among
+        return among[argsort(-self.year_values(year=year)[among], kind='stable')]
+
+    def top(self, count: int, year: Optional[int] = None, among: Optional[ndarray] = None) -> ndarray:
+        return self.rank(among=among, year=year)[:count]
+
+    def frame(self, positions: ndarray) -> DataFrame:
+        # long format for plotting, one row per cause and year
+        return DataFrame(data={
+            self.year_column: list(self.years) * len(positions),
+            self.name_column: self.names[positions].repeat(len(self.years)),
+            self.code_column: self.codes[positions].repeat(len(self.years)),
+            self.value_column: self.values[positions].ravel(),
+        })
+
+
+FILLS = {'nan': nan, 'zero': 0.0}
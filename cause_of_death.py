@@ -10,11 +10,18 @@ from pandas import DataFrame
 from pandas import read_csv
 from plotly.express import line
 
+from common import dataset_key
+from common import remember_dataset
 from common import reshape
+from plotly_html import write_page
+from tracing import span
+from tracing import traced
 
 
+@traced(category='load')
 def read_csv_dataframe(filepath_or_buffer: str) -> DataFrame:
-    result_df = read_csv(filepath_or_buffer=filepath_or_buffer)
+    result_df = remember_dataset(key=dataset_key(io=filepath_or_buffer, reader='read_csv'),
+                                 loader=lambda: read_csv(filepath_or_buffer=filepath_or_buffer))
     return result_df
 
 
@@ -66,34 +73,35 @@ if __name__ == '__main__':
     LOGGER.info('loaded %d rows from %s', len(df), input_file)
 
     # extract the data for just the USA, make the year the index
-    usa_df = df[df['Code'] == 'USA'].drop(columns=['Entity', 'Code'])
-    usa_df = usa_df.sort_values(by=['Year']).set_index(keys=['Year'])
-    # clean up the cause names
-    for column in list(usa_df):
-        new_column = column.replace(' - Sex: Both - Age: All Ages (Number)', '')
-        new_column = new_column.replace('Deaths - ', '')
-        usa_df.rename(inplace=True, columns={column: new_column})
+    with span(name='usa causes', category='compute'):
+        usa_df = df[df['Code'] == 'USA'].drop(columns=['Entity', 'Code'])
+        usa_df = usa_df.sort_values(by=['Year']).set_index(keys=['Year'])
+        # clean up the cause names
+        for column in list(usa_df):
+            new_column = column.replace(' - Sex: Both - Age: All Ages (Number)', '')
+            new_column = new_column.replace('Deaths - ', '')
+            usa_df.rename(inplace=True, columns={column: new_column})
 
-    usa_df = df[df['Code'] == 'USA'].drop(columns=['Entity', 'Code'])
-    usa_df = usa_df.sort_values(by=['Year']).fillna(value=0)
-    for column in list(usa_df):
-        new_column = column.replace(' - Sex: Both - Age: All Ages (Number)', '')
-        new_column = new_column.replace('Deaths - ', '')
-        usa_df.rename(inplace=True, columns={column: new_column})
-    usa_df.rename(inplace=True, columns={'Number of executions (Amnesty International)': 'Executions'})
+        usa_df = df[df['Code'] == 'USA'].drop(columns=['Entity', 'Code'])
+        usa_df = usa_df.sort_values(by=['Year']).fillna(value=0)
+        for column in list(usa_df):
+            new_column = column.replace(' - Sex: Both - Age: All Ages (Number)', '')
+            new_column = new_column.replace('Deaths - ', '')
+            usa_df.rename(inplace=True, columns={column: new_column})
+        usa_df.rename(inplace=True, columns={'Number of executions (Amnesty International)': 'Executions'})
 
-    # let's drop a couple of great big columns before we proceed
-    for column in usa_df.columns:
-        usa_df[column] = usa_df[column].astype(int)
-    # order the columns by their total deaths, most to least
-    total_deaths = {column: usa_df[column].sum() for column in usa_df.columns if column != 'Year'}
-    total_deaths = sorted([(key, value) for key, value in total_deaths.items()], key=lambda x: x[1], reverse=True)
-    total_deaths = [item[0] for item in total_deaths]
-    usa_df = usa_df[['Year'] + total_deaths]
-    usa_lineplot_df = reshape(input_df=usa_df, x_column='Year', y_columns=total_deaths,
-                              y_column_name='Cause', value_column_name='Deaths')
+        # let's drop a couple of great big columns before we proceed
+        for column in usa_df.columns:
+            usa_df[column] = usa_df[column].astype(int)
+        # order the columns by their total deaths, most to least
+        total_deaths = {column: usa_df[column].sum() for column in usa_df.columns if column != 'Year'}
+        total_deaths = sorted([(key, value) for key, value in total_deaths.items()], key=lambda x: x[1], reverse=True)
+        total_deaths = [item[0] for item in total_deaths]
+        usa_df = usa_df[['Year'] + total_deaths]
+        usa_lineplot_df = reshape(input_df=usa_df, x_column='Year', y_columns=total_deaths,
+                                  y_column_name='Cause', value_column_name='Deaths')
 
     figure_plotly = line(data_frame=usa_lineplot_df, x='Year', y='Deaths', color='Cause')
-    figure_plotly.write_html(PLOT_FOLDER + 'usa_cause_of_death_lineplot.html', )
+    write_page(figure=figure_plotly, path=PLOT_FOLDER + 'usa_cause_of_death_lineplot.html')
 
     LOGGER.info('total time: {:5.2f}s'.format((now() - TIME_START).total_seconds()))
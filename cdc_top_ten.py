@@ -7,9 +7,7 @@ from logging import getLogger
 from pathlib import Path
 
 from arrow import now
-from matplotlib.pyplot import close
 from matplotlib.pyplot import savefig
-from matplotlib.pyplot import subplots
 from matplotlib.pyplot import tight_layout
 from pandas import DataFrame
 from pandas import read_csv
@@ -18,7 +16,14 @@ from seaborn import set_style
 from pandas import Series
 from pandas import concat
 
+from figures import release
+from figures import subplots
+from sources import fetch
+from tracing import span
+from tracing import traced
 
+
+@traced(category='load')
 def read_url_csv(url: str) -> DataFrame:
     result_df = read_csv(filepath_or_buffer=url, thousands=',')
     return result_df
@@ -29,11 +34,9 @@ CAUSES = ['Unintentional injuries', 'All causes', 'Alzheimer\'s disease', 'Strok
 COLORMAP = 'tab20'
 DATA_FOLDER = './data/'
 FIGSIZE = (12, 9)
-INPUT_FILE = 'bi63-dtpu-rows.csv'
 OUTPUT_FOLDER = './plot/'
 REFRESH_DATA = False
 SEABORN_STYLE = 'darkgrid'
-URL = 'https://data.cdc.gov/api/views/bi63-dtpu/rows.csv?accessType=DOWNLOAD&bom=true&format=true'
 
 if __name__ == '__main__':
     TIME_START = now()
@@ -45,33 +48,28 @@ if __name__ == '__main__':
         LOGGER.info('creating folder %s if it does not exist', folder)
         Path(folder).mkdir(parents=True, exist_ok=True)
 
-    # if we want to refresh then we need to go get the data from the URL and write a local copy
-    # otherwise read the data from our local copy
-    if REFRESH_DATA:
-        df = read_url_csv(url=URL)
-        output_file = DATA_FOLDER + INPUT_FILE
-        df.to_csv(path_or_buf=output_file, index=False)
-    else:
-        input_file = DATA_FOLDER + INPUT_FILE
-        df = read_url_csv(url=input_file)
+    # read our local copy; with REFRESH_DATA we first revalidate it against the URL, which downloads it again only if
+    # it changed
+    df = read_url_csv(url=str(fetch(name='cdc_top_ten', refresh=REFRESH_DATA)))
 
     us_df = df[df['State'] == 'United States'].copy(deep=True)
     us_df.plot.bar(stacked=True)
 
-    us_df['Deaths'] = us_df['Deaths'].astype(int)
-    us_df['Year'] = us_df['Year'].astype(int)
-    us_df = us_df.drop(columns=['113 Cause Name', 'State', 'Age-adjusted Death Rate'])
-    # figure out the Other deaths
-    all_causes_df = us_df[us_df['Cause Name'] == 'All causes'].drop(columns=['Cause Name'])
-    top_ten_df = us_df[us_df['Cause Name'] != 'All causes']
-    top_ten_df = top_ten_df.drop(columns=['Cause Name']).groupby(by=['Year'], axis=0).sum().reset_index()
-    all_causes_dict = Series(all_causes_df['Deaths'].values, index=all_causes_df['Year'].values).to_dict()
-    top_ten_dict = Series(top_ten_df['Deaths'].values, index=top_ten_df['Year'].values).to_dict()
-    other_dict = {year: all_causes_dict[year] - top_ten_dict[year] for year in all_causes_dict.keys()}
-    other_df = DataFrame(data={'Year': list(other_dict.keys()), 'Cause Name': ['Other'] * len(other_dict),
-                               'Deaths': list(other_dict.values())})
-
-    us_df = concat([us_df[us_df['Cause Name'] != 'All causes'], other_df])
+    with span(name='other deaths', category='compute'):
+        us_df['Deaths'] = us_df['Deaths'].astype(int)
+        us_df['Year'] = us_df['Year'].astype(int)
+        us_df = us_df.drop(columns=['113 Cause Name', 'State', 'Age-adjusted Death Rate'])
+        # figure out the Other deaths
+        all_causes_df = us_df[us_df['Cause Name'] == 'All causes'].drop(columns=['Cause Name'])
+        top_ten_df = us_df[us_df['Cause Name'] != 'All causes']
+        top_ten_df = top_ten_df.drop(columns=['Cause Name']).groupby(by=['Year'], axis=0).sum().reset_index()
+        all_causes_dict = Series(all_causes_df['Deaths'].values, index=all_causes_df['Year'].values).to_dict()
+        top_ten_dict = Series(top_ten_df['Deaths'].values, index=top_ten_df['Year'].values).to_dict()
+        other_dict = {year: all_causes_dict[year] - top_ten_dict[year] for year in all_causes_dict.keys()}
+        other_df = DataFrame(data={'Year': list(other_dict.keys()), 'Cause Name': ['Other'] * len(other_dict),
+                                   'Deaths': list(other_dict.values())})
+
+        us_df = concat([us_df[us_df['Cause Name'] != 'All causes'], other_df])
 
     set_style(style=SEABORN_STYLE)
     figure, axes = subplots(figsize=FIGSIZE)
@@ -83,17 +81,18 @@ if __name__ == '__main__':
     tight_layout()
     fname = '{}{}_stacked_bar.png'.format(OUTPUT_FOLDER, 'us_top_ten')
     savefig(format='png', fname=fname, )
-    close(fig=figure)
+    release(figure=figure)
     LOGGER.info('saved plot in %s', fname)
 
     # now do an area plot
-    plot_df = us_df[['Year', 'Deaths', 'Cause Name']].pivot(index='Year', values='Deaths', columns='Cause Name')
-    # we need to put the columns in a particular order to get a nice-looking plot
-    totals = {column: plot_df[column].sum() for column in plot_df.columns.tolist()}
-    totals = sorted([(key, value) for key, value in totals.items()], key=lambda x: x[1], reverse=True)
-    order = [item[0] for item in totals]
-    order = [item for item in order if item != 'Other'] + ['Other']
-    plot_df = plot_df[order]
+    with span(name='order causes', category='compute'):
+        plot_df = us_df[['Year', 'Deaths', 'Cause Name']].pivot(index='Year', values='Deaths', columns='Cause Name')
+        # we need to put the columns in a particular order to get a nice-looking plot
+        totals = {column: plot_df[column].sum() for column in plot_df.columns.tolist()}
+        totals = sorted([(key, value) for key, value in totals.items()], key=lambda x: x[1], reverse=True)
+        order = [item[0] for item in totals]
+        order = [item for item in order if item != 'Other'] + ['Other']
+        plot_df = plot_df[order]
     figure_area, axes_area = subplots(figsize=FIGSIZE)
     # we need to supply a colormap to keep from repeating colors
     plot_area_result = plot_df.plot.area(ax=axes_area, colormap=COLORMAP)
@@ -102,7 +101,7 @@ if __name__ == '__main__':
     tight_layout()
     fname_area = '{}{}_stacked_area.png'.format(OUTPUT_FOLDER, 'us_top_ten')
     savefig(format='png', fname=fname_area, )
-    close(fig=figure_area)
+    release(figure=figure_area)
     LOGGER.info('saved plot in %s', fname_area)
 
     # now add a pie chart of the last year
@@ -112,7 +111,7 @@ if __name__ == '__main__':
     tight_layout()
     fname_pie = '{}{}_pie_{}.png'.format(OUTPUT_FOLDER, 'us_top_ten', year)
     savefig(format='png', fname=fname_pie, )
-    close(fig=figure_pie)
+    release(figure=figure_pie)
     LOGGER.info('saved plot in %s', fname_pie)
 
     LOGGER.info('total time: {:5.2f}s'.format((now() - TIME_START).total_seconds()))
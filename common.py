@@ -1,39 +1,341 @@
+from hashlib import sha256
+from logging import getLogger
+from operator import itemgetter
+from pathlib import Path
+from typing import Callable
+from typing import Iterator
 from typing import Optional
 from typing import Union
 
 from matplotlib.axes import Axes
+from numpy import add
+from numpy import diff
+from numpy import divide
+from numpy import dtype as dtype_
+from numpy import flatnonzero
+from numpy import floor
+from numpy import full
+from numpy import lexsort
+from numpy import min_scalar_type
+from numpy import nan
+from numpy import ndarray
+from numpy import r_
+from numpy import repeat
+from numpy import sqrt
+from openpyxl import load_workbook
+from pandas import Categorical
 from pandas import DataFrame
+from pandas import Index
 from pandas import Series
 from pandas import concat
+from pandas import factorize
 from pandas import read_excel
+from pandas import read_parquet
+from pandas import to_numeric
 
+from labels import draw_labels
+from tracing import traced
 
-# https://stackoverflow.com/questions/46027653/adding-labels-in-x-y-scatter-plot-with-seaborn
+
+@traced(category='compute')
+def group_statistics(input_df: DataFrame, by: str, value_column: str,
+                     percentiles: tuple[int, ...] = (25, 50, 75)) -> DataFrame:
+    # sort once by group and then by value; every statistic is then a slice or a reduceat over the sorted values
+    # rows with no group are left out, as groupby does, as well as rows with no value
+    work_df = input_df[[by, value_column]].dropna(subset=[by, value_column])
+    codes, uniques = factorize(work_df[by], sort=False)
+    values = work_df[value_column].to_numpy(dtype=float)
+    columns = [by, 'count', 'sum', 'mean', 'std', 'min', 'max', 'range'] + ['p{}'.format(item) for item in percentiles]
+    if len(values) == 0:
+        return DataFrame(columns=columns)
+    order = lexsort((values, codes))
+    codes, values = codes[order], values[order]
+    starts = flatnonzero(r_[True, codes[1:] != codes[:-1]])
+    counts = diff(r_[starts, len(values)])
+    ends = starts + counts - 1
+    sums = add.reduceat(values, starts)
+    means = sums / counts
+    deviations = values - repeat(means, counts)
+    squares = add.reduceat(deviations * deviations, starts)
+    result = {
+        by: uniques.take(codes[starts]),
+        'count': counts,
+        'sum': sums,
+        'mean': means,
+        # sample standard deviation, like pandas; a single value has no spread
+        'std': sqrt(divide(squares, counts - 1, out=full(len(counts), nan), where=counts > 1)),
+        'min': values[starts],
+        'max': values[ends],
+        'range': values[ends] - values[starts],
+    }
+    for percentile in percentiles:
+        # linear interpolation between the closest ranks, the same as numpy and pandas
+        positions = starts + (counts - 1) * percentile / 100
+        lower = floor(positions).astype(int)
+        upper = (lower + 1).clip(max=ends)
+        result['p{}'.format(percentile)] = values[lower] + (positions - lower) * (values[upper] - values[lower])
+    return DataFrame(data=result, columns=columns)
+
+
+@traced(category='plot')
 def label_point(x: Series, y: Series, val: Series, ax: Axes):
-    rows_df = concat({'x': x, 'y': y, 'value': val}, axis=1)
-    for i, point in rows_df.iterrows():
-        ax.text(point['x'] + 0.03, point['y'] + 0.01, str(point['value']), fontsize='x-small')
-    return
+    # each label goes next to its point where it covers no other label or point, and they all draw as one artist
+    draw_labels(ax=ax, texts=[str(item) for item in val], x=x.to_numpy(dtype=float, na_value=nan),
+                y=y.to_numpy(dtype=float, na_value=nan))
+
+
+def file_hash(path: str) -> str:
+    digest = sha256()
+    with open(file=path, mode='rb') as input_fp:
+        for chunk in iter(lambda: input_fp.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def typed_frame(input_df: DataFrame) -> DataFrame:
+    # Parquet needs one type per column; the mixed columns in the WPP sheets are numbers with '...' placeholders
+    for column in input_df.columns:
+        if input_df[column].dtype == object:
+            values = input_df[column].replace('...', nan)
+            try:
+                input_df[column] = to_numeric(values)
+            except (TypeError, ValueError):
+                input_df[column] = values.where(values.isna(), values.astype(str))
+    return input_df
+
+
+def apply_schema(input_df: DataFrame, float64: bool = False) -> DataFrame:
+    memory_before = input_df.memory_usage(deep=True).sum()
+    for column in input_df.columns:
+        if column in SCHEMA.keys():
+            dtype = 'float64' if float64 and SCHEMA[column] == 'float32' else SCHEMA[column]
+            if dtype == 'category':
+                input_df[column] = input_df[column].astype(dtype)
+            else:
+                input_df[column] = to_numeric(input_df[column].replace('...', nan)).astype(dtype)
+    memory_after = input_df.memory_usage(deep=True).sum()
+    if memory_after < memory_before:
+        LOGGER.info('schema reduced memory from %d to %d bytes (%0.1f%% saved)', memory_before, memory_after,
+                    100 * (1 - memory_after / memory_before))
+    return input_df
+
+
+def cache_path(io: str, source_hash: str, header: int, usecols: Optional[Union[list, int]], float64: bool,
+               filters: Optional[list] = None) -> Path:
+    # a filtered read is its own dataset; the unfiltered key stays as it was so existing caches still match
+    key = (source_hash, header, usecols, float64) + ((filters,) if filters else ())
+    key_hash = sha256(repr(key).encode('utf-8')).hexdigest()
+    return Path(CACHE_FOLDER) / '{}-{}-{}.parquet'.format(Path(io).stem, source_hash[:16], key_hash[:16])
+
+
+def read_typed_excel(io: str, header: int, usecols: Optional[Union[list, int]], float64: bool) -> DataFrame:
+    result_df = read_excel(engine='openpyxl', header=header, io=io, na_values=['...'], usecols=usecols)
+    return apply_schema(input_df=typed_frame(input_df=result_df), float64=float64)
+
+
+def dataset_key(io: str, **kwargs) -> tuple:
+    # the same file read with the same arguments is the same dataset, whichever script asks for it
+    source = str(Path(io).resolve()) if Path(io).is_file() else io
+    return (source,) + tuple(sorted((key, repr(value)) for key, value in kwargs.items()))
+
+
+def remember_dataset(key: tuple, loader: Callable[[], DataFrame]) -> DataFrame:
+    # under copy-on-write a shallow copy is enough to keep one caller's edits out of everyone else's data
+    if key not in DATASETS.keys():
+        DATASETS[key] = loader()
+    else:
+        LOGGER.info('using the dataset already loaded from %s', key[0])
+    return DATASETS[key].copy(deep=False)
+
+
+def load_excel_dataset(io: str, header: int) -> DataFrame:
+    # keep the full-precision sheet; float32 readers get their copy from apply_schema
+    return remember_dataset(key=dataset_key(io=io, header=header), loader=lambda: read_excel_dataframe(
+        float64=True, header=header, io=io, usecols=None))
+
 
+def select_dataset(input_df: DataFrame, usecols: Optional[list], float64: bool) -> DataFrame:
+    result_df = input_df[[column for column in input_df.columns if usecols is None or column in usecols]]
+    for column in result_df.columns:
+        if result_df[column].dtype == 'category':
+            result_df[column] = result_df[column].cat.remove_unused_categories()
+    return apply_schema(input_df=result_df, float64=float64)
 
-def read_excel_dataframe(io: str, header: int, usecols: Optional[Union[list, int]]) -> DataFrame:
-    result_df = read_excel(engine='openpyxl', header=header, io=io, usecols=usecols)
+
+@traced(category='load')
+def read_excel_dataframe(io: str, header: int, usecols: Optional[Union[list, int]],
+                         use_cache: bool = True, float64: bool = False) -> DataFrame:
+    key = dataset_key(io=io, header=header)
+    if key in DATASETS.keys() and not isinstance(usecols, int):
+        LOGGER.info('using the dataset already loaded from %s', key[0])
+        return select_dataset(input_df=DATASETS[key], usecols=usecols, float64=float64)
+    # we can only cache local files; URLs go straight to openpyxl
+    if not use_cache or not Path(io).is_file():
+        return read_typed_excel(io=io, header=header, usecols=usecols, float64=float64)
+    source_hash = file_hash(path=io)
+    cache_file = cache_path(io=io, source_hash=source_hash, header=header, usecols=usecols, float64=float64)
+    if cache_file.exists():
+        # Parquet does not keep every categorical, so we put the schema back on
+        result_df = apply_schema(input_df=read_parquet(path=cache_file), float64=float64)
+        LOGGER.info('loaded %d rows from cache %s', len(result_df), cache_file)
+        return result_df
+    result_df = read_typed_excel(io=io, header=header, usecols=usecols, float64=float64)
+    write_cache(cache_file=cache_file, io=io, result_df=result_df, source_hash=source_hash)
+    return result_df
+
+
+def write_cache(cache_file: Path, io: str, result_df: DataFrame, source_hash: str) -> None:
+    cache_file.parent.mkdir(parents=True, exist_ok=True)
+    # a new source hash means the workbook changed, so the older copies are stale
+    for stale_file in cache_file.parent.glob('{}-*.parquet'.format(Path(io).stem)):
+        if not stale_file.name.startswith('{}-{}-'.format(Path(io).stem, source_hash[:16])):
+            LOGGER.info('removing stale cache %s', stale_file)
+            stale_file.unlink()
+    result_df.to_parquet(path=cache_file)
+    LOGGER.info('wrote %d rows to cache %s', len(result_df), cache_file)
+
+
+@traced(category='load')
+def stream_excel_dataframe(io: str, header: int, usecols: Optional[list] = None, types: Optional[set] = None,
+                           location_codes: Optional[set] = None, parent_codes: Optional[set] = None,
+                           years: Optional[tuple[int, int]] = None, float64: bool = False,
+                           use_cache: bool = True) -> DataFrame:
+    key = dataset_key(io=io, header=header)
+    if key in DATASETS.keys():
+        LOGGER.info('using the dataset already loaded from %s', key[0])
+        input_df = DATASETS[key]
+        mask = Series(index=input_df.index, data=True)
+        if types is not None:
+            mask &= input_df['Type'].isin(types)
+        if location_codes is not None:
+            mask &= input_df['Location code'].isin(location_codes)
+        if parent_codes is not None:
+            mask &= input_df['Parent code'].isin(parent_codes)
+        if years is not None:
+            mask &= input_df['Year'].between(years[0], years[1]).fillna(False)
+        return select_dataset(input_df=input_df[mask].reset_index(drop=True), usecols=usecols, float64=float64)
+    # the filtered rows are cached like a whole sheet, keyed by the filters as well; the sets are sorted so the key
+    # does not change with the string hash seed
+    cache_file, source_hash = None, None
+    if use_cache and Path(io).is_file():
+        filters = [(name, None if value is None else sorted(value)) for name, value in
+                   [('location_codes', location_codes), ('parent_codes', parent_codes), ('types', types),
+                    ('years', years)]]
+        source_hash = file_hash(path=io)
+        cache_file = cache_path(filters=filters, float64=float64, header=header, io=io, source_hash=source_hash,
+                                usecols=usecols)
+        if cache_file.exists():
+            result_df = apply_schema(input_df=read_parquet(path=cache_file), float64=float64)
+            LOGGER.info('loaded %d rows from cache %s', len(result_df), cache_file)
+            return result_df
+    # walk the sheet once and keep only the rows and columns we want, so everything else never becomes a DataFrame
+    workbook = load_workbook(data_only=True, filename=io, read_only=True)
+    try:
+        rows = workbook.active.iter_rows(min_row=header + 1, values_only=True)
+        header_row = next(rows)
+        # openpyxl leaves trailing empty cells off a row, so short rows get padded back out to the header
+        rows = (row if len(row) >= len(header_row) else row + (None,) * (len(header_row) - len(row)) for row in rows)
+        columns = [column for column in header_row if usecols is None or column in usecols]
+        project = itemgetter(*[header_row.index(column) for column in columns])
+        predicates = []
+        if types is not None:
+            predicates.append((header_row.index('Type'), lambda value: value in types))
+        if location_codes is not None:
+            predicates.append((header_row.index('Location code'), lambda value: value in location_codes))
+        if parent_codes is not None:
+            predicates.append((header_row.index('Parent code'), lambda value: value in parent_codes))
+        if years is not None:
+            predicates.append((header_row.index('Year'),
+                               lambda value: value is not None and years[0] <= value <= years[1]))
+        data = [project(row) for row in rows if all(predicate(row[index]) for index, predicate in predicates)]
+    finally:
+        workbook.close()
+    if len(columns) == 1:
+        data = [(value,) for value in data]
+    result_df = apply_schema(input_df=typed_frame(input_df=DataFrame(columns=columns, data=data)), float64=float64)
+    if cache_file is not None:
+        write_cache(cache_file=cache_file, io=io, result_df=result_df, source_hash=source_hash)
     return result_df
 
 
+def repeat_column(column: Series, times: int) -> Series:
+    # concat copies the column straight into the result, where taking rows by position would first need an
+    # indexer as long as the result
+    return concat([column] * times, ignore_index=True) if times else column.iloc[:0].reset_index(drop=True)
+
+
+def repeat_categories(codes: ndarray, names: Index, rows: int) -> Categorical:
+    # repeat the codes at the width the categorical keeps them in rather than as 64-bit integers
+    return Categorical.from_codes(categories=names, codes=repeat(codes.astype(min_scalar_type(-len(names))), rows))
+
+
+@traced(category='compute')
 def reshape(input_df: DataFrame, x_column: str, y_columns: list[str], y_column_name: str,
             value_column_name: str) -> DataFrame:
-    def reshape_helper(input_df_: DataFrame, y_column: str, y_column_name_: str, value_column_name_: str) -> DataFrame:
-        output_df = input_df_.rename(columns={y_column: value_column_name_})
-        output_df[y_column_name_] = y_column
-        return output_df
-
-    result_df = concat([reshape_helper(input_df_=input_df[[x_column, y_column]], y_column=y_column,
-                                       y_column_name_=y_column_name, value_column_name_=value_column_name) for y_column
-                        in y_columns], ignore_index=True)
-    return result_df
+    # one block of rows per y column, in order: the x values tile, the y names repeat as category codes and the
+    # values come from one ravel of the value block, so each output column is allocated once
+    codes, names = factorize(Index(y_columns), sort=False)
+    values_df = input_df[y_columns]
+    if all(isinstance(dtype, dtype_) for dtype in values_df.dtypes):
+        # the value block is usually column-major already, and then this ravel is a view rather than a copy; a view
+        # of the input's own block comes back read-only, and the result gets its own copy of that once
+        values = values_df.to_numpy().ravel(order='F')
+        values = values if values.flags.writeable else values.copy()
+    else:
+        # extension dtypes keep their own arrays, which one concat joins without going through object
+        values = concat([values_df[column] for column in y_columns], ignore_index=True).array
+    # the columns are new already, so the frame can take them as they are
+    return DataFrame(copy=False, data={
+        x_column: repeat_column(column=input_df[x_column], times=len(y_columns)),
+        value_column_name: values,
+        y_column_name: repeat_categories(codes=codes, names=names, rows=len(input_df)),
+    })
+
+
+class LongView:
+    # the long frame that reshape would build, left unbuilt: blocks share the wide frame's data and a single
+    # column is built only when it is asked for
+    def __init__(self, input_df: DataFrame, x_column: str, y_columns: list[str], y_column_name: str,
+                 value_column_name: str):
+        self.input_df = input_df
+        self.value_column_name = value_column_name
+        self.x_column = x_column
+        self.y_column_name = y_column_name
+        self.y_columns = list(y_columns)
+        self.columns = [x_column, value_column_name, y_column_name]
+
+    def __len__(self) -> int:
+        return len(self.input_df) * len(self.y_columns)
+
+    def blocks(self) -> Iterator[tuple[str, DataFrame]]:
+        # each block is the x column and one y column under the long names; with copy-on-write nothing is copied
+        for y_column in self.y_columns:
+            yield y_column, self.input_df[[self.x_column, y_column]].rename(
+                columns={y_column: self.value_column_name})
+
+    def __getitem__(self, column: str) -> Series:
+        if column == self.value_column_name:
+            return concat([self.input_df[y_column] for y_column in self.y_columns], ignore_index=True).rename(
+                column)
+        if column == self.x_column:
+            return repeat_column(column=self.input_df[column], times=len(self.y_columns))
+        if column == self.y_column_name:
+            codes, names = factorize(Index(self.y_columns), sort=False)
+            return Series(data=repeat_categories(codes=codes, names=names, rows=len(self.input_df)), name=column)
+        raise KeyError(column)
+
+    def to_frame(self) -> DataFrame:
+        return reshape(input_df=self.input_df, value_column_name=self.value_column_name, x_column=self.x_column,
+                       y_column_name=self.y_column_name, y_columns=self.y_columns)
+
+
+def reshape_view(input_df: DataFrame, x_column: str, y_columns: list[str], y_column_name: str,
+                 value_column_name: str) -> LongView:
+    return LongView(input_df=input_df, value_column_name=value_column_name, x_column=x_column,
+                    y_column_name=y_column_name, y_columns=y_columns)
 
 
+CACHE_FOLDER = './data/cache/'
 COLUMNS = ['Index', 'Variant', 'Region, subregion, country or area *', 'Notes',
            'Location code', 'ISO3 Alpha-code', 'ISO2 Alpha-code', 'SDMX code**',
            'Type', 'Parent code', 'Year',
@@ -88,3 +390,22 @@ COLUMNS = ['Index', 'Variant', 'Region, subregion, country or area *', 'Notes',
            'Female Mortality between Age 15 and 60 (deaths under age 60 per 1,000 females alive at age 15)',
            'Net Number of Migrants (thousands)',
            'Net Migration Rate (per 1,000 population)']
+# every dataset loaded in this process, keyed by dataset_key; the pipeline fills it before it forks its stages
+DATASETS = dict()
+# the indicators are every column after Year
+INDICATOR_COLUMNS = COLUMNS[COLUMNS.index('Year') + 1:]
+LOGGER = getLogger(__name__, )
+# labels are categorical, codes are narrow integers, and indicators are float32 unless we ask for float64
+SCHEMA = {
+    'Index': 'Int32',
+    'Variant': 'category',
+    'Region, subregion, country or area *': 'category',
+    'Notes': 'category',
+    'Location code': 'Int32',
+    'ISO3 Alpha-code': 'category',
+    'ISO2 Alpha-code': 'category',
+    'SDMX code**': 'Int32',
+    'Type': 'category',
+    'Parent code': 'Int32',
+    'Year': 'Int16',
+} | {column: 'float32' for column in INDICATOR_COLUMNS}
@@ -8,10 +8,8 @@ from logging import getLogger
 from pathlib import Path
 
 from arrow import now
-from matplotlib.pyplot import close
 from matplotlib.pyplot import gca
 from matplotlib.pyplot import savefig
-from matplotlib.pyplot import subplots
 from matplotlib.pyplot import tight_layout
 from pandas import DataFrame
 from seaborn import lineplot
@@ -19,8 +17,32 @@ from seaborn import lmplot
 from seaborn import set_style
 
 from common import COLUMNS
+from common import group_statistics
 from common import label_point
 from common import read_excel_dataframe
+from figures import release
+from figures import subplots
+from hierarchy import LocationHierarchy
+from render import render_changed_jobs
+from sources import fetch
+from tracing import span
+
+
+def plot_lineplot(plot_df: DataFrame, fname: str, hue: str) -> None:
+    figure_lineplot, axes_lineplot = subplots()
+    lineplot(ax=axes_lineplot, data=plot_df, x='Year', y='Crude Death', hue=hue)
+    savefig(format='png', fname=fname, )
+    release(figure=figure_lineplot)
+
+
+def plot_scatterplot(plot_df: DataFrame, fname: str, x: str, y: str) -> None:
+    result_scatterplot = lmplot(data=plot_df, x=x, y=y, hue='hue', legend=False, aspect=2, )
+    # the labels are placed for the final size of the axes, so the layout comes first
+    tight_layout()
+    label_point(x=plot_df[x], y=plot_df[y], val=plot_df['country'], ax=gca())
+    savefig(fname=fname, format='png')
+    release(figure=result_scatterplot.figure)
+
 
 CONTINENT_DATA = {
     'africa': 903,
@@ -31,7 +53,6 @@ CONTINENT_DATA = {
     'oceania': 909,
 }
 DATA_FOLDER = './data/'
-INPUT_FILE = 'WPP2022_GEN_F01_DEMOGRAPHIC_INDICATORS_COMPACT_REV1.xlsx'
 OUTPUT_FOLDER = './plot_crude/'
 SAVE_WORLD_DATA = False
 SEABORN_STYLE = 'darkgrid'
@@ -49,11 +70,13 @@ if __name__ == '__main__':
         LOGGER.info('creating folder %s if it does not exist', folder)
         Path(folder).mkdir(parents=True, exist_ok=True)
 
-    data_file = DATA_FOLDER + INPUT_FILE
+    data_file = str(fetch(name='wpp'))
     df = read_excel_dataframe(io=data_file, header=16, usecols=COLUMNS)
     LOGGER.info('loaded %d rows from %s', len(df), data_file)
-    df = df.drop(columns=['Index'])
-    df = df[df['Region, subregion, country or area *'] != 'Holy See']
+    with span(name='drop Holy See and build the hierarchy', category='filter'):
+        df = df.drop(columns=['Index'])
+        df = df[df['Region, subregion, country or area *'] != 'Holy See']
+        hierarchy = LocationHierarchy(input_df=df)
 
     columns_regions = ['Year', 'Region, subregion, country or area *',
                        'Natural Change, Births minus Deaths (thousands)',
@@ -63,80 +86,62 @@ if __name__ == '__main__':
         'Crude Death Rate (deaths per 1,000 population)': 'Crude Death',
         'Region, subregion, country or area *': 'Region',
     })
-    regions_df['Region'] = regions_df['Region'].replace({'LATIN AMERICA AND THE CARIBBEAN': 'LATIN AMERICA'})
+    # the names come back categorical; we want plain strings for the legends
+    regions_df['Region'] = regions_df['Region'].astype(str).replace(
+        {'LATIN AMERICA AND THE CARIBBEAN': 'LATIN AMERICA'})
 
     set_style(style=SEABORN_STYLE)
-    figure_regions, axes_regions = subplots()
-    result_regions = lineplot(ax=axes_regions, data=regions_df, x='Year', y='Crude Death', hue='Region')
-    fname_regions = '{}{}_lineplot.png'.format(OUTPUT_FOLDER, 'region_crude_death')
-    LOGGER.info('writing to %s', fname_regions)
-    savefig(format='png', fname=fname_regions, )
-    close(fig=figure_regions)
-
+    lineplot_jobs = [{'fname': '{}{}_lineplot.png'.format(OUTPUT_FOLDER, 'region_crude_death'), 'hue': 'Region',
+                      'plot_df': regions_df[['Year', 'Region', 'Crude Death']], }]
+    scatterplot_jobs = list()
     for continent, location_code in CONTINENT_DATA.items():
-        region_codes = df[df['Parent code'] == location_code]['Location code'].unique()
-        country_codes = df[df['Parent code'].isin(region_codes)][
-            'Location code'].unique() if continent != 'north america' else region_codes
-
-        regions_df = df[(df['Location code'].isin(region_codes)) | (df['Location code'] == location_code)][
-            ['Year', 'Region, subregion, country or area *',
-             'Crude Death Rate (deaths per 1,000 population)',
-             ]].rename(columns={'Crude Death Rate (deaths per 1,000 population)': 'Crude Death',
-                                'Region, subregion, country or area *': 'Region', })
-
-        figure_lineplot, axes_lineplot = subplots()
-        result_lineplot = lineplot(data=regions_df, x='Year', y='Crude Death', hue='Region', )
-        fname_lineplot = OUTPUT_FOLDER + '{}_lineplot.png'.format(continent.replace(' ', '_'))
-        LOGGER.info('writing to %s', fname_lineplot)
-        savefig(fname=fname_lineplot, format='png')
-        close(fig=figure_lineplot)
-
-        countries_df = df[df['Location code'].isin(country_codes)][
-            ['Year', 'Region, subregion, country or area *',
-             'Crude Death Rate (deaths per 1,000 population)',
-             ]].rename(columns={'Crude Death Rate (deaths per 1,000 population)': 'Crude Death',
-                                'Region, subregion, country or area *': 'Region', })
-        deviations = {region: countries_df[countries_df['Region'] == region]['Crude Death'].std() for region in
-                      countries_df['Region'].unique()}
-        deviation_df = DataFrame(data={'country': list(deviations.keys()), 'std dev': list(deviations.values())})
-        means = {region: countries_df[countries_df['Region'] == region]['Crude Death'].mean() for region in
-                 countries_df['Region'].unique()}
-        mean_df = DataFrame(data={'country': list(means.keys()), 'mean': list(means.values())})
-        plot_df = mean_df.merge(right=deviation_df, how='inner', on='country')
-        stddev = 'std dev'
-        plot_df['hue'] = plot_df['mean'] * plot_df[stddev]
-        plot_df['country'].replace(inplace=True, to_replace=TO_REPLACE, )
-        mean = 'Mean Crude Death'
-        y_var = stddev + ' Crude Death'
-        plot_df.rename(columns={'mean': mean, stddev: y_var}, inplace=True, )
-        figure_scatterplot, axes_scatterplot = subplots()
-        result_scatterplot = lmplot(data=plot_df, x=mean, y=y_var, hue='hue', legend=False, aspect=2, )
-        label_point(x=plot_df[mean], y=plot_df[y_var], val=plot_df['country'], ax=gca())
-        tight_layout()
-        fname_scatterplot = OUTPUT_FOLDER + '{}_mean_{}_scatterplot.png'.format(continent.replace(' ', '_'),
-                                                                                stddev.replace(' ', '_'))
-        LOGGER.info('writing to %s', fname_scatterplot)
-        savefig(fname=fname_scatterplot, format='png')
-        close(fig=figure_scatterplot)
-
-        subregion_df = df[df['Parent code'] == location_code][[
-            'Year', 'Region, subregion, country or area *',
-            'Parent code',
-            'Natural Change, Births minus Deaths (thousands)',
-            'Rate of Natural Change (per 1,000 population)',
-            'Crude Death Rate (deaths per 1,000 population)',
-        ]].rename(columns={
-            'Crude Death Rate (deaths per 1,000 population)': 'Crude Death',
-            'Region, subregion, country or area *': 'Region',
-        })
-        del axes_lineplot
-        del figure_lineplot
-        del result_lineplot
-        figure_lineplot, axes_lineplot = subplots()
-        result_lineplot = lineplot(ax=axes_lineplot, data=subregion_df, x='Year', y='Crude Death', hue='Region')
-        fname_lineplot = '{}{}_subregion_lineplot.png'.format(OUTPUT_FOLDER, continent.replace(' ', '_'), )
-        LOGGER.info('writing to %s', fname_lineplot)
-        savefig(format='png', fname=fname_lineplot, )
-        close(fig=figure_lineplot)
+        # North America has no subregions, so its children are already countries
+        with span(name='continent statistics', category='compute', continent=continent):
+            region_codes = hierarchy.children(code=location_code)
+            country_codes = hierarchy.countries(code=location_code)
+
+            regions_df = df[(df['Location code'].isin(region_codes)) | (df['Location code'] == location_code)][
+                ['Year', 'Region, subregion, country or area *',
+                 'Crude Death Rate (deaths per 1,000 population)',
+                 ]].rename(columns={'Crude Death Rate (deaths per 1,000 population)': 'Crude Death',
+                                    'Region, subregion, country or area *': 'Region', })
+            regions_df['Region'] = regions_df['Region'].astype(str)
+            lineplot_jobs.append({'fname': OUTPUT_FOLDER + '{}_lineplot.png'.format(continent.replace(' ', '_')),
+                                  'hue': 'Region', 'plot_df': regions_df, })
+
+            countries_df = df[df['Location code'].isin(country_codes)][
+                ['Year', 'Region, subregion, country or area *',
+                 'Crude Death Rate (deaths per 1,000 population)',
+                 ]].rename(columns={'Crude Death Rate (deaths per 1,000 population)': 'Crude Death',
+                                    'Region, subregion, country or area *': 'Region', })
+            countries_df['Region'] = countries_df['Region'].astype(str)
+            stddev = 'std dev'
+            plot_df = group_statistics(input_df=countries_df, by='Region', value_column='Crude Death')[
+                ['Region', 'mean', 'std']].rename(columns={'Region': 'country', 'std': stddev})
+            plot_df['hue'] = plot_df['mean'] * plot_df[stddev]
+            plot_df['country'] = plot_df['country'].replace(to_replace=TO_REPLACE, )
+            mean = 'Mean Crude Death'
+            y_var = stddev + ' Crude Death'
+            plot_df.rename(columns={'mean': mean, stddev: y_var}, inplace=True, )
+            scatterplot_jobs.append({
+                'fname': OUTPUT_FOLDER + '{}_mean_{}_scatterplot.png'.format(continent.replace(' ', '_'),
+                                                                             stddev.replace(' ', '_')),
+                'plot_df': plot_df, 'x': mean, 'y': y_var, })
+
+            subregion_df = df[df['Location code'].isin(region_codes)][[
+                'Year', 'Region, subregion, country or area *',
+                'Crude Death Rate (deaths per 1,000 population)',
+            ]].rename(columns={
+                'Crude Death Rate (deaths per 1,000 population)': 'Crude Death',
+                'Region, subregion, country or area *': 'Region',
+            })
+            subregion_df['Region'] = subregion_df['Region'].astype(str)
+            lineplot_jobs.append({
+                'fname': '{}{}_subregion_lineplot.png'.format(OUTPUT_FOLDER, continent.replace(' ', '_'), ),
+                'hue': 'Region', 'plot_df': subregion_df, })
+
+    # only the plots whose data or plotting code changed since the last run get rendered again
+    render_changed_jobs(function=plot_lineplot, jobs=lineplot_jobs)
+    render_changed_jobs(function=plot_scatterplot, jobs=scatterplot_jobs)
 
     LOGGER.info('total time: {:5.2f}s'.format((now() - TIME_START).total_seconds()))
@@ -4,26 +4,44 @@ Load and parse Excel data
 from logging import INFO
 from logging import basicConfig
 from logging import getLogger
-from os.path import exists
+from os import cpu_count
+from os import environ
 from pathlib import Path
-from typing import Optional
-from typing import Union
 
 from arrow import now
-from matplotlib.pyplot import close
 from matplotlib.pyplot import savefig
-from matplotlib.pyplot import subplots
-from numpy import dot
 from pandas import DataFrame
-from pandas import read_excel
+from pandas import concat
 from seaborn import lineplot
 from seaborn import scatterplot
 from seaborn import set_style
 
+from common import read_excel_dataframe
+from figures import release
+from figures import subplots
+from render import render_changed_jobs
+from similarity import nearest_rows
+from similarity import reference_similarities
+from similarity import series_matrix
+from sources import fetch
+from tracing import span
 
-def read_excel_dataframe(io: str, header: int, usecols: Optional[Union[list, int]]) -> DataFrame:
-    result_df = read_excel(engine='openpyxl', header=header, io=io, usecols=usecols)
-    return result_df
+
+def plot_country_vs_world(graph_df: DataFrame, fname: str) -> None:
+    set_style(style=SEABORN_STYLE)
+    figure_lineplot, axes_lineplot = subplots(figsize=(9, 16))
+    lineplot(ax=axes_lineplot, data=graph_df, x='Year', y='Crude Death', hue='Country')
+    savefig(format='png', fname=fname, )
+    release(figure=figure_lineplot)
+
+
+def plot_country(country_df: DataFrame, fname: str) -> None:
+    set_style(style=SEABORN_STYLE)
+    figure, axes = subplots()
+    # todo plot these against the world aggregate
+    scatterplot(ax=axes, data=country_df, x='Year', y='Crude Death')
+    savefig(fname=fname, format='png')
+    release(figure=figure)
 
 
 COUNTRIES = ['Afghanistan', 'Albania', 'China', 'Ethiopia', 'Ireland', 'Russian Federation', 'Rwanda', 'Somalia',
@@ -31,8 +49,9 @@ COUNTRIES = ['Afghanistan', 'Albania', 'China', 'Ethiopia', 'Ireland', 'Russian
 CRUDE_DATA_FILE = 'WPP2022_GEN_F01_DEMOGRAPHIC_INDICATORS_COMPACT_REV1_CRUDE_DEATH.xlsx'
 DATA_FOLDER = './data/'
 DO_ALL_GRAPHS = False
-INPUT_FILE = 'WPP2022_GEN_F01_DEMOGRAPHIC_INDICATORS_COMPACT_REV1.xlsx'
 OUTPUT_FOLDER = './plot_crude/'
+# the pipeline sets RENDER_WORKERS to this stage's share of the CPUs
+RENDER_WORKERS = int(environ.get('RENDER_WORKERS', cpu_count()))
 SAVE_CRUDE_DATA = False
 SEABORN_STYLE = 'darkgrid'
 USECOLS = [
@@ -52,7 +71,7 @@ if __name__ == '__main__':
 
     crude_data_file = DATA_FOLDER + CRUDE_DATA_FILE
     if SAVE_CRUDE_DATA:
-        data_file = DATA_FOLDER + INPUT_FILE
+        data_file = str(fetch(name='wpp'))
         df = read_excel_dataframe(io=data_file, header=16, usecols=USECOLS)
         LOGGER.info('loaded %d rows from %s', len(df), data_file)
         # filter for the data we want and make a copy because we need to add columns
@@ -67,44 +86,48 @@ if __name__ == '__main__':
     crude_df.rename(columns={'Crude Death Rate (deaths per 1,000 population)': 'Crude Death',
                              'Region, subregion, country or area *': 'Country'}, inplace=True)
 
-    world_ = crude_df[crude_df['Country'] == 'WORLD']['Crude Death'].values
-    dot_world = dot(a=world_, b=world_)
-    correlations = {country: dot(a=crude_df[crude_df['Country'] == country]['Crude Death'].values, b=world_) / dot_world
-                    for country in crude_df['Country'].unique() if country not in {'Holy See', 'WORLD'}}
-    correlations_df = DataFrame(data={'country': list(correlations.keys()),
-                                      'correlation': list(correlations.values())}).sort_values(by='correlation')
+    # build the country x year matrix once and compare every row against WORLD in one product
+    with span(name='similarity to WORLD', category='compute'):
+        matrix_df = series_matrix(input_df=crude_df[crude_df['Country'] != 'Holy See'], row_column='Country',
+                                  column_column='Year', value_column='Crude Death')
+        similarities_df = reference_similarities(matrix=matrix_df, reference='WORLD').drop(index=['WORLD'])
+        correlations_df = DataFrame(data={'country': similarities_df.index,
+                                          'correlation': similarities_df['projection'].values}).sort_values(
+            by='correlation')
+        nearest_df = nearest_rows(matrix=matrix_df)
+    for country in COUNTRIES:
+        LOGGER.info('nearest trajectory to %s: %s (%0.3f)', country, nearest_df.loc[country, 'nearest'],
+                    nearest_df.loc[country, 'correlation'])
     # todo break this up into multiple readable subplots
     set_style(style=SEABORN_STYLE)
-    figure_correlations, axes_correlations = subplots(figsize=(9, 16))
-    plot_correlations = scatterplot(data=correlations_df.iloc[0:50], y='country', x='correlation')
-    savefig(fname=OUTPUT_FOLDER + 'crude_death_correlations.png', format='png')
-    close(fig=figure_correlations)
+    with span(name='correlations scatterplot', category='plot'):
+        figure_correlations, axes_correlations = subplots(figsize=(9, 16))
+        plot_correlations = scatterplot(data=correlations_df.iloc[0:50], y='country', x='correlation')
+        savefig(fname=OUTPUT_FOLDER + 'crude_death_correlations.png', format='png')
+        release(figure=figure_correlations)
+
+    # split the data by country once rather than masking the whole frame for every country
+    with span(name='split by country', category='compute'):
+        country_dfs = dict(list(crude_df.groupby(by='Country', sort=False)))
+        world_df = country_dfs['WORLD']
 
     # graph a country against the baseline
-    for country in crude_df['Country'].unique():
+    jobs = list()
+    for country, country_df in country_dfs.items():
         fname = OUTPUT_FOLDER + '{}-vs-{}.png'.format(country, 'World')
-        if exists(fname):
-            LOGGER.warning('not creating %s because it already exists.', fname)
-        elif country == 'Holy See':
+        if country == 'Holy See':
             LOGGER.warning('skipping %s because its data is broken or something', country)
         elif country == 'WORLD':
             LOGGER.warning('skipping %s because it is redundant', country)
         else:
             # todo add a plot with a regression fit line?
-            LOGGER.info('line plotting crude rate %s vs world', country)
-            graph_df = crude_df[(crude_df['Country'] == 'WORLD') | (crude_df['Country'] == country)]
-            figure_lineplot, axes_lineplot = subplots(figsize=(9, 16))
-            lineplot_result = lineplot(ax=axes_lineplot, data=graph_df, x='Year', y='Crude Death', hue='Country')
-            savefig(format='png', fname=fname, )
-            close(fig=figure_lineplot)
+            jobs.append({'fname': fname, 'graph_df': concat([world_df, country_df])})
+    # only the plots whose data or plotting code changed since the last run get rendered again
+    render_changed_jobs(function=plot_country_vs_world, jobs=jobs, workers=RENDER_WORKERS)
 
     if DO_ALL_GRAPHS:
-        for index, country in enumerate(crude_df['Country'].unique()):
-            figure, axes = subplots()
-            LOGGER.info(country)
-            # todo plot these against the world aggregate
-            plot_result = scatterplot(ax=axes, data=crude_df[crude_df['Country'] == country], x='Year', y='Crude Death')
-            savefig(fname='./plot/{}_crude_death.png'.format(country), format='png')
-            close(fig=figure)
+        jobs = [{'country_df': country_df, 'fname': './plot/{}_crude_death.png'.format(country)} for
+                country, country_df in country_dfs.items()]
+        render_changed_jobs(function=plot_country, jobs=jobs, workers=RENDER_WORKERS)
 
     LOGGER.info('total time: {:5.2f}s'.format((now() - TIME_START).total_seconds()))
@@ -0,0 +1,108 @@
+"""
+Dense location x year x indicator cube of the WPP data, saved as a memory-mapped .npy file
+"""
+from json import dump
+from json import load
+from pathlib import Path
+from typing import Optional
+from typing import Union
+
+from numpy import arange
+from numpy import bincount
+from numpy import flatnonzero
+from numpy import float32
+from numpy import nan
+from numpy import ndarray
+from numpy import searchsorted
+from numpy import load as load_array
+from numpy.lib.format import open_memmap
+from pandas import DataFrame
+
+from common import INDICATOR_COLUMNS
+
+
+def build_cube(input_df: DataFrame, folder: str, indicators: list[str] = INDICATOR_COLUMNS,
+               source_hash: Optional[str] = None) -> None:
+    # source_hash is the file_hash of the workbook the rows came from, so readers can tell when the cube is stale
+    rows_df = input_df.dropna(subset=['Location code', 'Year'])
+    location_codes = sorted(rows_df['Location code'].astype(int).unique().tolist())
+    first_year, last_year = int(rows_df['Year'].min()), int(rows_df['Year'].max())
+    years = last_year - first_year + 1
+    names_df = rows_df[['Location code', 'Region, subregion, country or area *']].drop_duplicates(
+        subset=['Location code'])
+    names = dict(zip(names_df['Location code'].astype(int),
+                     names_df['Region, subregion, country or area *'].astype(str)))
+
+    location_positions = searchsorted(location_codes, rows_df['Location code'].astype(int).to_numpy())
+    year_positions = rows_df['Year'].astype(int).to_numpy() - first_year
+    # each cell takes one row; two rows for a location and year (two variants, say) would silently overwrite
+    duplicated = flatnonzero(bincount(location_positions * years + year_positions) > 1)
+    if len(duplicated):
+        location_position, year_position = divmod(int(duplicated[0]), years)
+        raise ValueError('{} location and year pairs have more than one row, the first is location {} in {}; build '
+                         'one cube per variant'.format(len(duplicated), location_codes[location_position],
+                                                       first_year + year_position))
+
+    Path(folder).mkdir(parents=True, exist_ok=True)
+    # write straight into the mapped file so we never hold a second copy of the cube
+    values = open_memmap(dtype=float32, filename=str(Path(folder) / CUBE_FILE), mode='w+',
+                         shape=(len(location_codes), years, len(indicators)))
+    values[:] = nan
+    values[location_positions, year_positions, :] = rows_df[indicators].to_numpy(dtype=float32, na_value=nan)
+    values.flush()
+    del values
+
+    with open(file=Path(folder) / INDEX_FILE, mode='w') as output_fp:
+        dump(fp=output_fp, indent=2, obj={
+            'indicators': list(indicators),
+            'locations': location_codes,
+            'names': [names[code] for code in location_codes],
+            'source_hash': source_hash,
+            'years': [first_year, last_year],
+        })
+
+
+def cube_is_current(folder: str, source_hash: str) -> bool:
+    # a cube without a recorded source, or from another version of the workbook, has to be built again
+    index_file = Path(folder) / INDEX_FILE
+    if not (Path(folder) / CUBE_FILE).exists() or not index_file.exists():
+        return False
+    with open(file=index_file, mode='r') as input_fp:
+        return load(fp=input_fp).get('source_hash') == source_hash
+
+
+class IndicatorCube:
+    def __init__(self, folder: str):
+        # read-only mapping: every process that opens the cube shares the same pages
+        self.values = load_array(file=Path(folder) / CUBE_FILE, mmap_mode='r')
+        with open(file=Path(folder) / INDEX_FILE, mode='r') as input_fp:
+            index = load(fp=input_fp)
+        self.indicator_index = {indicator: position for position, indicator in enumerate(index['indicators'])}
+        self.location_index = {code: position for position, code in enumerate(index['locations'])}
+        self.name_index = {name: position for position, name in enumerate(index['names'])}
+        self.names = index['names']
+        self.source_hash = index.get('source_hash')
+        self.years = arange(index['years'][0], index['years'][1] + 1)
+
+    def position(self, location: Union[int, str]) -> int:
+        return self.name_index[location] if isinstance(location, str) else self.location_index[int(location)]
+
+    def series(self, location: Union[int, str], indicator: str) -> ndarray:
+        # basic indexing, so this is a view into the mapping rather than a copy
+        return self.values[self.position(location=location), :, self.indicator_index[indicator]]
+
+    def indicators(self, location: Union[int, str]) -> ndarray:
+        return self.values[self.position(location=location)]
+
+    def frame(self, locations: list[Union[int, str]], indicator: str) -> DataFrame:
+        positions = [self.position(location=location) for location in locations]
+        return DataFrame(data={
+            'Year': list(self.years) * len(positions),
+            'Region, subregion, country or area *': [self.names[position] for position in positions for _ in
+                                                     self.years],
+            indicator: self.values[positions, :, self.indicator_index[indicator]].ravel(),
+        })
+
+
+CUBE_FILE = 'wpp_cube.npy'
+INDEX_FILE = 'wpp_cube_index.json'
@@ -0,0 +1,111 @@
+"""
+Typed, cached reader for the pipe-delimited DCAS casualty extracts from the National Archives
+"""
+from hashlib import sha256
+from logging import getLogger
+from pathlib import Path
+from typing import Optional
+
+from numpy import datetime64
+from numpy import int64
+from numpy import isfinite
+from numpy import nan
+from numpy import ndarray
+from numpy import where
+from pandas import DataFrame
+from pandas import Series
+from pandas import read_csv
+from pandas import read_parquet
+from pandas import to_numeric
+
+from common import CACHE_FOLDER
+from common import file_hash
+from tracing import traced
+
+
+def decode_dates(values: Series) -> ndarray:
+    # yyyymmdd numbers to datetime64[D] in one pass; blanks, zeros and impossible dates become NaT
+    numbers = to_numeric(values, errors='coerce').to_numpy(dtype=float, na_value=nan)
+    valid = isfinite(numbers)
+    numbers = where(valid, numbers, 0).astype(int64)
+    years, months, days = numbers // 10000, (numbers // 100) % 100, numbers % 100
+    valid &= (1 <= months) & (months <= 12) & (1 <= days) & (days <= 31)
+    month_starts = ((years - 1970).astype('datetime64[Y]').astype('datetime64[M]') +
+                    (months.clip(1, 12) - 1).astype('timedelta64[M]'))
+    result = month_starts.astype('datetime64[D]') + (days.clip(1, 31) - 1).astype('timedelta64[D]')
+    # a day past the end of its month rolls over into the next one, which makes it an impossible date
+    valid &= result.astype('datetime64[M]') == month_starts
+    result[~valid] = datetime64('NaT')
+    return result
+
+
+def parse_dcas(path: str, columns: list[str]) -> DataFrame:
+    # the extract has no header; only the columns asked for are parsed, and the repetitive ones as categories
+    dtype = {column: 'category' for column in CATEGORIES if column in columns}
+    result_df = read_csv(dtype=dtype, filepath_or_buffer=path, header=None, names=NAMES, sep='|', usecols=columns)
+    for column in DATES:
+        if column in result_df.columns:
+            # pandas keeps the days at its own coarsest resolution, seconds
+            result_df[column] = Series(data=decode_dates(values=result_df[column]), dtype=DATE_DTYPE,
+                                       index=result_df.index)
+    return result_df[columns]
+
+
+def cache_path(path: str, source_hash: str, columns: list[str]) -> Path:
+    key_hash = sha256(repr((source_hash, columns, CACHE_VERSION)).encode('utf-8')).hexdigest()
+    return Path(CACHE_FOLDER) / '{}-{}-{}.parquet'.format(Path(path).stem, source_hash[:16], key_hash[:16])
+
+
+@traced(category='load')
+def read_dcas(path: str, usecols: Optional[list[str]] = None, use_cache: bool = True) -> DataFrame:
+    columns = NAMES if usecols is None else [column for column in NAMES if column in usecols]
+    missing = sorted(set(usecols or list()) - set(NAMES))
+    if missing:
+        raise ValueError('DCAS extracts have no columns {}'.format(', '.join(missing)))
+    # we can only cache local files; URLs are parsed every time
+    if not use_cache or not Path(path).is_file():
+        return parse_dcas(columns=columns, path=path)
+    source_hash = file_hash(path=path)
+    cache_file = cache_path(columns=columns, path=path, source_hash=source_hash)
+    if cache_file.exists():
+        # Parquet keeps the categories; it has no seconds unit, so the dates come back in ms and go back to seconds
+        result_df = read_parquet(path=cache_file).astype({column: DATE_DTYPE for column in DATES if column in columns})
+        LOGGER.info('loaded %d rows from cache %s', len(result_df), cache_file)
+        return result_df
+    result_df = parse_dcas(columns=columns, path=path)
+    cache_file.parent.mkdir(parents=True, exist_ok=True)
+    # a new source hash means the extract changed, so the older copies are stale
+    for stale_file in cache_file.parent.glob('{}-*.parquet'.format(Path(path).stem)):
+        if not stale_file.name.startswith('{}-{}-'.format(Path(path).stem, source_hash[:16])):
+            LOGGER.info('removing stale cache %s', stale_file)
+            stale_file.unlink()
+    result_df.to_parquet(path=cache_file)
+    LOGGER.info('wrote %d rows to cache %s', len(result_df), cache_file)
+    return result_df
+
+
+# bump this when parse_dcas changes what it produces, so the old cache files are not used
+CACHE_VERSION = 1
+# columns with a few dozen values at most across some fifty thousand records
+CATEGORIES = ['Casualty Category Name', 'Casualty Category Short Name', 'Casualty Closure Name', 'Casualty Type Name',
+              'Component Code', 'Country/Over Water Name', 'Duty Code', 'Ethnic Group Name', 'Gender',
+              'Home of Record State Code', 'Hostile/Non-Hostile Death Indicator', 'Marital Name',
+              'Member Service Code', 'Member Service Name', 'Pay Grade', 'Person Type Name', 'Race Name',
+              'Rank Rate', 'Region Name', 'Religion Short Name', 'Remains Recovered', 'State or Province Name']
+DATE_DTYPE = 'datetime64[s]'
+DATES = ['Birth Date', 'Incident or Death Date', 'Process Date']
+LOGGER = getLogger(__name__, )
+NAMES = ['Service Number', 'Component Code', 'Person Type Name Code', 'Person Type Name', 'Member Name',
+         'Member Service Code', 'Member Service Name', 'Rank Rate', 'Pay Grade', 'Occupation Code',
+         'Occupation Name', 'Birth Date', 'Gender', 'Home of Record City', 'Home of Record County',
+         'Home of Record Country Code', 'Home of Record State Code', 'State or Province Name', 'Marital Name',
+         'Religion Short Name', 'Religion Code', 'Race Name', 'Ethnic Short Name', 'Race OMB Name',
+         'Ethnic Group Name', 'Casualty Circumstances', 'Casualty City', 'Casualty State or Province Code',
+         'Casualty Country/Over Water Code', 'Region Name', 'Country/Over Water Name', 'Unit', 'Duty Code',
+         'Process Date', 'Incident or Death Date', 'Year', 'War or Conflict Code',
+         'Operation Incident Type Code', 'Operation/Incident Name', 'Location Name', 'Closure Date',
+         'Aircraft Type', 'Hostile/Non-Hostile Death Indicator', 'Casualty Type Name', 'Casualty Category Name',
+         'Incident Casualty Reason Name', 'Casualty Category Short Name', 'Remains Recovered',
+         'Casualty Closure Name', 'Vietnam Wall Row and Panel Indicator', 'Incident Casualty Category Name',
+         'Incident Casualty Category Date', 'Incident Casualty Category Short Name',
+         'Incident Hostile or Incident Non-Hostile Death', 'Incident Aircraft Type']
@@ -0,0 +1,94 @@
+"""
+Count dated events into calendar or custom bins in one pass, optionally by group, and plot from the counts
+"""
+from typing import Optional
+
+from matplotlib.axes import Axes
+from matplotlib.dates import date2num
+from numpy import arange
+from numpy import asarray
+from numpy import bincount
+from numpy import datetime64
+from numpy import int64
+from numpy import isnat
+from numpy import ndarray
+from numpy import searchsorted
+from numpy import zeros
+from pandas import DataFrame
+from pandas import factorize
+from seaborn import histplot
+
+
+class EventCounts:
+    def __init__(self, counts: ndarray, edges: ndarray, groups: list):
+        # counts has one row per group and one column per bin; edges are the bin bounds as datetime64[D]
+        self.counts = counts
+        self.edges = edges
+        self.groups = groups
+
+    def total(self) -> ndarray:
+        return self.counts.sum(axis=0)
+
+    def to_frame(self) -> DataFrame:
+        # one row per group and bin, the shape seaborn wants for a hue
+        bins = len(self.edges) - 1
+        return DataFrame(data={
+            'start': list(self.edges[:-1]) * len(self.groups),
+            'end': list(self.edges[1:]) * len(self.groups),
+            'middle': list(self.edges[:-1] + (self.edges[1:] - self.edges[:-1]) // 2) * len(self.groups),
+            'group': [group for group in self.groups for _ in range(bins)],
+            'count': self.counts.ravel(),
+        })
+
+
+def bin_edges(start, stop, freq: str = 'month', step: int = 1) -> ndarray:
+    # calendar bins of step days, weeks, months or years from the one holding start to the first bound past stop;
+    # weeks follow numpy and start on Thursday
+    unit = UNITS[freq]
+    first = datetime64(start, 'D').astype('datetime64[{}]'.format(unit))
+    last = datetime64(stop, 'D').astype('datetime64[{}]'.format(unit))
+    last += int(last.astype('datetime64[D]') < datetime64(stop, 'D'))
+    count = max(1, -(-int((last - first).astype(int64)) // step))
+    return (first + arange(count + 1) * step).astype('datetime64[D]')
+
+
+def event_counts(dates, freq: str = 'month', step: int = 1, start=None, stop=None, edges: Optional[ndarray] = None,
+                 groups=None) -> EventCounts:
+    # events outside [start, stop) or with no date are left out; with edges the bins are custom and freq is ignored
+    dates = asarray(dates, dtype='datetime64[D]')
+    valid = ~isnat(dates)
+    if edges is None:
+        start = dates[valid].min() if start is None else datetime64(start, 'D')
+        stop = dates[valid].max() + 1 if stop is None else datetime64(stop, 'D')
+        edges = bin_edges(freq=freq, start=start, step=step, stop=stop)
+        # calendar bins are whole units, so the bin is a subtraction and a division instead of a search
+        unit = 'datetime64[{}]'.format(UNITS[freq])
+        positions = (dates.astype(unit).astype(int64) - edges[0].astype(unit).astype(int64)) // step
+        valid &= (dates >= datetime64(start, 'D')) & (dates < datetime64(stop, 'D'))
+    else:
+        edges = asarray(edges, dtype='datetime64[D]')
+        positions = searchsorted(edges, dates, side='right') - 1
+    valid &= (dates >= edges[0]) & (dates < edges[-1])
+    bins = len(edges) - 1
+    if groups is None:
+        codes, labels = zeros(shape=len(dates), dtype=int64), [None]
+    else:
+        codes, labels = factorize(asarray(groups), sort=True)
+        labels = labels.tolist()
+        valid &= codes >= 0
+    # every group and bin pair is one slot, so a single bincount counts them all
+    counts = bincount(codes[valid] * bins + positions[valid], minlength=len(labels) * bins)
+    return EventCounts(counts=counts.reshape(len(labels), bins), edges=edges, groups=labels)
+
+
+def plot_counts(ax: Axes, counts: EventCounts, label: str = 'date', **kwargs) -> Axes:
+    # seaborn draws the histogram (and any kde) from one weighted point in the middle of each bin instead of binning
+    # every event again; the bins go in as a list because seaborn compares them to 'auto'
+    hue = None if counts.groups == [None] else 'group'
+    result = histplot(ax=ax, bins=date2num(counts.edges).tolist(), data=counts.to_frame(), hue=hue, weights='count',
+                      x='middle', **kwargs)
+    result.set_xlabel(label)
+    return result
+
+
+UNITS = {'day': 'D', 'month': 'M', 'week': 'W', 'year': 'Y'}
@@ -0,0 +1,100 @@
+"""
+Hand out, recycle and close matplotlib figures so long batches of plots do not pile figures up in pyplot
+"""
+from logging import getLogger
+from typing import Optional
+from weakref import WeakKeyDictionary
+
+from matplotlib import rcParams
+from matplotlib.figure import Figure
+from matplotlib.pyplot import close
+from matplotlib.pyplot import figure as activate
+from matplotlib.pyplot import gcf
+from matplotlib.pyplot import get_fignums
+from matplotlib.pyplot import subplots as pyplot_subplots
+
+
+def open_figures() -> list[Figure]:
+    # pyplot only hands out a figure by number by making it current, so the current figure is put back afterwards
+    numbers = get_fignums()
+    if not numbers:
+        return list()
+    current = gcf()
+    result = [activate(num=number) for number in numbers]
+    activate(num=current.number)
+    return result
+
+
+def is_open(figure: Figure) -> bool:
+    # figure numbers are reused after a close, so check that the number still belongs to this figure
+    return figure.number in get_fignums() and any(item is figure for item in open_figures())
+
+
+def figure_key(figsize: Optional[tuple]) -> tuple:
+    figsize = rcParams['figure.figsize'] if figsize is None else figsize
+    return float(figsize[0]), float(figsize[1]), float(rcParams['figure.dpi'])
+
+
+def subplots(figsize: Optional[tuple] = None, **kwargs) -> tuple:
+    # a released figure of the same size is cleared and reused, which saves building a new canvas for every plot
+    key = figure_key(figsize=figsize)
+    pooled = POOL.get(key, list())
+    while pooled:
+        figure = pooled.pop()
+        if is_open(figure=figure):
+            activate(num=figure.number)
+            figure.clear()
+            # tight_layout moves the subplot parameters, so put them back to where a new figure would have them
+            figure.subplots_adjust(**{name: rcParams['figure.subplot.' + name] for name in SUBPLOT_PARAMETERS})
+            axes = figure.subplots(**kwargs)
+            break
+    else:
+        figure, axes = pyplot_subplots(figsize=figsize, **kwargs)
+        KEYS[figure] = key
+    if SCOPES:
+        SCOPES[-1].owned.append(figure)
+    return figure, axes
+
+
+def release(figure: Figure) -> None:
+    # figures from subplots go back to the pool; the ones seaborn builds for itself (lmplot, relplot) are closed
+    key = KEYS.get(figure)
+    if key is not None and is_open(figure=figure) and len(POOL.setdefault(key, list())) < POOL_SIZE:
+        POOL[key].append(figure)
+    else:
+        close(fig=figure)
+
+
+class FigureScope:
+    # every figure opened inside the block and not released by the end of it is a leak: log it and close it
+    def __init__(self, name: str):
+        self.before = list()
+        self.name = name
+        self.owned = list()
+
+    def __enter__(self):
+        self.before = open_figures()
+        SCOPES.append(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        SCOPES.remove(self)
+        pooled = [figure for figures in POOL.values() for figure in figures]
+        leaked = [figure for figure in open_figures() if
+                  (all(figure is not item for item in self.before) or any(figure is item for item in self.owned))
+                  and all(figure is not item for item in pooled)]
+        if leaked and exc_type is None:
+            LOGGER.warning('%s left %d figures open; closing them', self.name, len(leaked))
+        for figure in leaked:
+            close(fig=figure)
+        self.before = self.owned = list()
+        return False
+
+
+# the figures made by subplots, with the size and resolution they can be reused for
+KEYS = WeakKeyDictionary()
+LOGGER = getLogger(__name__, )
+POOL = dict()
+POOL_SIZE = 2
+SCOPES = list()
+SUBPLOT_PARAMETERS = ['bottom', 'hspace', 'left', 'right', 'top', 'wspace']
@@ -0,0 +1,75 @@
+"""
+Location hierarchy built once from the WPP Location code / Parent code / Type columns
+"""
+from numpy import array
+from numpy import ndarray
+from pandas import DataFrame
+from pandas import isna
+
+
+class LocationHierarchy:
+    def __init__(self, input_df: DataFrame):
+        codes_df = input_df[['Location code', 'Parent code', 'Type']].dropna(subset=['Location code'])
+        codes_df = codes_df[codes_df['Type'] != 'Label/Separator'].drop_duplicates(subset=['Location code'])
+        codes = codes_df['Location code'].astype(int).tolist()
+        parents = [None if isna(parent) else int(parent) for parent in codes_df['Parent code'].tolist()]
+        self.parent = dict(zip(codes, parents))
+        self.type = dict(zip(codes, codes_df['Type'].astype(str).tolist()))
+
+        children = {code: set() for code in codes}
+        for code, parent in self.parent.items():
+            if parent in children.keys() and parent != code:
+                children[parent].add(code)
+        self._children = {code: frozenset(values) for code, values in children.items()}
+
+        # everything is precomputed so each lookup below is a single dictionary hit
+        self._descendants = dict()
+        for code in codes:
+            self._descendants[code] = self._collect_descendants(code=code)
+        self._ancestors = {code: self._collect_ancestors(code=code) for code in codes}
+        members = dict()
+        for code, type_ in self.type.items():
+            members.setdefault(type_, set()).add(code)
+        self._members = {type_: frozenset(values) for type_, values in members.items()}
+        self._arrays = dict()
+
+    def _collect_descendants(self, code: int) -> frozenset:
+        if code in self._descendants.keys():
+            return self._descendants[code]
+        result = set()
+        pending = list(self._children[code])
+        while pending:
+            child = pending.pop()
+            if child not in result:
+                result.add(child)
+                pending.extend(self._children[child])
+        return frozenset(result)
+
+    def _collect_ancestors(self, code: int) -> tuple:
+        result = []
+        parent = self.parent[code]
+        # stop at the top of the tree or at a parent we do not have a row for
+        while parent in self.parent.keys() and parent not in result and parent != code:
+            result.append(parent)
+            parent = self.parent[parent]
+        return tuple(result)
+
+    def children(self, code: int) -> frozenset:
+        return self._children.get(code, frozenset())
+
+    def descendants(self, code: int) -> frozenset:
+        return self._descendants.get(code, frozenset())
+
+    def ancestors(self, code: int) -> tuple:
+        return self._ancestors.get(code, tuple())
+
+    def members(self, type_: str) -> frozenset:
+        return self._members.get(type_, frozenset())
+
+    def countries(self, code: int) -> frozenset:
+        return self.descendants(code=code) & self.members(type_='Country/Area')
+
+    def as_array(self, codes: frozenset) -> ndarray:
+        if codes not in self._arrays.keys():
+            self._arrays[codes] = array(sorted(codes), dtype=int)
+        return self._arrays[codes]
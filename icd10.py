@@ -0,0 +1,117 @@
+"""
+ICD-10 code ranges as a sorted interval index, to classify codes to cause groups without matching label text
+"""
+from bisect import bisect_right
+from re import compile as compile_pattern
+from typing import Iterable
+from typing import Optional
+
+from numpy import append
+from numpy import full
+from numpy import int64
+from numpy import ndarray
+from numpy import searchsorted
+from numpy import unique
+from pandas import Categorical
+from pandas import Series
+from pandas import factorize
+
+
+def code_key(code: str) -> int:
+    # I25.1 -> I, 25, 10: letter, category and a two-digit subcode, so keys sort the way the codes do
+    match = CODE.fullmatch(code.strip())
+    if match is None:
+        raise ValueError('not an ICD-10 code: {}'.format(code))
+    letter, category, subcode = match.groups()
+    return (ord(letter) - ord('A')) * 10000 + int(category) * 100 + int((subcode or '').ljust(2, '0'))
+
+
+def code_keys(codes: Iterable[str]) -> ndarray:
+    # the same keys for a batch of codes at once; anything that is not a code gets -1. Record-level data repeats a
+    # few thousand distinct codes millions of times, so each distinct code is parsed once
+    positions, distinct = factorize(Series(codes, dtype='object'), use_na_sentinel=True)
+    parts = Series(distinct, dtype='string').str.strip().str.extract('^' + CODE.pattern + '$')
+    subcode = parts[2].fillna('').str.ljust(2, '0')
+    # the letters go numeric before the arithmetic: with no valid code in the batch the mapped column stays string
+    keys = ((parts[0].map(ord, na_action='ignore').astype('Int64') - ord('A')) * 10000 + parts[1].astype('Int64') * 100 +
+            subcode.astype('Int64')).fillna(-1).to_numpy(dtype=int64)
+    return append(keys, -1)[positions]
+
+
+def code_width(code: str) -> int:
+    # a code covers its own subcodes: I25 is I25.00 to I25.99, I25.1 is I25.10 to I25.19
+    subcode = CODE.fullmatch(code.strip()).group(3) or ''
+    return 10 ** (2 - len(subcode))
+
+
+def parse_ranges(expression: str) -> list[tuple[int, int]]:
+    # "V01-V99,Y85" or "*U01.0-*U01.3,X85" as half-open key ranges; the stars (provisional codes) are ignored
+    result = list()
+    for item in expression.split(','):
+        if not item.strip():
+            continue
+        low, _, high = item.partition('-')
+        high = high if high.strip() else low
+        result.append((code_key(code=low), code_key(code=high) + code_width(code=high)))
+    return result
+
+
+def label_ranges(label: str) -> list[tuple[int, int]]:
+    # the ranges in the last parentheses of a WONDER cause label; labels without codes have no ranges
+    match = LABEL.search(label)
+    return list() if match is None else parse_ranges(expression=match.group(1))
+
+
+class CodeIndex:
+    # groups may overlap (a cause and its subcauses); every stretch of codes belongs to the most specific group that
+    # covers it, the one with the fewest codes in total, so each code has at most one group
+    def __init__(self, groups: dict[str, list[tuple[int, int]]]):
+        self.groups = list(groups.keys())
+        sizes = [sum(stop - start for start, stop in ranges) for ranges in groups.values()]
+        self.boundaries = unique([bound for ranges in groups.values() for item in ranges for bound in item])
+        # each position holds the group of the stretch from its boundary up to the next one, -1 for none
+        self.segments = full(fill_value=-1, shape=len(self.boundaries))
+        for group in sorted(range(len(self.groups)), key=lambda item: sizes[item], reverse=True):
+            for start, stop in groups[self.groups[group]]:
+                self.segments[searchsorted(self.boundaries, start):searchsorted(self.boundaries, stop)] = group
+
+    @classmethod
+    def from_labels(cls, labels: Iterable[str]) -> 'CodeIndex':
+        # the groups are the labels themselves, e.g. the ICD-10 113 cause list
+        groups = {label: label_ranges(label=label) for label in labels}
+        return cls(groups={label: ranges for label, ranges in groups.items() if ranges})
+
+    @classmethod
+    def from_expressions(cls, expressions: dict[str, str]) -> 'CodeIndex':
+        return cls(groups={name: parse_ranges(expression=value) for name, value in expressions.items()})
+
+    def lookup(self, code: str) -> Optional[str]:
+        # one code, by binary search over the boundaries
+        position = bisect_right(self.boundaries, code_key(code=code)) - 1
+        return None if position < 0 or self.segments[position] < 0 else self.groups[self.segments[position]]
+
+    def classify(self, codes: Iterable[str]) -> Series:
+        # a batch of codes, by one searchsorted over all of them; codes with no group (or no code) get a null
+        keys = code_keys(codes=codes)
+        positions = searchsorted(self.boundaries, keys, side='right') - 1
+        groups = self.segments[positions.clip(min=0)]
+        groups[(positions < 0) | (keys < 0)] = -1
+        return Series(Categorical.from_codes(categories=self.groups, codes=groups))
+
+    def classify_ranges(self, ranges: list[tuple[int, int]]) -> Optional[str]:
+        # the group that every one of the ranges falls in entirely, or None if they are not all in the same one
+        found = {int(group) for start, stop in ranges for group in
+                 self.segments[max(0, searchsorted(self.boundaries, start, side='right') - 1):
+                               searchsorted(self.boundaries, stop, side='left')]}
+        found |= {-1 for start, stop in ranges if start < self.boundaries[0] or stop > self.boundaries[-1]}
+        return self.groups[found.pop()] if len(found) == 1 and -1 not in found else None
+
+    def classify_labels(self, labels: Iterable[str]) -> list[Optional[str]]:
+        return [self.classify_ranges(ranges=ranges) if ranges else None for ranges in
+                [label_ranges(label=label) for label in labels]]
+
+
+# a letter, a two-digit category and an optional subcode, with or without the dot; the star marks provisional codes
+CODE = compile_pattern(r'\*?([A-Z])(\d{2})\.?(\d{1,2})?')
+# the code list closing a label; "All other diseases (Residual)" has none
+LABEL = compile_pattern(r'\((\*?[A-Z]\d{2}[^()]*)\)\s*$')
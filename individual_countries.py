@@ -8,10 +8,8 @@ from pathlib import Path
 from typing import Mapping
 
 from arrow import now
-from matplotlib.pyplot import close
 from matplotlib.pyplot import legend
 from matplotlib.pyplot import savefig
-from matplotlib.pyplot import subplots
 from matplotlib.pyplot import tight_layout
 from pandas import DataFrame
 from pandas import Series
@@ -19,7 +17,16 @@ from seaborn import lineplot
 from seaborn import set_style
 
 from common import COLUMNS
+from common import file_hash
 from common import read_excel_dataframe
+from cube import IndicatorCube
+from cube import build_cube
+from cube import cube_is_current
+from figures import release
+from figures import subplots
+from hierarchy import LocationHierarchy
+from sources import fetch
+from tracing import span
 
 
 def columns_to_dict(input_df: DataFrame, key_column: str, value_column: str) -> Mapping:
@@ -39,8 +46,10 @@ COUNTRIES = {
     'South Sudan': ['Ethiopia', 'South Sudan', 'Uganda', 'Kenya'],
     'Vietnam': ['Viet Nam', 'Laos', 'Thailand'],
 }
+# make_cube writes the cube here; if it is missing or from another workbook we build it from the sheet we already have
+CUBE_FOLDER = './data/cube/'
 DATA_FOLDER = './data/'
-INPUT_FILE = 'WPP2022_GEN_F01_DEMOGRAPHIC_INDICATORS_COMPACT_REV1.xlsx'
+INDICATOR = 'Crude Death Rate (deaths per 1,000 population)'
 OUTPUT_FOLDER = './plot/'
 RENAME_COLUMNS = {'Crude Death Rate (deaths per 1,000 population)': 'Crude Death',
                   'Region, subregion, country or area *': 'Area', }
@@ -66,38 +75,51 @@ if __name__ == '__main__':
         LOGGER.info('creating folder %s if it does not exist', folder)
         Path(folder).mkdir(parents=True, exist_ok=True)
 
-    data_file = DATA_FOLDER + INPUT_FILE
+    data_file = str(fetch(name='wpp'))
     df = read_excel_dataframe(io=data_file, header=16, usecols=COLUMNS)
     LOGGER.info('loaded %d rows from %s', len(df), data_file)
-    df = df[df['Type'] != 'Label/Separator']
-    df = df[df['Region, subregion, country or area *'] != 'Holy See']
+    with span(name='drop separators and Holy See', category='filter'):
+        df = df[df['Type'] != 'Label/Separator']
+        df = df[df['Region, subregion, country or area *'] != 'Holy See']
 
-    data_df = df[AGGREGATE_COLUMNS].rename(columns=RENAME_COLUMNS)
-    data_df['Area'] = data_df['Area'].replace(RENAME_COUNTRIES)
-    country_code_dict = columns_to_dict(input_df=data_df, key_column='Area', value_column='Location code')
-    parent_code_dict = columns_to_dict(input_df=data_df, key_column='Location code', value_column='Parent code')
+    with span(name='country codes and hierarchy', category='compute'):
+        data_df = df[AGGREGATE_COLUMNS].rename(columns=RENAME_COLUMNS)
+        # the names come back categorical; we want plain strings for the renames and the legends
+        data_df['Area'] = data_df['Area'].astype(str).replace(RENAME_COUNTRIES)
+        country_code_dict = columns_to_dict(input_df=data_df, key_column='Area', value_column='Location code')
+        hierarchy = LocationHierarchy(input_df=df)
+
+    with span(name='open cube', category='load'):
+        source_hash = file_hash(path=data_file)
+        if not cube_is_current(folder=CUBE_FOLDER, source_hash=source_hash):
+            LOGGER.info('building the cube in %s because it is missing or from another workbook', CUBE_FOLDER)
+            build_cube(input_df=df, folder=CUBE_FOLDER, source_hash=source_hash)
+        cube = IndicatorCube(folder=CUBE_FOLDER)
 
     set_style(style=SEABORN_STYLE)
     for public_name, country_values in COUNTRIES.items():
-        LOGGER.info('country: %s', public_name)
-        # get the country code for each country
-        our_country_codes = {country_code_dict[country] for country in country_values}
-        for index in range(4):
-            our_country_codes |= {parent_code_dict[country] for country in our_country_codes if
-                                  country in parent_code_dict.keys()}
+        with span(name='country lineplot', category='plot', country=public_name):
+            LOGGER.info('country: %s', public_name)
+            # get the country code for each country
+            our_country_codes = {country_code_dict[country] for country in country_values}
+            # add the subregions and regions above each country
+            our_country_codes |= {ancestor for country in our_country_codes for ancestor in
+                                  hierarchy.ancestors(code=country)}
 
-        # add the World country code
-        our_country_codes |= {900}
+            # add the World country code
+            our_country_codes |= {900}
 
-        # now we can get the slice of data we need
-        plot_df = data_df[data_df['Location code'].isin(our_country_codes)]
-        figure_lineplot, axes_lineplot = subplots(figsize=(7, 5))
-        result_lineplot = lineplot(data=plot_df, x='Year', y='Crude Death', hue='Area', )
-        legend(bbox_to_anchor=(1.02, 1), loc='upper left', borderaxespad=0)
-        tight_layout()
-        fname = OUTPUT_FOLDER + '{}_cdr_lineplot.png'.format(public_name.replace(' ', '_'))
-        LOGGER.info('plot file: %s', fname)
-        savefig(fname=fname, format='png')
-        close(fig=figure_lineplot)
+            # now we can get the slice of data we need: one view into the cube per location instead of a scan
+            plot_df = cube.frame(indicator=INDICATOR, locations=sorted(our_country_codes)).rename(
+                columns=RENAME_COLUMNS)
+            plot_df['Area'] = plot_df['Area'].replace(RENAME_COUNTRIES)
+            figure_lineplot, axes_lineplot = subplots(figsize=(7, 5))
+            result_lineplot = lineplot(data=plot_df, x='Year', y='Crude Death', hue='Area', )
+            legend(bbox_to_anchor=(1.02, 1), loc='upper left', borderaxespad=0)
+            tight_layout()
+            fname = OUTPUT_FOLDER + '{}_cdr_lineplot.png'.format(public_name.replace(' ', '_'))
+            LOGGER.info('plot file: %s', fname)
+            savefig(fname=fname, format='png')
+            release(figure=figure_lineplot)
 
     LOGGER.info('total time: {:5.2f}s'.format((now() - TIME_START).total_seconds()))
@@ -0,0 +1,128 @@
+"""
+Point label placement that avoids overlaps, drawn as a single collection of text paths
+"""
+from math import floor
+
+from matplotlib import rcParams
+from matplotlib.axes import Axes
+from matplotlib.collections import PathCollection
+from matplotlib.font_manager import FontProperties
+from matplotlib.textpath import TextPath
+from matplotlib.transforms import Affine2D
+from numpy import argmin
+from numpy import array
+from numpy import empty
+from numpy import isfinite
+from numpy import median
+from numpy import ndarray
+from numpy import stack
+from numpy import where
+from numpy import zeros
+
+
+class GridIndex:
+    # a uniform grid over the plot in points; each cell lists the boxes that touch it, so a query only tests the
+    # boxes in the cells it touches instead of every box placed so far
+    def __init__(self, cell: float, capacity: int):
+        self.boxes = empty(shape=(capacity, 4))
+        self.cell = cell
+        self.cells = dict()
+        self.count = 0
+
+    def _cells(self, box) -> list[tuple[int, int]]:
+        columns = range(floor(box[0] / self.cell), floor(box[2] / self.cell) + 1)
+        rows = range(floor(box[1] / self.cell), floor(box[3] / self.cell) + 1)
+        return [(column, row) for column in columns for row in rows]
+
+    def insert(self, box: ndarray) -> None:
+        for cell in self._cells(box=box):
+            self.cells.setdefault(cell, list()).append(self.count)
+        self.boxes[self.count] = box
+        self.count += 1
+
+    def overlaps(self, boxes: ndarray) -> ndarray:
+        # how many indexed boxes each of the given boxes overlaps, from one lookup over the cells they span together
+        nearby = {index for cell in self._cells(box=(boxes[:, 0].min(), boxes[:, 1].min(), boxes[:, 2].max(),
+                                                     boxes[:, 3].max()))
+                  for index in self.cells.get(cell, list())}
+        if not nearby:
+            return zeros(shape=len(boxes), dtype=int)
+        others = self.boxes[list(nearby)]
+        return ((others[None, :, 0] < boxes[:, None, 2]) & (boxes[:, None, 0] < others[None, :, 2]) &
+                (others[None, :, 1] < boxes[:, None, 3]) & (boxes[:, None, 1] < others[None, :, 3])).sum(axis=1)
+
+
+def candidate_boxes(points: ndarray, sizes: ndarray, pad: float) -> ndarray:
+    # every candidate for every label at once, as (label, candidate, x0 y0 x1 y1) in points
+    x0 = points[:, None, 0] + CANDIDATES[None, :, 0] * sizes[:, None, 0] + CANDIDATES[None, :, 2] * pad
+    y0 = points[:, None, 1] + CANDIDATES[None, :, 1] * sizes[:, None, 1] + CANDIDATES[None, :, 3] * pad
+    return stack([x0, y0, x0 + sizes[:, None, 0], y0 + sizes[:, None, 1]], axis=-1)
+
+
+def place_labels(points: ndarray, sizes: ndarray, bounds: tuple, pad: float = 3.0, marker: float = 3.0) -> ndarray:
+    # greedy: each label takes its first candidate that overlaps nothing placed so far and stays inside the axes;
+    # with no free candidate it takes the least crowded one; returns the lower left corner of each label
+    boxes = candidate_boxes(points=points, pad=pad, sizes=sizes)
+    inside = ((boxes[..., 0] >= bounds[0]) & (boxes[..., 1] >= bounds[1]) & (boxes[..., 2] <= bounds[2]) &
+              (boxes[..., 3] <= bounds[3]))
+    # cells about the size of a typical label keep both the cells per box and the boxes per cell small
+    index = GridIndex(capacity=2 * len(points), cell=max(float(median(sizes[:, 0])), 2.0 * marker, 1.0))
+    # the markers are obstacles too, so labels do not cover other points; with marker no bigger than pad a label
+    # never collides with its own point
+    for point in points:
+        index.insert(box=array([point[0] - marker, point[1] - marker, point[0] + marker, point[1] + marker]))
+    result = boxes[:, 0, :2].copy()
+    for label in range(len(points)):
+        # argmin takes the first of the least crowded candidates, so a free candidate wins in order of preference
+        best = int(argmin(index.overlaps(boxes=boxes[label]) + where(inside[label], 0, len(points))))
+        index.insert(box=boxes[label, best])
+        result[label] = boxes[label, best, :2]
+    return result
+
+
+def draw_labels(ax: Axes, x: ndarray, y: ndarray, texts: list[str], fontsize='x-small', color: str = 'black',
+                pad: float = 3.0) -> None:
+    # points without a position or without any text get no label, as they got no visible one before
+    keep = isfinite(x) & isfinite(y) & array([bool(text.strip()) for text in texts], dtype=bool)
+    x, y, texts = x[keep], y[keep], [text for text, flag in zip(texts, keep) if flag]
+    if not texts:
+        return
+    properties = FontProperties(size=fontsize)
+    size = properties.get_size_in_points()
+    # work in points relative to the figure, the same units as the text paths; asking for the limits settles any
+    # pending autoscale first, so the data transform is the one the plot will be drawn with
+    ax.get_xlim(), ax.get_ylim()
+    to_points = 72.0 / ax.figure.dpi
+    points = ax.transData.transform(stack([x, y], axis=-1)) * to_points
+    bounds = tuple(ax.bbox.extents * to_points)
+    paths = [TextPath(xy=(0, 0), s=text, prop=properties, size=size) for text in texts]
+    # the control points bound the glyph curves, which is close enough for a box and far cheaper than get_extents
+    lows = array([path.vertices.min(axis=0) for path in paths])
+    sizes = array([path.vertices.max(axis=0) for path in paths]) - lows
+    corners = place_labels(bounds=bounds, pad=pad, points=points, sizes=sizes)
+    offsets = corners - points
+    if rcParams['text.usetex']:
+        # TeX labels cannot be batched into paths here, so they get one annotation each in the same places
+        for x_value, y_value, text, offset in zip(x, y, texts, offsets):
+            ax.annotate(text=text, xy=(x_value, y_value), xytext=tuple(offset), textcoords='offset points',
+                        fontproperties=properties, color=color, va='bottom', ha='left')
+        return
+    # move each path so its box sits at its offset from the point, then draw them all with one collection
+    paths = [path.transformed(Affine2D().translate(*(offset - low))) for path, low, offset in zip(paths, lows, offsets)]
+    collection = PathCollection(paths=paths, edgecolors='none', facecolors=color, linewidths=0,
+                                offset_transform=ax.transData, offsets=stack([x, y], axis=-1),
+                                transform=Affine2D().scale(1.0 / 72.0) + ax.figure.dpi_scale_trans, zorder=3)
+    ax.add_collection(collection=collection, autolim=False)
+
+
+# lower left corner of each candidate as (label widths, label heights, pads) from the point, in order of preference
+CANDIDATES = array([
+    [0.0, 0.0, 1.0, 1.0],  # above right, where the labels always went before
+    [-1.0, 0.0, -1.0, 1.0],  # above left
+    [0.0, -1.0, 1.0, -1.0],  # below right
+    [-1.0, -1.0, -1.0, -1.0],  # below left
+    [0.0, -0.5, 1.0, 0.0],  # right
+    [-1.0, -0.5, -1.0, 0.0],  # left
+    [-0.5, 0.0, 0.0, 1.0],  # above
+    [-0.5, -1.0, 0.0, -1.0],  # below
+])
@@ -7,14 +7,10 @@ from logging import basicConfig
 from logging import getLogger
 from pathlib import Path
 from typing import Optional
-from typing import Union
 
 from arrow import now
-from matplotlib.pyplot import close
 from matplotlib.pyplot import savefig
-from matplotlib.pyplot import subplots
 from pandas import DataFrame
-from pandas import read_excel
 from scipy.stats import linregress
 from seaborn import lineplot
 from seaborn import lmplot
@@ -22,7 +18,16 @@ from seaborn import regplot
 from seaborn import scatterplot
 from seaborn import set_style
 
+from common import read_excel_dataframe
+from common import stream_excel_dataframe
+from figures import release
+from figures import subplots
+from sources import fetch
+from tracing import span
+from tracing import traced
 
+
+@traced(category='plot')
 def make_plots(column_name: str, column_short_name: str, input_df: DataFrame, fname_short: str,
                scale: Optional[int] = 1) -> float:
     work_df = input_df[['Year', column_name, ]].copy(deep=True)
@@ -34,31 +39,25 @@ def make_plots(column_name: str, column_short_name: str, input_df: DataFrame, fn
     _ = lineplot(ax=axes_, data=work_df, x='Year', y=column_short_name)
     fname_ = '{}{}_lineplot.png'.format(OUTPUT_FOLDER, fname_short)
     savefig(format='png', fname=fname_, )
-    close(fig=figure_)
+    release(figure=figure_)
     figure_, axes_ = subplots()
     _ = scatterplot(ax=axes_, data=work_df, x='Year', y=column_short_name)
     fname_ = '{}{}_scatterplot.png'.format(OUTPUT_FOLDER, fname_short)
     savefig(format='png', fname=fname_, )
-    close(fig=figure_)
-    figure_, axes_ = subplots()
-    _ = lmplot(data=work_df, line_kws={'color': 'orange'}, x='Year', y=column_short_name, )
+    release(figure=figure_)
+    grid_ = lmplot(data=work_df, line_kws={'color': 'orange'}, x='Year', y=column_short_name, )
     fname_ = '{}{}_lmplot.png'.format(OUTPUT_FOLDER, fname_short)
     savefig(format='png', fname=fname_, )
-    close(fig=figure_)
+    release(figure=grid_.figure)
     figure_, axes_ = subplots()
     _ = regplot(data=work_df, line_kws={'color': 'orange'}, x='Year', y=column_short_name, )
     fname_ = '{}{}_regplot.png'.format(OUTPUT_FOLDER, fname_short)
     savefig(format='png', fname=fname_, )
-    close(fig=figure_)
+    release(figure=figure_)
     rvalue = linregress(x=work_df['Year'], y=work_df[column_short_name]).rvalue
     return rvalue * rvalue
 
 
-def read_excel_dataframe(io: str, header: int, usecols: Optional[Union[list, int]]) -> DataFrame:
-    result_df = read_excel(engine='openpyxl', header=header, io=io, usecols=usecols)
-    return result_df
-
-
 COLUMNS = ['Index', 'Variant', 'Region, subregion, country or area *', 'Notes',
            'Location code', 'ISO3 Alpha-code', 'ISO2 Alpha-code', 'SDMX code**',
            'Type', 'Parent code', 'Year',
@@ -114,7 +113,6 @@ COLUMNS = ['Index', 'Variant', 'Region, subregion, country or area *', 'Notes',
            'Net Number of Migrants (thousands)',
            'Net Migration Rate (per 1,000 population)']
 DATA_FOLDER = './data/'
-INPUT_FILE = 'WPP2022_GEN_F01_DEMOGRAPHIC_INDICATORS_COMPACT_REV1.xlsx'
 OUTPUT_FOLDER = './plot/'
 SAVE_WORLD_DATA = False
 SEABORN_STYLE = 'darkgrid'
@@ -144,11 +142,10 @@ if __name__ == '__main__':
         Path(folder).mkdir(parents=True, exist_ok=True)
 
     if SAVE_WORLD_DATA:
-        data_file = DATA_FOLDER + INPUT_FILE
-        df = read_excel_dataframe(io=data_file, header=16, usecols=USECOLS)
-        LOGGER.info('loaded %d rows from %s', len(df), data_file)
-        # filter for the data we want and make a copy because we need to add columns
-        world_df = df[df['Region, subregion, country or area *'] == 'WORLD'].copy(deep=True)
+        data_file = str(fetch(name='wpp'))
+        # the WORLD location code is 900; we only stream those rows out of the workbook
+        world_df = stream_excel_dataframe(io=data_file, header=16, usecols=USECOLS, location_codes={900})
+        LOGGER.info('loaded %d rows from %s', len(world_df), data_file)
         # add dates for the two total population values
         world_df['January'] = world_df['Year'].apply(lambda x: date(year=int(x), month=1, day=1))
         world_df['July'] = world_df['Year'].apply(lambda x: date(year=int(x), month=7, day=1))
@@ -165,23 +162,25 @@ if __name__ == '__main__':
     set_style(style=SEABORN_STYLE)
 
     # combine the two sets of date/population values
-    population = dict(zip(world_df['January'], world_df['Total Population, as of 1 January (thousands)'])) | dict(
-        zip(world_df['July'], world_df['Total Population, as of 1 July (thousands)']))
-    # build the population DataFrame
-    population_df = DataFrame(
-        data={'date': list(population.keys()), 'population': list(population.values())}).sort_values(
-        by='date').reset_index(drop=True)
-    population_df['population'] = 1000 * population_df['population']
-
-    figure_population_scatter, axes_population_scatter = subplots()
-    result_scatter = scatterplot(ax=axes_population_scatter, data=population_df, x='date', y='population')
-    savefig(fname=OUTPUT_FOLDER + 'population_scatter.png', format='png')
-    close(fig=figure_population_scatter)
-
-    figure_population_line, axes_population_line = subplots()
-    result_line = lineplot(ax=axes_population_line, data=population_df, x='date', y='population')
-    savefig(fname=OUTPUT_FOLDER + 'population_line.png', format='png')
-    close(fig=figure_population_line)
+    with span(name='population by date', category='compute'):
+        population = dict(zip(world_df['January'], world_df['Total Population, as of 1 January (thousands)'])) | dict(
+            zip(world_df['July'], world_df['Total Population, as of 1 July (thousands)']))
+        # build the population DataFrame
+        population_df = DataFrame(
+            data={'date': list(population.keys()), 'population': list(population.values())}).sort_values(
+            by='date').reset_index(drop=True)
+        population_df['population'] = 1000 * population_df['population']
+
+    with span(name='population plots', category='plot'):
+        figure_population_scatter, axes_population_scatter = subplots()
+        result_scatter = scatterplot(ax=axes_population_scatter, data=population_df, x='date', y='population')
+        savefig(fname=OUTPUT_FOLDER + 'population_scatter.png', format='png')
+        release(figure=figure_population_scatter)
+
+        figure_population_line, axes_population_line = subplots()
+        result_line = lineplot(ax=axes_population_line, data=population_df, x='date', y='population')
+        savefig(fname=OUTPUT_FOLDER + 'population_line.png', format='png')
+        release(figure=figure_population_line)
     LOGGER.info('saved population plot')
 
     # plot the global July population
@@ -0,0 +1,40 @@
+"""
+Load Excel data and write the memory-mapped indicator cube
+"""
+from logging import INFO
+from logging import basicConfig
+from logging import getLogger
+from pathlib import Path
+
+from arrow import now
+
+from common import COLUMNS
+from common import file_hash
+from common import read_excel_dataframe
+from cube import build_cube
+from sources import fetch
+from tracing import span
+
+DATA_FOLDER = './data/'
+OUTPUT_FOLDER = './data/cube/'
+
+if __name__ == '__main__':
+    TIME_START = now()
+    LOGGER = getLogger(__name__, )
+    basicConfig(format='%(asctime)s : %(name)s : %(levelname)s : %(message)s', level=INFO, )
+    LOGGER.info('started')
+
+    for folder in [DATA_FOLDER, OUTPUT_FOLDER]:
+        LOGGER.info('creating folder %s if it does not exist', folder)
+        Path(folder).mkdir(parents=True, exist_ok=True)
+
+    data_file = str(fetch(name='wpp'))
+    df = read_excel_dataframe(io=data_file, header=16, usecols=COLUMNS)
+    LOGGER.info('loaded %d rows from %s', len(df), data_file)
+    df = df[df['Type'] != 'Label/Separator']
+
+    with span(name='build cube', category='compute'):
+        build_cube(input_df=df, folder=OUTPUT_FOLDER, source_hash=file_hash(path=data_file))
+    LOGGER.info('wrote cube for %d locations to %s', df['Location code'].nunique(), OUTPUT_FOLDER)
+
+    LOGGER.info('total time: {:5.2f}s'.format((now() - TIME_START).total_seconds()))
@@ -11,15 +11,25 @@ from arrow import now
 from pandas import DataFrame
 from pandas import to_datetime
 from plotly.express import scatter
-from plotly.io import to_html
+from plotly.graph_objects import Figure
 
 from common import read_excel_dataframe
+from report import build_site
+from sources import fetch
+from tracing import span
+
+
+def population_scatter(population_df: DataFrame) -> Figure:
+    # todo put dates on the x axis ticks
+    return scatter(data_frame=population_df, height=400, title='World Population 1/1950 to 7/2021', trendline='ols',
+                   x='serialtime', y='population', ).update_xaxes(tickvals=population_df['date'], title='date', )
+
 
 DATA_FOLDER = './data/'
-INPUT_FILE = 'WPP2022_GEN_F01_DEMOGRAPHIC_INDICATORS_COMPACT_REV1.xlsx'
+MARKDOWN_PAGE = '\n\n'.join(['# World population', 'The world population on 1 January and 1 July of each year.',
+                              '{{chart:scatter_with_trendline}}'])
 OUTPUT_FOLDER = './divs/'
 SAVE_WORLD_DATA = False
-URL = 'https://population.un.org/wpp/Download/Standard/MostUsed/'
 USECOLS = [
     'Crude Death Rate (deaths per 1,000 population)',
     'Region, subregion, country or area *',
@@ -48,13 +58,10 @@ if __name__ == '__main__':
         world_df = read_excel_dataframe(io=world_file, header=0, usecols=usecols)
         LOGGER.info('loaded %d rows from %s', len(world_df), WORLD_DATA_FILE)
     else:
-        data_file = DATA_FOLDER + INPUT_FILE
-        if not Path(data_file).exists():
-            df = read_excel_dataframe(io=URL + INPUT_FILE, header=16, usecols=USECOLS)
-            LOGGER.info('loaded %d rows from %s %s', len(df), URL, INPUT_FILE)
-        else:
-            df = read_excel_dataframe(io=data_file, header=16, usecols=USECOLS)
-            LOGGER.info('loaded %d rows from %s', len(df), data_file)
+        # the local copy of the workbook; it is downloaded only when asked for (see sources.py)
+        data_file = str(fetch(name='wpp'))
+        df = read_excel_dataframe(io=data_file, header=16, usecols=USECOLS)
+        LOGGER.info('loaded %d rows from %s', len(df), data_file)
         # filter for the data we want and make a copy because we need to add columns
         world_df = df[df['Region, subregion, country or area *'] == 'WORLD'].copy(deep=True)
         # add dates for the two total population values
@@ -65,27 +72,23 @@ if __name__ == '__main__':
         LOGGER.info('wrote %d rows to %s', len(world_df), WORLD_DATA_FILE)
 
     # combine the two sets of date/population values
-    population = dict(zip(world_df['January'], world_df['Total Population, as of 1 January (thousands)'])) | dict(
-        zip(world_df['July'], world_df['Total Population, as of 1 July (thousands)']))
-    # build the population DataFrame
-    population_df = DataFrame(
-        data={
-            'date': list(population.keys()),
-            'date-as-date': [to_datetime(arg=item) for item in list(population.keys())],
-            'population': [1000 * item for item in population.values()]
-        }
-    ).sort_values(by='date').reset_index(drop=True)
-    min_date = population_df['date-as-date'].min().to_pydatetime().date()
-    population_df['serialtime'] = population_df['date-as-date'].apply(
-        lambda x: (x.to_pydatetime().date() - min_date).days)
-    # todo put dates on the x axis ticks
-    population_with_trendline_plot = scatter(data_frame=population_df, height=400,
-                                             title='World Population 1/1950 to 7/2021',
-                                             trendline='ols', x='serialtime', y='population',
-                                             ).update_xaxes(tickvals=population_df['date'], title='date', )
-
-    with open(file=OUTPUT_FOLDER + 'world_population.scatter_with_trendline.txt', mode='w') as output_fp:
-        output_fp.write(to_html(fig=population_with_trendline_plot, full_html=False))
+    with span(name='population', category='compute'):
+        population = dict(zip(world_df['January'], world_df['Total Population, as of 1 January (thousands)'])) | dict(
+            zip(world_df['July'], world_df['Total Population, as of 1 July (thousands)']))
+        # build the population DataFrame
+        population_df = DataFrame(
+            data={
+                'date': list(population.keys()),
+                'date-as-date': [to_datetime(arg=item) for item in list(population.keys())],
+                'population': [1000 * item for item in population.values()]
+            }
+        ).sort_values(by='date').reset_index(drop=True)
+        min_date = population_df['date-as-date'].min().to_pydatetime().date()
+        population_df['serialtime'] = population_df['date-as-date'].apply(
+            lambda x: (x.to_pydatetime().date() - min_date).days)
+    # the chart goes into the report page rather than a div file of its own; it is drawn again only when it changes
+    build_site(charts={'scatter_with_trendline': {'chart': population_scatter, 'population_df': population_df}},
+               folder=OUTPUT_FOLDER, pages={'world_population': MARKDOWN_PAGE}, title='World population')
 
     LOGGER.info('saved population plot')
 
@@ -6,31 +6,25 @@ from logging import INFO
 from logging import basicConfig
 from logging import getLogger
 from pathlib import Path
-from typing import Optional
-from typing import Union
 
 from arrow import now
-from matplotlib.pyplot import close
 from matplotlib.pyplot import savefig
-from matplotlib.pyplot import subplots
 from pandas import DataFrame
-from pandas import read_excel
 from seaborn import lineplot
 from seaborn import scatterplot
 from seaborn import set_style
 
-
-def read_excel_dataframe(io: str, header: int, usecols: Optional[Union[list, int]]) -> DataFrame:
-    result_df = read_excel(engine='openpyxl', header=header, io=io, usecols=usecols)
-    return result_df
+from common import read_excel_dataframe
+from figures import release
+from figures import subplots
+from sources import fetch
+from tracing import span
 
 
 DATA_FOLDER = './data/'
 FIGSIZE = (16, 9)
-INPUT_FILE = 'WPP2022_GEN_F01_DEMOGRAPHIC_INDICATORS_COMPACT_REV1.xlsx'
 OUTPUT_FOLDER = './divs/'
 SAVE_WORLD_DATA = False
-URL = 'https://population.un.org/wpp/Download/Standard/MostUsed/'
 USECOLS = [
     'Region, subregion, country or area *',
     'Total Population, as of 1 January (thousands)',
@@ -57,13 +51,10 @@ if __name__ == '__main__':
         world_df = read_excel_dataframe(io=world_file, header=0, usecols=usecols)
         LOGGER.info('loaded %d rows from %s', len(world_df), WORLD_DATA_FILE)
     else:
-        data_file = DATA_FOLDER + INPUT_FILE
-        if not Path(data_file).exists():
-            df = read_excel_dataframe(io=URL + INPUT_FILE, header=16, usecols=USECOLS)
-            LOGGER.info('loaded %d rows from %s %s', len(df), URL, INPUT_FILE)
-        else:
-            df = read_excel_dataframe(io=data_file, header=16, usecols=USECOLS)
-            LOGGER.info('loaded %d rows from %s', len(df), data_file)
+        # the local copy of the workbook; it is downloaded only when asked for (see sources.py)
+        data_file = str(fetch(name='wpp'))
+        df = read_excel_dataframe(io=data_file, header=16, usecols=USECOLS)
+        LOGGER.info('loaded %d rows from %s', len(df), data_file)
         # filter for the data we want and make a copy because we need to add columns
         world_df = df[df['Region, subregion, country or area *'] == 'WORLD'].copy(deep=True)
         # add dates for the two total population values
@@ -74,26 +65,27 @@ if __name__ == '__main__':
         LOGGER.info('wrote %d rows to %s', len(world_df), WORLD_DATA_FILE)
 
     # combine the two sets of date/population values
-    population = dict(zip(world_df['January'], world_df['Total Population, as of 1 January (thousands)'])) | dict(
-        zip(world_df['July'], world_df['Total Population, as of 1 July (thousands)']))
-    # build the population DataFrame
-    population_df = DataFrame(
-        data={
-            'date': list(population.keys()),
-            'population': [1000 * item for item in population.values()]
-        }
-    ).sort_values(by='date').reset_index(drop=True)
+    with span(name='population', category='compute'):
+        population = dict(zip(world_df['January'], world_df['Total Population, as of 1 January (thousands)'])) | dict(
+            zip(world_df['July'], world_df['Total Population, as of 1 July (thousands)']))
+        # build the population DataFrame
+        population_df = DataFrame(
+            data={
+                'date': list(population.keys()),
+                'population': [1000 * item for item in population.values()]
+            }
+        ).sort_values(by='date').reset_index(drop=True)
 
     set_style(style='darkgrid')
     figure, axes = subplots(figsize=FIGSIZE)
     plot_line = lineplot(data=population_df, x='date', y='population', ax=axes)
     savefig(format='png', fname=OUTPUT_FOLDER + 'world_population_lineplot.png')
-    close(fig=figure)
+    release(figure=figure)
 
     figure, axes = subplots(figsize=FIGSIZE)
     plot_scatter = scatterplot(data=population_df, x='date', y='population', ax=axes)
     savefig(format='png', fname=OUTPUT_FOLDER + 'world_population_scatterplot.png')
-    close(fig=figure)
+    release(figure=figure)
 
     LOGGER.info('saved population plot')
 
@@ -0,0 +1,178 @@
+"""
+Opt-in memory accounting: peak Python allocations, process RSS, top allocation sites and live DataFrames per stage
+"""
+from atexit import register
+from gc import collect
+from gc import get_objects
+from json import dump
+from logging import getLogger
+from os import environ
+from os import getpid
+from os import sysconf
+from pathlib import Path
+from resource import RUSAGE_SELF
+from resource import getrusage
+from threading import Thread
+from time import sleep
+from tracemalloc import Filter
+from tracemalloc import get_traced_memory
+from tracemalloc import is_tracing
+from tracemalloc import reset_peak
+from tracemalloc import start
+from tracemalloc import take_snapshot
+from typing import Optional
+
+from pandas import DataFrame
+
+
+def current_rss() -> int:
+    # /proc has the resident set right now; elsewhere the high-water mark is the best we can get
+    try:
+        with open(file='/proc/self/statm', mode='r') as input_fp:
+            return int(input_fp.read().split()[1]) * PAGE_SIZE
+    except OSError:
+        return getrusage(RUSAGE_SELF).ru_maxrss * 1024
+
+
+def sample_rss() -> None:
+    while True:
+        rss = current_rss()
+        for usage in list(ACTIVE):
+            usage.rss_peak = max(usage.rss_peak, rss)
+        sleep(RSS_INTERVAL)
+
+
+def start_sampler() -> None:
+    # threads do not survive a fork, so each worker process starts its own sampler the first time it needs one
+    global SAMPLER_PID
+    if SAMPLER_PID != getpid():
+        SAMPLER_PID = getpid()
+        Thread(daemon=True, name='rss-sampler', target=sample_rss).start()
+
+
+def site_statistics(before, after) -> list[dict]:
+    # the sites whose live allocations grew the most between the two snapshots
+    filters = [Filter(inclusive=False, filename_pattern=pattern) for pattern in EXCLUDED_SITES]
+    differences = after.filter_traces(filters).compare_to(key_type='lineno',
+                                                          old_snapshot=before.filter_traces(filters))
+    return [{'count_diff': item.count_diff, 'site': '{}:{}'.format(item.traceback[0].filename,
+                                                                    item.traceback[0].lineno),
+             'size_diff_bytes': item.size_diff} for item in differences[:TOP_SITES] if item.size_diff > 0]
+
+
+def live_frames(namespace: dict) -> list[dict]:
+    # name each frame after the variable or memo entry that holds it; frames that share blocks count more than once
+    from common import DATASETS
+    names = {id(value): name for name, value in namespace.items() if isinstance(value, DataFrame)}
+    names |= {id(value): 'DATASETS[{}]'.format(key[0]) for key, value in DATASETS.items()}
+    collect()
+    result = [{'bytes': int(item.memory_usage(deep=True, index=True).sum()), 'columns': item.shape[1],
+               'name': names.get(id(item)), 'rows': item.shape[0]} for item in get_objects()
+              if isinstance(item, DataFrame)]
+    return sorted(result, key=lambda item: item['bytes'], reverse=True)
+
+
+class Usage:
+    def __init__(self, name: str, category: str, sites: bool):
+        self.category = category
+        self.name = name
+        self.namespace = None
+        self.peak = 0
+        self.rss_peak = 0
+        self.rss_start = 0
+        self.sites = sites
+        self.snapshot = None
+        self.start = 0
+
+    def watch(self, namespace: dict) -> None:
+        # the frames still reachable from this namespace when the block ends go in the record
+        self.namespace = namespace
+
+    def __enter__(self):
+        start_sampler()
+        self.snapshot = take_snapshot() if self.sites else None
+        self.start, peak = get_traced_memory()
+        # tracemalloc has one peak for the whole process, so fold it into any enclosing block before resetting it
+        for usage in ACTIVE:
+            usage.peak = max(usage.peak, peak)
+        reset_peak()
+        self.rss_start = self.rss_peak = current_rss()
+        ACTIVE.append(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        ACTIVE.remove(self)
+        end, peak = get_traced_memory()
+        self.peak = max(self.peak, peak)
+        for usage in ACTIVE:
+            usage.peak = max(usage.peak, peak)
+        rss_end = current_rss()
+        record = {'category': self.category, 'name': self.name, 'peak_bytes': self.peak - self.start,
+                  'pid': getpid(), 'retained_bytes': end - self.start, 'rss_end_bytes': rss_end,
+                  'rss_peak_bytes': max(self.rss_peak, rss_end), 'rss_start_bytes': self.rss_start}
+        if self.sites:
+            record['sites'] = site_statistics(after=take_snapshot(), before=self.snapshot)
+            record['frames'] = live_frames(namespace=self.namespace or dict())
+        RECORDS.append(record)
+        self.namespace = self.snapshot = None
+        return False
+
+
+class NullUsage:
+    def watch(self, namespace: dict) -> None:
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+def measure(name: str, category: str = 'stage', sites: bool = False):
+    # sites adds the allocation sites and live frames, which need two snapshots and a full garbage collection
+    if not ENABLED:
+        return NULL_USAGE
+    return Usage(category=category, name=name, sites=sites)
+
+
+def drain_records() -> list[dict]:
+    # worker processes hand their records back to the parent, which writes the one report
+    result = RECORDS.copy()
+    RECORDS.clear()
+    return result
+
+
+def add_records(records: list[dict]) -> None:
+    RECORDS.extend(records)
+
+
+def write_report(path: str) -> None:
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    with open(file=path, mode='w') as output_fp:
+        dump(fp=output_fp, indent=2, obj={'records': RECORDS})
+    LOGGER.info('wrote %d memory records to %s', len(RECORDS), path)
+    for record in sorted(RECORDS, key=lambda item: item['peak_bytes'], reverse=True)[:SUMMARY_ROWS]:
+        LOGGER.info('%-40s %-8s %10.1f MB peak %10.1f MB RSS peak', record['name'], record['category'],
+                    record['peak_bytes'] / 2 ** 20, record['rss_peak_bytes'] / 2 ** 20)
+
+
+ACTIVE = list()
+# allocations made by the accounting itself are left out of the sites
+EXCLUDED_SITES = [__file__, '<frozen *>', '*/tracemalloc.py']
+LOGGER = getLogger(__name__, )
+NULL_USAGE = NullUsage()
+PAGE_SIZE = sysconf('SC_PAGE_SIZE')
+RECORDS = list()
+RSS_INTERVAL = 0.05
+SAMPLER_PID: Optional[int] = None
+SUMMARY_ROWS = 20
+TOP_SITES = 10
+# set MEMORY_FILE to a path to turn memory accounting on; the report is written there when the process exits
+MEMORY_FILE = environ.get('MEMORY_FILE')
+ENABLED = MEMORY_FILE is not None
+
+if ENABLED:
+    if not is_tracing():
+        start()
+    register(write_report, MEMORY_FILE)
@@ -0,0 +1,186 @@
+"""
+Run the analysis scripts as stages of one pipeline that loads each data source once
+"""
+from argparse import ArgumentParser
+from logging import INFO
+from logging import basicConfig
+from logging import getLogger
+from multiprocessing import get_context
+from multiprocessing.connection import Connection
+from multiprocessing.connection import wait
+from os import cpu_count
+from os import environ
+from pathlib import Path
+from runpy import run_path
+from typing import Optional
+
+# scipy and seaborn are only imported here so the forked stages find them already loaded
+import scipy.stats
+import seaborn
+from arrow import now
+from matplotlib import use
+
+import cause_of_death
+import project_hal
+import read_cdc
+import vietnam
+from common import load_excel_dataset
+from figures import FigureScope
+from memory import add_records
+from memory import drain_records
+from memory import measure
+from sources import fetch
+from tracing import add_events
+from tracing import drain_events
+from tracing import span
+
+
+def load_sources(names: set[str]) -> set[str]:
+    # the loaders put their frames in common.DATASETS, which the forked stages inherit for free
+    failed = set()
+    for name in sorted(names):
+        time_start = now()
+        try:
+            with span(name=name, category='source'), measure(name=name, category='source'):
+                SOURCES[name]()
+            LOGGER.info('loaded source %s in %5.2fs', name, (now() - time_start).total_seconds())
+        except Exception as exception:
+            LOGGER.warning('could not load source %s: %s: %s', name, type(exception).__name__, exception)
+            failed.add(name)
+    return failed
+
+
+def run_stage(name: str) -> tuple[str, Optional[str], list[dict], list[dict]]:
+    # the script runs as if it were started from the command line, but with the datasets already in memory
+    time_start = now()
+    # a forked stage starts with a copy of the parent's trace events and memory records, which the parent already has
+    drain_events()
+    drain_records()
+    try:
+        with FigureScope(name=name), span(name=name, category='stage'), measure(name=name, category='stage',
+                                                                                sites=True) as usage:
+            usage.watch(namespace=run_path(path_name=str(Path(__file__).parent / STAGES[name]['script']),
+                                           run_name='__main__'))
+        LOGGER.info('stage %s finished in %5.2fs', name, (now() - time_start).total_seconds())
+        return name, None, drain_events(), drain_records()
+    except Exception as exception:
+        return name, '{}: {}'.format(type(exception).__name__, exception), drain_events(), drain_records()
+
+
+def stage_process(name: str, connection: Connection, render_workers: int) -> None:
+    # a stage that renders in a pool of its own gets its share of the CPUs, not all of them
+    environ['RENDER_WORKERS'] = str(render_workers)
+    connection.send(run_stage(name=name))
+    connection.close()
+
+
+def run_stages(names: list[str], workers: int) -> dict[str, Optional[str]]:
+    # a stage starts as soon as every stage it depends on has finished; a failure skips everything downstream
+    failed_sources = load_sources(names={source for name in names for source in STAGES[name]['sources']})
+    results = dict()
+    for name in names:
+        missing = failed_sources & set(STAGES[name]['sources'])
+        if missing:
+            results[name] = 'missing source {}'.format(', '.join(sorted(missing)))
+    pending = [name for name in names if name not in results.keys()]
+    # every stage gets a fresh fork of this process, so the globals, styles and figures one stage leaves behind never
+    # reach the next; at most workers of them run at a time
+    context, running = get_context('fork'), dict()
+    while pending or running:
+        for name in list(pending):
+            after = [item for item in STAGES[name]['after'] if item in names]
+            if any(results.get(item) is not None for item in after):
+                results[name] = 'skipped because {} failed'.format(
+                    ', '.join(item for item in after if results.get(item) is not None))
+                pending.remove(name)
+            elif len(running) < max(1, workers) and all(item in results.keys() for item in after):
+                LOGGER.info('starting stage %s', name)
+                reader, writer = context.Pipe(duplex=False)
+                process = context.Process(args=(name, writer, max(1, (cpu_count() or 1) // max(1, workers))),
+                                          name=name, target=stage_process)
+                process.start()
+                # the parent keeps only the reading end, so a stage that dies shows up as the end of its pipe
+                writer.close()
+                running[reader] = (name, process)
+                pending.remove(name)
+        if not running:
+            for name in pending:
+                results[name] = 'stage dependencies form a cycle'
+            break
+        for reader in wait(object_list=list(running.keys())):
+            name, process = running.pop(reader)
+            try:
+                _, error, events, records = reader.recv()
+            except EOFError:
+                # the stage ended without reporting: a sys.exit in the script, or a crash
+                error, events, records = None, list(), list()
+            reader.close()
+            process.join()
+            add_events(events=events)
+            add_records(records=records)
+            if error is None and process.exitcode != 0:
+                error = 'stage exited with code {}'.format(process.exitcode)
+            results[name] = error
+    return results
+
+
+LOGGER = getLogger(__name__, )
+# the WPP workbook is shared by most of the stages; the other sources each feed one or two
+SOURCES = {
+    'cdc_wonder': lambda: read_cdc.read_url_csv(url=read_cdc.DATA_FOLDER + read_cdc.INPUT_FILE),
+    'dcas': lambda: vietnam.get_dcas_dataframe(path=str(fetch(name='dcas')), usecols=vietnam.USECOLS),
+    'hal': lambda: project_hal.get_excel_dataframe(name='hal'),
+    'owid': lambda: cause_of_death.read_csv_dataframe(
+        filepath_or_buffer=cause_of_death.DATA_FOLDER + cause_of_death.INPUT_FILE),
+    'wpp': lambda: load_excel_dataset(io=str(fetch(name='wpp')), header=16),
+}
+# after lists the stages whose output files a stage reads
+STAGES = {
+    'aggregate_lynching': {'after': [], 'script': 'aggregate_lynching.py', 'sources': ['hal']},
+    'aggregates': {'after': [], 'script': 'aggregates.py', 'sources': ['wpp']},
+    'asia': {'after': [], 'script': 'asia.py', 'sources': ['wpp']},
+    'basic_relplot': {'after': [], 'script': 'basic_relplot.py', 'sources': ['wpp']},
+    'cause_of_death': {'after': [], 'script': 'cause_of_death.py', 'sources': ['owid']},
+    'cdc_lineplots': {'after': ['read_cdc'], 'script': 'cdc_lineplots.py', 'sources': []},
+    'cdc_top_ten': {'after': [], 'script': 'cdc_top_ten.py', 'sources': []},
+    'continent': {'after': [], 'script': 'continent.py', 'sources': ['wpp']},
+    'crude_death': {'after': [], 'script': 'crude_death.py', 'sources': []},
+    'individual_countries': {'after': ['make_cube'], 'script': 'individual_countries.py', 'sources': ['wpp']},
+    'main': {'after': ['make_world_population_div'], 'script': 'main.py', 'sources': []},
+    'make_csv': {'after': [], 'script': 'make_csv.py', 'sources': ['wpp']},
+    'make_cube': {'after': [], 'script': 'make_cube.py', 'sources': ['wpp']},
+    'make_world_population_div': {'after': [], 'script': 'make_world_population_div.py', 'sources': ['wpp']},
+    'make_world_population_gradient_png': {'after': ['make_world_population_div'],
+                                           'script': 'make_world_population_gradient_png.py', 'sources': []},
+    'make_world_population_png': {'after': ['make_world_population_div'],
+                                  'script': 'make_world_population_png.py', 'sources': []},
+    'project_hal': {'after': [], 'script': 'project_hal.py', 'sources': ['hal']},
+    'read_cdc': {'after': [], 'script': 'read_cdc.py', 'sources': ['cdc_wonder']},
+    'south_america': {'after': [], 'script': 'south_america.py', 'sources': ['wpp']},
+    'umkc_lynchings': {'after': [], 'script': 'umkc_lynchings.py', 'sources': []},
+    'vietnam': {'after': [], 'script': 'vietnam.py', 'sources': ['dcas']},
+}
+
+if __name__ == '__main__':
+    TIME_START = now()
+    basicConfig(format='%(asctime)s : %(name)s : %(levelname)s : %(message)s', level=INFO, )
+    LOGGER.info('started')
+
+    parser = ArgumentParser(description=__doc__.strip())
+    parser.add_argument('stages', metavar='stage', nargs='*',
+                        help='stages to run (default: all of them)')
+    parser.add_argument('--workers', default=cpu_count(), type=int, help='stages to run at the same time')
+    arguments = parser.parse_args()
+    for unknown in sorted(set(arguments.stages) - set(STAGES.keys())):
+        parser.error('unknown stage {} (choose from {})'.format(unknown, ', '.join(sorted(STAGES.keys()))))
+
+    # every stage draws into files, and the forked workers must not inherit an interactive backend
+    use('Agg')
+    stage_results = run_stages(names=arguments.stages or list(STAGES.keys()), workers=arguments.workers)
+    for stage_name, stage_error in stage_results.items():
+        if stage_error is not None:
+            LOGGER.warning('stage %s failed: %s', stage_name, stage_error)
+    LOGGER.info('%d of %d stages succeeded', sum(error is None for error in stage_results.values()),
+                len(stage_results))
+
+    LOGGER.info('total time: {:5.2f}s'.format((now() - TIME_START).total_seconds()))
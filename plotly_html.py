@@ -0,0 +1,108 @@
+"""
+Write plotly pages and divs that share one copy of plotly.js per folder, with WebGL for traces with many points
+"""
+from os import getpid
+from pathlib import Path
+from typing import Optional
+
+from numpy import arange
+from numpy import argsort
+from numpy import asarray
+from numpy import flatnonzero
+from numpy import isfinite
+from numpy import lexsort
+from numpy import ndarray
+from numpy import r_
+from numpy import sort
+from numpy import unique
+from plotly import __version__ as plotly_version
+from plotly.graph_objects import Figure
+from plotly.graph_objects import Scattergl
+from plotly.io import to_html
+from plotly.offline import get_plotlyjs
+
+
+def plotly_script(folder: str) -> str:
+    # the bundle goes next to the pages once, named for its version so a published page never gets a stale copy
+    name = 'plotly-{}.min.js'.format(plotly_version)
+    path = Path(folder) / name
+    if not path.exists():
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # stages running side by side may write the same folder, so each writes its own file and swaps it in
+        partial = path.with_name('{}.{}.partial'.format(name, getpid()))
+        partial.write_text(data=get_plotlyjs(), encoding='utf-8')
+        partial.replace(path)
+    return name
+
+
+def decimate(y: ndarray, points: int) -> ndarray:
+    # the positions to keep: the lowest and highest value in each of points / 2 runs of neighbors, and both ends,
+    # so the peaks and troughs of a line survive; a run with missing values also keeps its first one, so the line
+    # still breaks where the gap is instead of joining across it
+    count = len(y)
+    buckets = arange(count) * max(1, points // 2) // count
+    # missing values sort last in their run, and ties keep their order, so a run's first missing value comes first
+    order = lexsort((y, buckets))
+    starts = flatnonzero(r_[True, buckets[order][1:] != buckets[order][:-1]])
+    finite = isfinite(y[order])
+    lowest = order[starts][finite[starts]]
+    # the last finite value of each run is its highest
+    highest = [order[start:end][finite[start:end]][-1] for start, end in zip(starts, r_[starts[1:], count]) if
+               finite[start:end].any()]
+    missing = order[~finite]
+    _, first_missing = unique(buckets[missing], return_index=True)
+    return unique(r_[0, lowest, asarray(highest, dtype=int), missing[first_missing], count - 1])
+
+
+def decimation_order(trace) -> Optional[ndarray]:
+    # runs of neighbors are runs along the line as drawn, which is the order of the points; markers without lines
+    # are drawn in no order, so their neighbors are their neighbors in x, and they are put in x order first. None
+    # means the points cannot be put in order (markers on a category axis) and are left as they are
+    x = asarray(trace.x)
+    if 'lines' in (trace.mode or 'lines'):
+        return arange(len(x))
+    return argsort(x, kind='stable') if x.dtype.kind in 'fiuM' else None
+
+
+def to_webgl(figure: Figure, threshold: int = 5000, points: Optional[int] = None) -> Figure:
+    # scatter traces longer than threshold draw with WebGL; with points, they are also cut down to about that many
+    data = list()
+    for trace in figure.data:
+        # plotly express already picks WebGL for long traces, which may still need cutting down
+        if trace.type not in {'scatter', 'scattergl'} or trace.x is None or len(trace.x) <= threshold:
+            data.append(trace)
+            continue
+        properties = trace.to_plotly_json()
+        properties.pop('type')
+        # a few scatter settings have no WebGL version (spline lines, for one); those fall back to the defaults
+        webgl = Scattergl(properties, skip_invalid=True)
+        count = len(trace.x)
+        order = None if points is None or count <= points or trace.y is None else decimation_order(trace=trace)
+        if order is not None:
+            keep = sort(order[decimate(points=points, y=asarray(trace.y, dtype=float)[order])])
+            # the trace gives back plain arrays even where its JSON holds them packed as typed arrays
+            for key in ARRAY_PROPERTIES:
+                value = trace[key]
+                if value is not None and not isinstance(value, str) and hasattr(value, '__len__') and len(
+                        value) == count:
+                    webgl[key] = asarray(value)[keep]
+        data.append(webgl)
+    return Figure(data=data, layout=figure.layout)
+
+
+def write_page(figure: Figure, path: str, threshold: int = 5000, points: Optional[int] = None) -> None:
+    script = plotly_script(folder=str(Path(path).parent))
+    to_webgl(figure=figure, points=points, threshold=threshold).write_html(file=path, include_plotlyjs=script)
+
+
+def page_div(figure: Figure, folder: str, threshold: int = 5000, points: Optional[int] = None) -> str:
+    # a div for a page in folder; it loads the shared bundle from there instead of carrying its own
+    return to_html(fig=to_webgl(figure=figure, points=points, threshold=threshold), full_html=False,
+                   include_plotlyjs=plotly_script(folder=folder))
+
+
+# the per-point arrays of a scatter trace, nested ones included, cut down together when a trace is decimated
+ARRAY_PROPERTIES = ['customdata', 'error_x.array', 'error_x.arrayminus', 'error_y.array', 'error_y.arrayminus',
+                    'hovertemplate', 'hovertext', 'ids', 'marker.color', 'marker.line.color', 'marker.line.width',
+                    'marker.opacity', 'marker.size', 'marker.symbol', 'text', 'textfont.color', 'textfont.size',
+                    'texttemplate', 'x', 'y']
@@ -2,29 +2,41 @@
 Load Project HAL data and build a graph
 """
 
-from datetime import date
 from logging import INFO
 from logging import basicConfig
 from logging import getLogger
 
 from arrow import now
-from matplotlib.pyplot import close
 from matplotlib.pyplot import savefig
-from matplotlib.pyplot import subplots
 from matplotlib.pyplot import title
+from numpy import int64
 from pandas import DataFrame
 from pandas import read_excel
-from seaborn import histplot
+from pandas import to_numeric
 
+from common import dataset_key
+from common import remember_dataset
+from events import event_counts
+from events import plot_counts
+from figures import release
+from figures import subplots
+from sources import SOURCES
+from sources import fetch
+from sources import read_source
+from tracing import span
+from tracing import traced
 
-def get_excel_dataframe(io: str) -> DataFrame:
-    result_df = read_excel(io=io)
+
+@traced(category='load')
+def get_excel_dataframe(name: str) -> DataFrame:
+    # the workbook comes straight out of the mirrored archive; nothing is extracted
+    result_df = remember_dataset(key=dataset_key(io=str(fetch(name=name)), reader='read_excel'),
+                                 loader=lambda: read_source(name=name, reader=read_excel))
     return result_df
 
 
 FIGSIZE = (16, 9)
-INPUT_FILE = './data/HAL/HAL.XLS'
-URL = 'http://people.uncw.edu/hinese/HAL/HAL.zip'
+URL = SOURCES['hal']['url']
 
 if __name__ == '__main__':
     TIME_START = now()
@@ -32,22 +44,20 @@ if __name__ == '__main__':
     basicConfig(format='%(asctime)s : %(name)s : %(levelname)s : %(message)s', level=INFO, )
     LOGGER.info('started')
 
-    df = get_excel_dataframe(io=INPUT_FILE)
-    df = df[df['Year'] != '1900s']
-    df = df[df['Mo'] != '.']
-    df = df[df['Day'] != '.']
-    column = 'month-date'
-    df[column] = df.apply(axis=1, func=lambda x: date(year=int(x['Year']), month=int(x['Mo']), day=15))
-    # we want monthly buckets
-    min_date = df[column].min()
-    max_date = df[column].max()
-    bins = 2 * (max_date.year - min_date.year)
+    df = get_excel_dataframe(name='hal')
+    with span(name='month dates', category='compute'):
+        df = df[(df['Year'] != '1900s') & (df['Mo'] != '.') & (df['Day'] != '.')]
+        column = 'month-date'
+        months = ((to_numeric(df['Year']).to_numpy(dtype=int64) - 1970) * 12 +
+                  to_numeric(df['Mo']).to_numpy(dtype=int64) - 1).astype('datetime64[M]')
+        df[column] = months.astype('datetime64[D]') + 14
+        # half-year buckets, leaving out the first and last months
+        counts = event_counts(dates=months, freq='month', start=months.min() + 1, step=6, stop=months.max())
     figure, axes = subplots(figsize=FIGSIZE)
-    result = histplot(ax=axes, bins=bins, data=df[(min_date < df[column]) & (df[column] < max_date)], discrete=False,
-                      element='bars', kde=True, stat='count', x=column, )
+    result = plot_counts(ax=axes, counts=counts, element='bars', kde=True, label=column, stat='count', )
     title('source: {}'.format(URL))
     savefig(format='png', fname='./project_hal.png')
-    close(fig=figure)
+    release(figure=figure)
 
     # get the year data
     columns = {'index': 'Year', 'Year': 'Deaths'}
@@ -8,21 +8,27 @@ from math import log10
 from pathlib import Path
 
 from arrow import now
-from matplotlib.pyplot import close
 from matplotlib.pyplot import gca
 from matplotlib.pyplot import savefig
-from matplotlib.pyplot import subplots
 from matplotlib.pyplot import tight_layout
 from pandas import DataFrame
 from pandas import Series
-from pandas import read_csv
 from seaborn import lmplot
 
+from common import dataset_key
+from common import group_statistics
 from common import label_point
+from common import remember_dataset
+from figures import release
+from tracing import span
+from tracing import traced
+from wonder import read_wonder
 
 
+@traced(category='load')
 def read_url_csv(url: str) -> DataFrame:
-    result_df = read_csv(filepath_or_buffer=url, thousands=',', sep='\t')
+    result_df = remember_dataset(key=dataset_key(io=url, reader='read_wonder', usecols=USECOLS),
+                                 loader=lambda: read_wonder(path=url, usecols=USECOLS))
     return result_df
 
 
@@ -49,6 +55,8 @@ OUTPUT_FOLDER = './data/'
 PLOT_FOLDER = './plot_cdc/'
 REPLACE_LABELS = {'018', '019', '027', '053', '054', '058', '059', '061', '063', '086', '111', '122', '137'}
 SCALING = 1000
+# the Notes, Year Code and Crude Rate columns are never used, so they are never read
+USECOLS = ['ICD-10 113 Cause List', 'ICD-10 113 Cause List Code', 'Year', 'Deaths', 'Population']
 
 if __name__ == '__main__':
     TIME_START = now()
@@ -62,56 +70,56 @@ if __name__ == '__main__':
 
     input_file = DATA_FOLDER + INPUT_FILE
     df = read_url_csv(url=input_file)
-    df = df.drop(columns=['Notes', 'Year Code', 'Crude Rate']).dropna()
-    for column in ['Year', 'Deaths', 'Population']:
-        df[column] = df[column].astype(int)
-    df['crude rate'] = SCALING * df['Deaths'] / df['Population']
-    df['log10 deaths'] = df['Deaths'].apply(log10)
+    with span(name='crude rates', category='compute'):
+        # rows with a suppressed count read as nulls, and they have no rate to plot
+        df = df.dropna()
+        for column in ['Year', 'Deaths', 'Population']:
+            df[column] = df[column].astype(int)
+        df['crude rate'] = SCALING * df['Deaths'] / df['Population']
+        df['log10 deaths'] = df['Deaths'].apply(log10)
 
     output_file = OUTPUT_FOLDER + OUTPUT_FILE
     LOGGER.info('writing %d rows to %s', len(df), output_file)
-    df.to_csv(path_or_buf=output_file, index=False)
+    with span(name='write csv', category='write'):
+        df.to_csv(path_or_buf=output_file, index=False)
 
     # we need to split the major groups from the minor groups
     columns = ['ICD-10 113 Cause List Code', 'ICD-10 113 Cause List']
-    major_df = df[~df[columns[1]].str.contains('#')]
-    minor_df = df[df[columns[1]].str.contains('#')]
-    # let's start building our scatterplot
-    column = columns[0]
-    name_dict = Series(df[columns[1]].values, index=df[columns[0]]).to_dict()
-    replace_labels = {'GR113-{}'.format(item): name_dict['GR113-{}'.format(item)] for item in REPLACE_LABELS}
-    short_name_dict = {key: value.replace('#', '').split('(')[0].rstrip() for key, value in name_dict.items()}
+    with span(name='cause statistics', category='compute'):
+        major_df = df[~df[columns[1]].str.contains('#')]
+        minor_df = df[df[columns[1]].str.contains('#')]
+        # let's start building our scatterplot
+        column = columns[0]
+        name_dict = Series(df[columns[1]].values, index=df[columns[0]]).to_dict()
+        replace_labels = {'GR113-{}'.format(item): name_dict['GR113-{}'.format(item)] for item in REPLACE_LABELS}
+        short_name_dict = {key: value.replace('#', '').split('(')[0].rstrip() for key, value in name_dict.items()}
 
-    mean = 'mean Deaths'
-    mean_df = df[[column, 'Deaths']].groupby(by=[column]).mean().reset_index().rename(columns={'Deaths': mean})
-    total = 'total Deaths'
-    total_df = df[[column, 'Deaths']].groupby(by=[column]).sum().reset_index().rename(columns={'Deaths': total})
-    y_var = 'std dev Deaths'
-    std_df = df[[column, 'Deaths']].groupby(by=[column]).std().reset_index().rename(columns={'Deaths': y_var})
-    x_var = [mean, total][0]
-    plot_df = (total_df if x_var in {total} else mean_df).merge(right=std_df, how='inner', on=column).fillna(0)
-    plot_df['label'] = plot_df[column].apply(func=lambda x: MAP_LABELS[x] if x in MAP_LABELS.keys() else x)
-    plot_df['short name'] = plot_df[column].apply(func=lambda x: short_name_dict[x])
-    plot_df['rank'] = plot_df[x_var].rank(ascending=False)
+        mean = 'mean Deaths'
+        total = 'total Deaths'
+        y_var = 'std dev Deaths'
+        statistics_df = group_statistics(input_df=df, by=column, value_column='Deaths').rename(
+            columns={'mean': mean, 'sum': total, 'std': y_var})
+        x_var = [mean, total][0]
+        plot_df = statistics_df[[column, x_var, y_var]].fillna(0)
+        plot_df['label'] = plot_df[column].apply(func=lambda x: MAP_LABELS[x] if x in MAP_LABELS.keys() else x)
+        plot_df['short name'] = plot_df[column].apply(func=lambda x: short_name_dict[x])
+        plot_df['rank'] = plot_df[x_var].rank(ascending=False)
 
     do_plots = False
     if do_plots:
-        figure_scatterplot, axes_scatterplot = subplots()
         result_scatterplot = lmplot(data=plot_df, x=x_var, y=y_var, fit_reg=False, legend=False, aspect=ASPECT, )
-        label_point(x=plot_df[x_var], y=plot_df[y_var], val=plot_df['label'], ax=gca())
         tight_layout()
+        label_point(x=plot_df[x_var], y=plot_df[y_var], val=plot_df['label'], ax=gca())
         savefig(fname=PLOT_FOLDER + 'cdc_113_scatterplot.png', format='png')
-        close(fig=figure_scatterplot)
-        del axes_scatterplot
+        release(figure=result_scatterplot.figure)
         del result_scatterplot
 
         # cut away the large values so we can see the inner, smaller results
         plot_df = plot_df[(plot_df[mean] < 200000) & (plot_df[y_var] < 20000)]
-        figure_scatterplot, axes_scatterplot = subplots()
         result_scatterplot = lmplot(data=plot_df, x=x_var, y=y_var, fit_reg=False, legend=False, aspect=ASPECT, )
-        label_point(x=plot_df[x_var], y=plot_df[y_var], val=plot_df['label'], ax=gca())
         tight_layout()
+        label_point(x=plot_df[x_var], y=plot_df[y_var], val=plot_df['label'], ax=gca())
         savefig(fname=PLOT_FOLDER + 'cdc_113_small_scatterplot.png', format='png')
-        close(fig=figure_scatterplot)
+        release(figure=result_scatterplot.figure)
 
     LOGGER.info('total time: {:5.2f}s'.format((now() - TIME_START).total_seconds()))
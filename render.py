@@ -0,0 +1,184 @@
+"""
+Render batches of plots, skipping unchanged ones and optionally spreading the rest over worker processes
+"""
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from hashlib import sha256
+from inspect import getsource
+from inspect import getsourcefile
+from json import dump
+from json import dumps
+from json import load
+from logging import getLogger
+from os import getpid
+from pathlib import Path
+from sys import modules
+from types import ModuleType
+from typing import Callable
+from typing import Optional
+
+from matplotlib import use
+from pandas import DataFrame
+from pandas.util import hash_pandas_object
+
+from figures import FigureScope
+from memory import add_records
+from memory import drain_records
+from memory import measure
+from tracing import add_events
+from tracing import drain_events
+from tracing import span
+
+
+def initialize_worker() -> None:
+    # workers never show anything, so they all draw with the non-interactive backend
+    use('Agg')
+    # a forked worker starts with a copy of the parent's trace events and memory records, which the parent already has
+    drain_events()
+    drain_records()
+
+
+def render_job(function: Callable, job: dict) -> tuple[str, Optional[str]]:
+    # one broken job reports its error and does not take the rest of the batch down with it
+    try:
+        with FigureScope(name=job['fname']), measure(name=job['fname'], category='job'), span(
+                name=function.__name__, category='plot', fname=job['fname']):
+            function(**job)
+        return job['fname'], None
+    except Exception as exception:
+        return job['fname'], '{}: {}'.format(type(exception).__name__, exception)
+
+
+def render_worker_job(function: Callable, job: dict) -> tuple[str, Optional[str], list[dict], list[dict]]:
+    fname, error = render_job(function=function, job=job)
+    return fname, error, drain_events(), drain_records()
+
+
+def render_jobs(function: Callable, jobs: list[dict], workers: int = 1) -> list[tuple[str, Optional[str]]]:
+    LOGGER.info('rendering %d plots with %s', len(jobs), function.__name__)
+    if workers <= 1 or len(jobs) <= 1:
+        results = [render_job(function=function, job=job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(initializer=initialize_worker, max_workers=workers) as executor:
+            results = list()
+            for fname, error, events, records in executor.map(partial(render_worker_job, function), jobs,
+                                                              chunksize=max(1, len(jobs) // (4 * workers))):
+                add_events(events=events)
+                add_records(records=records)
+                results.append((fname, error))
+    for fname, error in results:
+        if error is not None:
+            LOGGER.warning('could not render %s: %s', fname, error)
+    return results
+
+
+def local_files(namespace: dict, files: set[str]) -> set[str]:
+    # the source files from this folder that the namespace reaches, directly or through the modules they import
+    for value in list(namespace.values()):
+        module = value if isinstance(value, ModuleType) else modules.get(getattr(value, '__module__', None) or '')
+        source = getattr(module, '__file__', None)
+        if source is None or str(Path(source).resolve()) in files or Path(source).resolve().parent != SOURCE_FOLDER:
+            continue
+        files.add(str(Path(source).resolve()))
+        local_files(namespace=vars(module), files=files)
+    return files
+
+
+def code_fingerprint(function: Callable) -> str:
+    # the plot also depends on the helpers the function calls (labels, figures, common) and the constants it reads,
+    # so the fingerprint covers every module from this folder that the function reaches and the plain values of the
+    # globals it names, not just its own source
+    files = local_files(namespace=function.__globals__, files={str(Path(getsourcefile(function)).resolve())})
+    digest = sha256(getsource(function).encode('utf-8'))
+    for source in sorted(files):
+        digest.update(Path(source).read_bytes())
+    for name in sorted(set(function.__code__.co_names)):
+        value = function.__globals__.get(name)
+        if isinstance(value, (bool, dict, float, int, list, str, tuple)):
+            digest.update(name.encode('utf-8'))
+            digest.update(dumps(default=str, obj=value, sort_keys=True).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def callable_fingerprint(value: Callable) -> str:
+    # a function passed in the job (a chart builder, say) counts by its code and what it calls, not by where it sits
+    # in memory; a partial counts by its function and arguments, and anything without Python source by its name
+    if isinstance(value, partial):
+        return callable_fingerprint(value=value.func) + dumps(default=str, obj=[value.args, value.keywords],
+                                                              sort_keys=True)
+    if hasattr(value, '__code__') and hasattr(value, '__globals__'):
+        try:
+            return code_fingerprint(function=value)
+        except (OSError, TypeError):
+            pass
+    return '{}.{}'.format(getattr(value, '__module__', None), getattr(value, '__qualname__', type(value).__qualname__))
+
+
+def job_hash(fingerprint: str, job: dict) -> str:
+    # the plot depends on the plotting code and what it calls (the fingerprint), its data slices and every other
+    # parameter except the output name
+    digest = sha256(fingerprint.encode('utf-8'))
+    for key in sorted(job.keys()):
+        value = job[key]
+        digest.update(key.encode('utf-8'))
+        if isinstance(value, DataFrame):
+            digest.update(dumps([str(column) for column in value.columns]).encode('utf-8'))
+            digest.update(dumps([str(dtype) for dtype in value.dtypes]).encode('utf-8'))
+            digest.update(hash_pandas_object(obj=value, index=False).values.tobytes())
+        elif callable(value):
+            digest.update(callable_fingerprint(value=value).encode('utf-8'))
+        elif key != 'fname':
+            digest.update(dumps(default=str, obj=value, sort_keys=True).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def load_manifest(folder: str) -> dict:
+    manifest_file = Path(folder) / MANIFEST_FILE
+    if not manifest_file.exists():
+        return dict()
+    with open(file=manifest_file, mode='r') as input_fp:
+        return load(fp=input_fp)
+
+
+def update_manifest(folder: str, updates: dict) -> None:
+    # re-read just before writing so scripts sharing an output folder do not drop each other's entries
+    manifest = load_manifest(folder=folder)
+    for name, value in updates.items():
+        if value is None:
+            manifest.pop(name, None)
+        else:
+            manifest[name] = value
+    temporary_file = Path(folder) / '{}.{}'.format(MANIFEST_FILE, getpid())
+    with open(file=temporary_file, mode='w') as output_fp:
+        dump(fp=output_fp, indent=2, obj=manifest, sort_keys=True)
+    temporary_file.replace(Path(folder) / MANIFEST_FILE)
+
+
+def render_changed_jobs(function: Callable, jobs: list[dict], workers: int = 1,
+                        version: str = '') -> list[tuple[str, Optional[str]]]:
+    # each output folder keeps a manifest of the hash that produced each of its files
+    manifests = {folder: load_manifest(folder=folder) for folder in {str(Path(job['fname']).parent) for job in jobs}}
+    # a caller can pass a version for anything the code cannot see, such as a font or a style file
+    fingerprint = code_fingerprint(function=function) + version
+    hashes = {job['fname']: job_hash(fingerprint=fingerprint, job=job) for job in jobs}
+    changed_jobs = list()
+    for job in jobs:
+        fname = Path(job['fname'])
+        if fname.exists() and manifests[str(fname.parent)].get(fname.name) == hashes[job['fname']]:
+            LOGGER.info('not rendering %s because its inputs have not changed', fname)
+        else:
+            changed_jobs.append(job)
+    results = render_jobs(function=function, jobs=changed_jobs, workers=workers)
+    updates = {folder: dict() for folder in manifests.keys()}
+    for fname, error in results:
+        updates[str(Path(fname).parent)][Path(fname).name] = hashes[fname] if error is None else None
+    for folder, folder_updates in updates.items():
+        if folder_updates:
+            update_manifest(folder=folder, updates=folder_updates)
+    return results
+
+
+LOGGER = getLogger(__name__, )
+MANIFEST_FILE = 'manifest.json'
+# the plotting code lives next to this file; helpers from anywhere else (seaborn, pandas) do not count
+SOURCE_FOLDER = Path(__file__).resolve().parent
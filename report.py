@@ -0,0 +1,100 @@
+"""
+Build a static site from markdown pages with chart placeholders, redoing only the charts and pages that changed
+"""
+from hashlib import sha256
+from logging import getLogger
+from pathlib import Path
+from re import compile as compile_pattern
+from typing import Callable
+from typing import Optional
+
+from markdown2 import markdown
+from plotly.io import to_html
+
+from plotly_html import plotly_script
+from plotly_html import to_webgl
+from render import load_manifest
+from render import render_changed_jobs
+from render import update_manifest
+from tracing import traced
+
+
+def write_chart(fname: str, chart: Callable, threshold: int = 5000, points: Optional[int] = None, **kwargs) -> None:
+    # chart builds the plotly figure from the rest of the job; the fragment leaves plotly.js to the page
+    figure = to_webgl(figure=chart(**kwargs), points=points, threshold=threshold)
+    Path(fname).write_text(data=to_html(fig=figure, full_html=False, include_plotlyjs=False), encoding='utf-8')
+
+
+def read_pages(folder: str) -> dict[str, str]:
+    # every markdown file in the folder is a page with the same name
+    return {path.stem: path.read_text(encoding='utf-8') for path in sorted(Path(folder).glob('*.md'))}
+
+
+def page_charts(text: str) -> list[str]:
+    return [match.group(1) for match in PLACEHOLDER.finditer(text)]
+
+
+def render_page(text: str, fragments: dict[str, str], title: str, script: str) -> str:
+    # the text between placeholders goes through markdown on its own, so markdown never sees the chart markup
+    parts = PLACEHOLDER.split(text)
+    body = [markdown(text=part) if index % 2 == 0 else fragments[part] for index, part in enumerate(parts)]
+    return PAGE.format(body='\n'.join(body), script=script, title=title)
+
+
+@traced(category='plot')
+def build_site(pages: dict[str, str], charts: dict[str, dict], folder: str, title: str = '',
+               workers: int = 1) -> list[str]:
+    # pages maps a page name to its markdown, where {{chart:name}} on a line of its own places a chart; charts maps a
+    # chart name to a render job without its fname: the function that builds the figure as chart, and its arguments
+    chart_folder = Path(folder) / CHART_FOLDER
+    chart_folder.mkdir(parents=True, exist_ok=True)
+    used = {name for text in pages.values() for name in page_charts(text=text)}
+    unknown = sorted(used - set(charts.keys()))
+    if unknown:
+        raise ValueError('the pages place charts that are not defined: {}'.format(', '.join(unknown)))
+    # the charts go through the same content-hash manifest as the plots, so only the changed ones are rendered again
+    jobs = [dict(charts[name], fname=str(chart_folder / '{}.html'.format(name))) for name in sorted(used)]
+    render_changed_jobs(function=write_chart, jobs=jobs, workers=workers)
+    chart_hashes = load_manifest(folder=str(chart_folder))
+    script = '{}/{}'.format(CHART_FOLDER, plotly_script(folder=str(chart_folder)))
+    # a page depends on its text, the template and the hashes of its charts; a failed chart has no hash
+    manifest, updates, written = load_manifest(folder=folder), dict(), list()
+    for name, text in pages.items():
+        fname = Path(folder) / '{}.html'.format(name)
+        names = page_charts(text=text)
+        digest = sha256('\n'.join([PAGE, title, text] + [str(chart_hashes.get('{}.html'.format(item))) for item in
+                                                          names]).encode('utf-8')).hexdigest()
+        if fname.exists() and manifest.get(fname.name) == digest:
+            LOGGER.info('not building %s because its text and charts have not changed', fname)
+            continue
+        fragments = dict()
+        for item in names:
+            chart_file = chart_folder / '{}.html'.format(item)
+            fragments[item] = chart_file.read_text(encoding='utf-8') if '{}.html'.format(item) in chart_hashes.keys() \
+                else '<p>chart {} could not be rendered</p>'.format(item)
+        fname.write_text(data=render_page(fragments=fragments, script=script, text=text, title=title or name),
+                         encoding='utf-8')
+        LOGGER.info('built %s', fname)
+        written.append(str(fname))
+        updates[fname.name] = digest
+    if updates:
+        update_manifest(folder=folder, updates=updates)
+    return written
+
+
+CHART_FOLDER = 'charts'
+LOGGER = getLogger(__name__, )
+PAGE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<script src="{script}"></script>
+</head>
+<body>
+{body}
+</body>
+</html>
+"""
+# a placeholder takes a whole line, so it never lands inside a markdown paragraph
+PLACEHOLDER = compile_pattern(r'(?m)^[ \t]*\{\{\s*chart:\s*([\w.-]+)\s*\}\}[ \t]*$')
@@ -0,0 +1,52 @@
+"""
+Vectorized similarity measures between the rows of a country x year matrix
+"""
+from numpy import fill_diagonal
+from numpy import inf
+from numpy import sqrt
+from pandas import DataFrame
+
+
+def series_matrix(input_df: DataFrame, row_column: str, column_column: str, value_column: str) -> DataFrame:
+    return input_df.pivot(columns=column_column, index=row_column, values=value_column)
+
+
+def reference_similarities(matrix: DataFrame, reference: str) -> DataFrame:
+    # one matrix-vector product gives every dot product; the row sums turn it into the three measures
+    values = matrix.to_numpy(dtype=float)
+    reference_values = matrix.loc[reference].to_numpy(dtype=float)
+    count = values.shape[1]
+    dots = values @ reference_values
+    sums = values.sum(axis=1)
+    squares = (values * values).sum(axis=1)
+    reference_sum = reference_values.sum()
+    reference_square = reference_values @ reference_values
+    covariances = dots - sums * reference_sum / count
+    return DataFrame(index=matrix.index, data={
+        'projection': dots / reference_square,
+        'correlation': covariances / sqrt((squares - sums * sums / count) *
+                                          (reference_square - reference_sum * reference_sum / count)),
+        'cosine': dots / sqrt(squares * reference_square),
+    })
+
+
+def similarity_matrix(matrix: DataFrame, method: str = 'correlation') -> DataFrame:
+    values = matrix.to_numpy(dtype=float)
+    if method == 'correlation':
+        values = values - values.mean(axis=1, keepdims=True)
+    elif method != 'cosine':
+        raise ValueError('unknown similarity method: {}'.format(method))
+    values = values / sqrt((values * values).sum(axis=1, keepdims=True))
+    return DataFrame(columns=matrix.index, data=values @ values.T, index=matrix.index)
+
+
+def nearest_rows(matrix: DataFrame, method: str = 'correlation') -> DataFrame:
+    similarities_df = similarity_matrix(matrix=matrix, method=method)
+    values = similarities_df.to_numpy(copy=True)
+    # a row is always most similar to itself, so we rule that out
+    fill_diagonal(values, -inf)
+    positions = values.argmax(axis=1)
+    return DataFrame(index=matrix.index, data={
+        'nearest': matrix.index[positions],
+        method: values[range(len(positions)), positions],
+    })
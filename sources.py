@@ -0,0 +1,156 @@
+"""
+Download the remote inputs into a local mirror and revalidate them with conditional GETs when asked
+"""
+from argparse import ArgumentParser
+from datetime import datetime
+from datetime import timezone
+from hashlib import sha256
+from json import dump
+from json import load
+from logging import INFO
+from logging import basicConfig
+from logging import getLogger
+from os import environ
+from pathlib import Path
+from typing import BinaryIO
+from typing import Callable
+from urllib.error import HTTPError
+from urllib.request import Request
+from urllib.request import urlopen
+from zipfile import ZipFile
+from zipfile import is_zipfile
+
+from arrow import now
+
+
+def mirror_path(name: str) -> Path:
+    return Path(MIRROR_FOLDER) / name / SOURCES[name]['file']
+
+
+def metadata_path(name: str) -> Path:
+    path = mirror_path(name=name)
+    return path.with_name(path.name + '.json')
+
+
+def read_metadata(name: str) -> dict:
+    path = metadata_path(name=name)
+    if not path.exists() or not mirror_path(name=name).exists():
+        return dict()
+    with open(file=path, mode='r') as input_fp:
+        return load(fp=input_fp)
+
+
+def download(name: str) -> Path:
+    # a conditional GET when we have a copy: the server answers 304 and sends nothing if it has not changed
+    url, path, metadata = SOURCES[name]['url'], mirror_path(name=name), read_metadata(name=name)
+    headers = {'User-Agent': USER_AGENT}
+    if metadata.get('etag'):
+        headers['If-None-Match'] = metadata['etag']
+    if metadata.get('last_modified'):
+        headers['If-Modified-Since'] = metadata['last_modified']
+    try:
+        with urlopen(Request(headers=headers, url=url), timeout=TIMEOUT) as response:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # write next to the mirror and swap it in, so a failed download never leaves half a file behind
+            partial = path.with_name(path.name + '.partial')
+            digest = sha256()
+            with open(file=partial, mode='wb') as output_fp:
+                for block in iter(lambda: response.read(BLOCK_BYTES), b''):
+                    digest.update(block)
+                    output_fp.write(block)
+            partial.replace(path)
+            metadata = {'etag': response.headers.get('ETag'), 'last_modified': response.headers.get('Last-Modified'),
+                        'sha256': digest.hexdigest(), 'size': path.stat().st_size, 'url': url}
+            LOGGER.info('downloaded %d bytes from %s to %s', metadata['size'], url, path)
+    except HTTPError as error:
+        if error.code != 304 or not metadata:
+            raise
+        LOGGER.info('%s has not changed since %s', url, metadata.get('last_modified') or metadata.get('fetched'))
+    else:
+        metadata['fetched'] = datetime.now(tz=timezone.utc).isoformat()
+    metadata['checked'] = datetime.now(tz=timezone.utc).isoformat()
+    with open(file=metadata_path(name=name), mode='w') as output_fp:
+        dump(fp=output_fp, indent=2, obj=metadata)
+    return path
+
+
+def fetch(name: str, refresh: bool = False) -> Path:
+    # the mirrored copy, else the copy the scripts used to keep under ./data/; the network only when asked to refresh,
+    # or with FETCH_SOURCES set for a source we have no copy of at all
+    path, local = mirror_path(name=name), SOURCES[name].get('local')
+    if refresh:
+        return download(name=name)
+    if path.exists():
+        return path
+    if local is not None and Path(local).exists():
+        return Path(local)
+    if ONLINE:
+        return download(name=name)
+    raise FileNotFoundError('no local copy of {}; run python sources.py {} (or set FETCH_SOURCES=1) to download it '
+                            'from {}'.format(name, name, SOURCES[name]['url']))
+
+
+def open_source(name: str, refresh: bool = False) -> BinaryIO:
+    # archives are read in place: the member streams out of the zip, and nothing is extracted to disk
+    path, member = fetch(name=name, refresh=refresh), SOURCES[name].get('member')
+    if member is None or not is_zipfile(path):
+        return open(file=path, mode='rb')
+    with ZipFile(file=path) as archive:
+        # the open member keeps the archive file open after the ZipFile itself is closed
+        for item in archive.infolist():
+            if Path(item.filename).name.lower() == member.lower():
+                return archive.open(name=item)
+    raise KeyError('{} has no member {}'.format(path, member))
+
+
+def read_source(name: str, reader: Callable, refresh: bool = False, **kwargs):
+    # reader is a pandas reader such as read_csv, read_excel or read_html, which all take a file object first
+    with open_source(name=name, refresh=refresh) as input_fp:
+        return reader(input_fp, **kwargs)
+
+
+BLOCK_BYTES = 1 << 20
+LOGGER = getLogger(__name__, )
+MIRROR_FOLDER = './data/mirror/'
+# set FETCH_SOURCES to let a run download the sources it has no copy of; without it nothing touches the network
+ONLINE = environ.get('FETCH_SOURCES') is not None
+# file is the name in the mirror; local is where the scripts kept their copy before there was a mirror; member is
+# the file to read out of an archive
+SOURCES = {
+    'cdc_top_ten': {'file': 'bi63-dtpu-rows.csv', 'local': './data/bi63-dtpu-rows.csv',
+                    'url': 'https://data.cdc.gov/api/views/bi63-dtpu/rows.csv?accessType=DOWNLOAD&bom=true&'
+                           'format=true'},
+    'dcas': {'file': 'DCAS.VN.EXT08.DAT', 'local': './data/DCAS.VN.EXT08.DAT',
+             'url': 'https://catalog.archives.gov/OpaAPI/media/2240992/content/arcmedia/electronic-records/rg-330/'
+                    'dcase/DCAS.VN.EXT08.DAT?download=true'},
+    'hal': {'file': 'HAL.zip', 'local': './data/HAL/HAL.XLS', 'member': 'HAL.XLS',
+            'url': 'http://people.uncw.edu/hinese/HAL/HAL.zip'},
+    'umkc': {'file': 'lynchingyear.html',
+             'url': 'http://law2.umkc.edu/faculty/projects/ftrials/shipp/lynchingyear.html'},
+    'wpp': {'file': 'WPP2022_GEN_F01_DEMOGRAPHIC_INDICATORS_COMPACT_REV1.xlsx',
+            'local': './data/WPP2022_GEN_F01_DEMOGRAPHIC_INDICATORS_COMPACT_REV1.xlsx',
+            'url': 'https://population.un.org/wpp/Download/Files/1_Indicators%20(Standard)/EXCEL_FILES/1_General/'
+                   'WPP2022_GEN_F01_DEMOGRAPHIC_INDICATORS_COMPACT_REV1.xlsx'},
+}
+TIMEOUT = 60
+USER_AGENT = 'demographics-mirror/1.0'
+
+if __name__ == '__main__':
+    TIME_START = now()
+    basicConfig(format='%(asctime)s : %(name)s : %(levelname)s : %(message)s', level=INFO, )
+    LOGGER.info('started')
+
+    parser = ArgumentParser(description=__doc__.strip())
+    parser.add_argument('sources', metavar='source', nargs='*',
+                        help='sources to download or revalidate (default: all of them)')
+    arguments = parser.parse_args()
+    for unknown in sorted(set(arguments.sources) - set(SOURCES.keys())):
+        parser.error('unknown source {} (choose from {})'.format(unknown, ', '.join(sorted(SOURCES.keys()))))
+
+    for source_name in arguments.sources or list(SOURCES.keys()):
+        try:
+            download(name=source_name)
+        except OSError as download_error:
+            LOGGER.warning('could not refresh %s: %s', source_name, download_error)
+
+    LOGGER.info('total time: {:5.2f}s'.format((now() - TIME_START).total_seconds()))
@@ -0,0 +1,200 @@
+"""
+Write synthetic data with the WPP schema and location hierarchy, at any number of locations, years and variants
+"""
+from argparse import ArgumentParser
+from logging import INFO
+from logging import basicConfig
+from logging import getLogger
+from pathlib import Path
+from typing import Iterator
+
+from arrow import now
+from numpy import arange
+from numpy import array
+from numpy import cumsum
+from numpy import nan
+from numpy import repeat
+from numpy import tile
+from numpy.random import default_rng
+from openpyxl import Workbook
+from pandas import DataFrame
+from pandas import Series
+
+from common import COLUMNS
+from common import INDICATOR_COLUMNS
+
+
+def letters(number: int, width: int) -> str:
+    # at least width letters, and more once the number outgrows them, so two numbers never share a code
+    result = ''
+    while len(result) < width or number:
+        number, remainder = divmod(number, 26)
+        result = chr(ord('A') + remainder) + result
+    return result
+
+
+def row_count(countries: int, years: int, variants: int) -> int:
+    locations_df = make_locations(countries=countries)
+    labels = int((locations_df['Type'] == 'Label/Separator').sum())
+    return variants * (labels + (len(locations_df) - labels) * years)
+
+
+def fits_workbook(rows: int, header: int = 16) -> bool:
+    # the header lines and the column names count against the sheet's row limit too
+    return header + 1 + rows <= XLSX_ROWS
+
+
+def make_locations(countries: int, subregions: int = 3) -> DataFrame:
+    # the real sheet starts with WORLD and a separator row, then each region, its subregions and their countries
+    rows = [('WORLD', 900, 'World', 0), ('UN development groups', None, 'Label/Separator', None)]
+    country_code = 0
+    subregion_code = SUBREGION_CODE
+    for region_index, (region, region_code) in enumerate(REGIONS):
+        rows.append((region, region_code, 'Region', 900))
+        for subregion_index in range(subregions):
+            subregion_code += 1
+            rows.append(('{} subregion {}'.format(region.title(), subregion_index + 1), subregion_code, 'Subregion',
+                         region_code))
+            # spread the countries evenly; the first subregions take the remainder
+            slot = region_index * subregions + subregion_index
+            count = countries // (len(REGIONS) * subregions) + (slot < countries % (len(REGIONS) * subregions))
+            for _ in range(count):
+                country_code += 1
+                # skip the codes the real file keeps for its aggregates
+                while RESERVED_CODES[0] <= country_code <= RESERVED_CODES[1]:
+                    country_code += 1
+                rows.append(('Country {:06d}'.format(country_code), country_code, 'Country/Area', subregion_code))
+    result_df = DataFrame(columns=['Region, subregion, country or area *', 'Location code', 'Type', 'Parent code'],
+                          data=rows)
+    for column in ['Location code', 'Parent code']:
+        result_df[column] = result_df[column].astype('Int32')
+    return result_df
+
+
+def wpp_frames(countries: int, years: range, variants: list[str], seed: int, nan_rate: float, sentinel_rate: float,
+               chunk_locations: int = 1000) -> Iterator[DataFrame]:
+    # yield the sheet a block of locations at a time, so the size of the output never has to fit in memory
+    generator = default_rng(seed=seed)
+    locations_df = make_locations(countries=countries)
+    index = 1
+    for variant in variants:
+        for start in range(0, len(locations_df), chunk_locations):
+            chunk_df = locations_df.iloc[start:start + chunk_locations]
+            # separator rows have a name and nothing else, so they get one row instead of one per year
+            labels = (chunk_df['Type'] == 'Label/Separator').to_numpy()
+            count = [1 if label else len(years) for label in labels]
+            rows_df = chunk_df.loc[chunk_df.index.repeat(count)].reset_index(drop=True)
+            countries_mask = (chunk_df['Type'] == 'Country/Area').to_numpy()
+            iso3 = repeat([letters(number=int(code), width=3) if country else None for code, country in
+                           zip(chunk_df['Location code'], countries_mask)], count)
+            iso2 = repeat([letters(number=int(code), width=2) if country else None for code, country in
+                           zip(chunk_df['Location code'], countries_mask)], count)
+            # every location starts at its own level for each indicator and drifts a little from year to year
+            levels = generator.uniform(high=100.0, low=1.0, size=(len(chunk_df), 1, len(INDICATOR_COLUMNS)))
+            steps = generator.normal(loc=0.0, scale=0.01, size=(len(chunk_df), len(years), len(INDICATOR_COLUMNS)))
+            values = (levels * (1.0 + cumsum(steps, axis=1))).round(3).reshape(-1, len(INDICATOR_COLUMNS))
+            values_df = DataFrame(columns=INDICATOR_COLUMNS,
+                                  data=values[repeat(~labels, len(years))]).astype(object)
+            # the real sheets use blanks for missing values and '...' where a value is not applicable
+            draws = generator.random(size=values_df.shape)
+            values_df = values_df.mask(draws < nan_rate + sentinel_rate, '...').mask(draws < nan_rate, None)
+            # a few locations carry a footnote number, the rest are blank
+            notes = generator.choice(a=[nan] * 8 + [1.0, 2.0], size=len(chunk_df))
+
+            result_df = DataFrame(data={
+                'Index': arange(index, index + len(rows_df)),
+                'Variant': variant,
+                'Region, subregion, country or area *': rows_df['Region, subregion, country or area *'],
+                'Notes': repeat(notes, count),
+                'Location code': rows_df['Location code'],
+                'ISO3 Alpha-code': iso3,
+                'ISO2 Alpha-code': iso2,
+                'SDMX code**': rows_df['Location code'],
+                'Type': rows_df['Type'],
+                'Parent code': rows_df['Parent code'],
+                'Year': Series(index=rows_df.index, dtype='Int32'),
+            })
+            row_labels = repeat(labels, count)
+            result_df.loc[~row_labels, 'Year'] = tile(array(years), len(chunk_df) - labels.sum())
+            values_df.index = rows_df.index[~row_labels]
+            result_df = result_df.join(other=values_df)
+            index += len(result_df)
+            yield result_df[COLUMNS]
+
+
+def write_workbook(frames: Iterator[DataFrame], path: str, header: int = 16) -> int:
+    # a write-only workbook streams rows to disk instead of building every cell in memory
+    workbook = Workbook(write_only=True)
+    worksheet = workbook.create_sheet(title='Estimates')
+    for line in range(header):
+        worksheet.append([HEADER_LINES[line] if line < len(HEADER_LINES) else None])
+    worksheet.append(COLUMNS)
+    rows = 0
+    for frame in frames:
+        if not fits_workbook(header=header, rows=rows + len(frame)):
+            raise ValueError('more than the {} rows an xlsx sheet holds; write csv instead'.format(XLSX_ROWS))
+        for row in frame.astype(object).where(frame.notna(), None).itertuples(index=False, name=None):
+            worksheet.append(row)
+        rows += len(frame)
+    workbook.save(filename=path)
+    return rows
+
+
+def write_csv(frames: Iterator[DataFrame], path: str) -> int:
+    rows = 0
+    for frame in frames:
+        frame.to_csv(header=rows == 0, index=False, mode='w' if rows == 0 else 'a', path_or_buf=path)
+        rows += len(frame)
+    return rows
+
+
+HEADER_LINES = ['United Nations', 'Population Division', 'Department of Economic and Social Affairs', None,
+                'World Population Prospects 2022', 'File GEN/01/REV1: Demographic indicators by region, subregion '
+                                                   'and country, annually for 1950-2100', 'Estimates, 1950 - 2021',
+                'POP/DB/WPP/Rev.2022/GEN/F01/Rev.1', 'July 2022 - Copyright (c) 2022 by United Nations.',
+                'Synthetic data with the same layout, for testing only']
+NAN_RATE = 0.01
+OUTPUT_FOLDER = './data/synthetic/'
+REGIONS = [('AFRICA', 903), ('ASIA', 935), ('EUROPE', 908), ('LATIN AMERICA AND THE CARIBBEAN', 904),
+           ('NORTHERN AMERICA', 905), ('OCEANIA', 909)]
+RESERVED_CODES = (900, 2000)
+SEED = 2022
+SENTINEL_RATE = 0.02
+SUBREGION_CODE = 1000000
+XLSX_ROWS = 1048576
+
+if __name__ == '__main__':
+    TIME_START = now()
+    LOGGER = getLogger(__name__, )
+    basicConfig(format='%(asctime)s : %(name)s : %(levelname)s : %(message)s', level=INFO, )
+    LOGGER.info('started')
+
+    parser = ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--countries', default=237, type=int, help='countries and areas (the real file has 237)')
+    parser.add_argument('--first-year', default=1950, type=int)
+    parser.add_argument('--format', choices=['csv', 'xlsx'], default='xlsx')
+    parser.add_argument('--last-year', default=2021, type=int)
+    parser.add_argument('--nan-rate', default=NAN_RATE, type=float, help='fraction of blank indicator values')
+    parser.add_argument('--seed', default=SEED, type=int)
+    parser.add_argument('--sentinel-rate', default=SENTINEL_RATE, type=float,
+                        help="fraction of indicator values that are '...'")
+    parser.add_argument('--variants', default=['Estimates'], nargs='+', help='one block of rows per variant')
+    arguments = parser.parse_args()
+    expected_rows = row_count(countries=arguments.countries, variants=len(arguments.variants),
+                              years=arguments.last_year - arguments.first_year + 1)
+    if arguments.format == 'xlsx' and not fits_workbook(rows=expected_rows):
+        parser.error('{} rows do not fit in an xlsx sheet ({} at most); use --format csv'.format(expected_rows,
+                                                                                               XLSX_ROWS))
+
+    Path(OUTPUT_FOLDER).mkdir(parents=True, exist_ok=True)
+    output_file = '{}WPP_SYNTHETIC_{}x{}x{}.{}'.format(
+        OUTPUT_FOLDER, arguments.countries, arguments.last_year - arguments.first_year + 1, len(arguments.variants),
+        arguments.format)
+    wpp = wpp_frames(countries=arguments.countries, nan_rate=arguments.nan_rate, seed=arguments.seed,
+                     sentinel_rate=arguments.sentinel_rate, variants=arguments.variants,
+                     years=range(arguments.first_year, arguments.last_year + 1))
+    written = write_workbook(frames=wpp, path=output_file) if arguments.format == 'xlsx' else write_csv(
+        frames=wpp, path=output_file)
+    LOGGER.info('wrote %d rows to %s', written, output_file)
+
+    LOGGER.info('total time: {:5.2f}s'.format((now() - TIME_START).total_seconds()))
@@ -0,0 +1,129 @@
+"""
+Lightweight tracing spans, written out as a Chrome/Perfetto trace-event file and a per-span summary table
+"""
+from atexit import register
+from contextlib import ContextDecorator
+from functools import wraps
+from json import dump
+from logging import getLogger
+from os import environ
+from os import getpid
+from pathlib import Path
+from threading import get_ident
+from time import perf_counter_ns
+from typing import Callable
+from typing import Optional
+
+from pandas import DataFrame
+
+
+class Span(ContextDecorator):
+    def __init__(self, name: str, category: str, args: dict):
+        self.args = args
+        self.category = category
+        self.name = name
+        self.start = 0
+
+    def __enter__(self):
+        self.start = perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        end = perf_counter_ns()
+        # complete events carry their own duration, so a span needs one record rather than a begin/end pair
+        EVENTS.append({'args': self.args, 'cat': self.category, 'dur': (end - self.start) / 1000, 'name': self.name,
+                       'ph': 'X', 'pid': getpid(), 'tid': get_ident(), 'ts': self.start / 1000})
+        return False
+
+
+class NullSpan(ContextDecorator):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+def span(name: str, category: str = 'step', **args) -> ContextDecorator:
+    # when tracing is off every span is the same do-nothing object, so leaving them in costs next to nothing
+    if not ENABLED:
+        return NULL_SPAN
+    return Span(args={key: str(value) for key, value in args.items()}, category=category, name=name)
+
+
+def traced(name: Optional[str] = None, category: str = 'step') -> Callable:
+    def decorator(function: Callable) -> Callable:
+        if not ENABLED:
+            return function
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with Span(args={}, category=category, name=name or function.__qualname__):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def drain_events() -> list[dict]:
+    # worker processes hand their events back to the parent, which writes the one trace file
+    result = EVENTS.copy()
+    EVENTS.clear()
+    return result
+
+
+def add_events(events: list[dict]) -> None:
+    EVENTS.extend(events)
+
+
+def summary(events: list[dict]) -> DataFrame:
+    if not events:
+        return DataFrame(columns=['name', 'category', 'count', 'total_ms', 'mean_ms', 'max_ms'])
+    events_df = DataFrame(data={'name': [event['name'] for event in events],
+                                'category': [event['cat'] for event in events],
+                                'ms': [event['dur'] / 1000 for event in events]})
+    result_df = events_df.groupby(by=['name', 'category'], sort=False)['ms'].agg(
+        ['count', 'sum', 'mean', 'max']).reset_index().rename(
+        columns={'sum': 'total_ms', 'mean': 'mean_ms', 'max': 'max_ms'})
+    return result_df.sort_values(by='total_ms', ascending=False).reset_index(drop=True)
+
+
+def write_trace(path: str) -> None:
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    with open(file=path, mode='w') as output_fp:
+        dump(fp=output_fp, obj={'displayTimeUnit': 'ms', 'traceEvents': EVENTS})
+    summary_df = summary(events=EVENTS)
+    summary_file = str(Path(path).with_suffix('.summary.csv'))
+    summary_df.to_csv(path_or_buf=summary_file, float_format='%0.3f', index=False)
+    LOGGER.info('wrote %d trace events to %s and the summary to %s', len(EVENTS), path, summary_file)
+    for row in summary_df.head(n=SUMMARY_ROWS).itertuples(index=False):
+        LOGGER.info('%-40s %-8s %6d calls %10.1f ms total %9.1f ms max', row.name, row.category, row.count,
+                    row.total_ms, row.max_ms)
+
+
+def trace_savefig() -> None:
+    # every script saves through Figure.savefig, so one wrapper puts PNG encoding in the trace everywhere
+    from matplotlib.figure import Figure
+    savefig = Figure.savefig
+
+    @wraps(savefig)
+    def wrapper(self, *args, **kwargs):
+        with Span(args={'fname': str(kwargs.get('fname', args[0] if args else ''))}, category='savefig',
+                  name='savefig'):
+            return savefig(self, *args, **kwargs)
+
+    Figure.savefig = wrapper
+
+
+EVENTS = list()
+LOGGER = getLogger(__name__, )
+NULL_SPAN = NullSpan()
+SUMMARY_ROWS = 20
+# set TRACE_FILE to a path to turn tracing on; the trace is written there when the process exits
+TRACE_FILE = environ.get('TRACE_FILE')
+ENABLED = TRACE_FILE is not None
+
+if ENABLED:
+    trace_savefig()
+    register(write_trace, TRACE_FILE)
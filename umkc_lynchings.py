@@ -7,25 +7,29 @@ from logging import getLogger
 from typing import Optional
 
 from arrow import now
-from matplotlib.pyplot import close as figure_close
 from matplotlib.pyplot import savefig
-from matplotlib.pyplot import subplots
 from matplotlib.pyplot import title
 from pandas import DataFrame
 from pandas import read_html
 from seaborn import lineplot
 
 from common import reshape
+from figures import release
+from figures import subplots
+from sources import SOURCES
+from sources import read_source
+from tracing import traced
 
 
-def get_html_dataframe(url: str, skiprows: Optional[int]) -> list[DataFrame]:
-    result_df = read_html(io=url, skiprows=skiprows)
+@traced(category='load')
+def get_html_dataframe(name: str, skiprows: Optional[int]) -> list[DataFrame]:
+    result_df = read_source(name=name, reader=read_html, skiprows=skiprows)
     return result_df
 
 
 FIGSIZE = (16, 8)
 OUTPUT_FOLDER = './plot_lynching/'
-URL = 'http://law2.umkc.edu/faculty/projects/ftrials/shipp/lynchingyear.html'
+URL = SOURCES['umkc']['url']
 
 if __name__ == '__main__':
     TIME_START = now()
@@ -35,7 +39,7 @@ if __name__ == '__main__':
 
     # todo create output folder if it does not exist
 
-    df = get_html_dataframe(url=URL, skiprows=3)
+    df = get_html_dataframe(name='umkc', skiprows=3)
     df = df[0].dropna().iloc[0:87]
     for column in df.columns:
         df[column] = df[column].astype(int)
@@ -46,7 +50,7 @@ if __name__ == '__main__':
     ax.legend(loc='upper right')
     title('source: {}'.format(URL))
     savefig(fname=OUTPUT_FOLDER + 'umkc_lynchings.png', format='png')
-    figure_close(fig=fig)
+    release(figure=fig)
 
     # using a seaborn lineplot and reshaping the data produces the result we actually want
     fig_lineplot, ax_lineplot = subplots(figsize=FIGSIZE)
@@ -57,7 +61,7 @@ if __name__ == '__main__':
     ax_lineplot.legend(loc='upper right')
     title('source: {}'.format(URL))
     savefig(fname=OUTPUT_FOLDER + 'umkc_lynchings_lineplot.png', format='png')
-    figure_close(fig=fig_lineplot)
+    release(figure=fig_lineplot)
 
     df['cumulative_white'] = df['Whites'].cumsum()
     df['cumulative_black'] = df['Blacks'].cumsum()
@@ -69,7 +73,7 @@ if __name__ == '__main__':
     ax_cumulative.legend(loc='upper left')
     title('source: {}'.format(URL))
     savefig(fname=OUTPUT_FOLDER + 'umkc_lynchings_cumsum.png', format='png')
-    figure_close(fig=fig_cumulative)
+    release(figure=fig_cumulative)
 
     window = 5
     df['moving_white'] = df['Whites'].rolling(window=window).mean()
@@ -82,6 +86,6 @@ if __name__ == '__main__':
     ax_rolling.legend(loc='upper left')
     title('source: {}'.format(URL))
     savefig(fname=OUTPUT_FOLDER + 'umkc_lynchings_rolling.png', format='png')
-    figure_close(fig=fig_rolling)
+    release(figure=fig_rolling)
 
     LOGGER.info('total time: {:5.2f}s'.format((now() - TIME_START).total_seconds()))
@@ -1,45 +1,38 @@
 """
 Load and parse HTML data
 """
-from collections import Counter
-from datetime import date
 from logging import INFO
 from logging import basicConfig
 from logging import getLogger
 
 from arrow import now
-from matplotlib.pyplot import close
 from matplotlib.pyplot import savefig
-from matplotlib.pyplot import subplots
 from matplotlib.pyplot import title
 from pandas import DataFrame
-from pandas import read_csv
-from seaborn import histplot
 
+from common import dataset_key
+from common import remember_dataset
+from dcas import read_dcas
+from events import event_counts
+from events import plot_counts
+from figures import release
+from figures import subplots
+from sources import SOURCES
+from sources import fetch
 
-def get_csv_dataframe(filepath_or_buffer: str, names: list[str]) -> DataFrame:
-    result_df = read_csv(filepath_or_buffer=filepath_or_buffer, low_memory=False, names=names, sep='|', )
+
+def get_dcas_dataframe(path: str, usecols: list[str]) -> DataFrame:
+    result_df = remember_dataset(key=dataset_key(io=path, reader='read_dcas', usecols=usecols),
+                                 loader=lambda: read_dcas(path=path, usecols=usecols))
     return result_df
 
+
 FIGSIZE = (16, 9)
-INPUT_FILE = './data/DCAS.VN.EXT08.DAT'
-NAMES = ['Service Number', 'Component Code', 'Person Type Name Code', 'Person Type Name', 'Member Name',
-         'Member Service Code', 'Member Service Name', 'Rank Rate', 'Pay Grade', 'Occupation Code',
-         'Occupation Name', 'Birth Date', 'Gender', 'Home of Record City', 'Home of Record County',
-         'Home of Record Country Code', 'Home of Record State Code', 'State or Province Name', 'Marital Name',
-         'Religion Short Name', 'Religion Code', 'Race Name', 'Ethnic Short Name', 'Race OMB Name',
-         'Ethnic Group Name', 'Casualty Circumstances', 'Casualty City', 'Casualty State or Province Code',
-         'Casualty Country/Over Water Code', 'Region Name', 'Country/Over Water Name', 'Unit', 'Duty Code',
-         'Process Date', 'Incident or Death Date', 'Year', 'War or Conflict Code',
-         'Operation Incident Type Code', 'Operation/Incident Name', 'Location Name', 'Closure Date',
-         'Aircraft Type', 'Hostile/Non-Hostile Death Indicator', 'Casualty Type Name', 'Casualty Category Name',
-         'Incident Casualty Reason Name', 'Casualty Category Short Name', 'Remains Recovered',
-         'Casualty Closure Name', 'Vietnam Wall Row and Panel Indicator', 'Incident Casualty Category Name',
-         'Incident Casualty Category Date', 'Incident Casualty Category Short Name',
-         'Incident Hostile or Incident Non-Hostile Death', 'Incident Aircraft Type']
 REFRESH = False
-URL = 'https://catalog.archives.gov/OpaAPI/media/2240992/content/arcmedia/electronic-records/rg-330/dcase/' \
-      'DCAS.VN.EXT08.DAT?download=true'
+# the typed loader parses only these; the rest of the 55 columns stay in the file
+USECOLS = ['Birth Date', 'Casualty Type Name', 'Home of Record State Code', 'Hostile/Non-Hostile Death Indicator',
+           'Incident or Death Date', 'Member Service Name', 'Pay Grade', 'Process Date', 'Rank Rate']
+URL = SOURCES['dcas']['url']
 
 if __name__ == '__main__':
     TIME_START = now()
@@ -47,25 +40,25 @@ if __name__ == '__main__':
     basicConfig(format='%(asctime)s : %(name)s : %(levelname)s : %(message)s', level=INFO, )
     LOGGER.info('started')
 
-    counts = Counter(NAMES)
-    df = get_csv_dataframe(filepath_or_buffer=URL, names=NAMES) if REFRESH else get_csv_dataframe(
-        filepath_or_buffer=INPUT_FILE, names=NAMES)
-
-    date_columns = ['Process Date', 'Birth Date', 'Incident or Death Date', ]
-    for column in date_columns:
-        df[column] = df[column].apply(lambda x: date(year=x // 10000, month=(x // 100) % 100, day=x % 100))
+    df = get_dcas_dataframe(path=str(fetch(name='dcas', refresh=REFRESH)), usecols=USECOLS)
 
-    # filter out extreme data
-    min_date = date(year=1963, month=1, day=1)
-    max_date = date(year=1974, month=1, day=1)
+    # monthly buckets from 1963 through 1973
     column = 'Incident or Death Date'
-    # we want monthly buckets
-    bins = 12 * (max_date.year - min_date.year)
+    counts = event_counts(dates=df[column], freq='month', start='1963-01-01', stop='1974-01-01')
     figure, axes = subplots(figsize=FIGSIZE)
-    result = histplot(ax=axes, bins=bins, data=df[(min_date < df[column]) & (df[column] < max_date)], discrete=False,
-                      element='bars', kde=False, stat='count', x=column, )
+    result = plot_counts(ax=axes, counts=counts, element='bars', kde=False, label=column, stat='count', )
     title('source: {}'.format(URL))
     savefig(format='png', fname='./vietnam.png')
-    close(fig=figure)
+    release(figure=figure)
+
+    # the same months, stacked by service
+    counts = event_counts(dates=df[column], freq='month', groups=df['Member Service Name'],
+                          start='1963-01-01', stop='1974-01-01')
+    figure, axes = subplots(figsize=FIGSIZE)
+    result = plot_counts(ax=axes, counts=counts, element='bars', kde=False, label=column, multiple='stack',
+                         stat='count', )
+    title('source: {}'.format(URL))
+    savefig(format='png', fname='./vietnam_service.png')
+    release(figure=figure)
 
     LOGGER.info('total time: {:5.2f}s'.format((now() - TIME_START).total_seconds()))
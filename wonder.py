@@ -0,0 +1,84 @@
+"""
+Streaming, typed reader for the tab-delimited exports from CDC WONDER
+"""
+from typing import BinaryIO
+from typing import Iterator
+from typing import Optional
+
+from pandas import DataFrame
+from pandas import concat
+from pandas import read_csv
+
+
+class WonderBody:
+    # the export up to the line before its "---" notes trailer, read in blocks so the file never has to fit in memory
+    def __init__(self, raw: BinaryIO):
+        self.done = False
+        self.pending = b''
+        self.raw = raw
+
+    def read(self, size: int = -1) -> bytes:
+        size = BLOCK_BYTES if size is None or size < 0 else size
+        while not self.done and len(self.pending) < size + len(TRAILER):
+            block = self.raw.read(BLOCK_BYTES)
+            if not block:
+                self.done = True
+                break
+            # only the tail of what we already have can hold the start of a trailer split across two blocks
+            start = max(0, len(self.pending) - len(TRAILER))
+            self.pending += block
+            position = self.pending.find(TRAILER, start)
+            if position >= 0:
+                self.pending = self.pending[:position + 1]
+                self.done = True
+        # hold back enough bytes to recognize a trailer that starts at the end of this block
+        limit = len(self.pending) if self.done else min(size, len(self.pending) - len(TRAILER))
+        result, self.pending = self.pending[:limit], self.pending[limit:]
+        return result
+
+
+def read_header(path: str) -> list[str]:
+    with open(file=path, mode='rb') as input_fp:
+        return [item.strip().strip('"') for item in input_fp.readline().decode(ENCODING).rstrip('\r\n').split('\t')]
+
+
+def wonder_chunks(path: str, usecols: Optional[list[str]] = None, chunksize: int = 100000) -> Iterator[DataFrame]:
+    # each chunk holds at most chunksize data rows with only the requested columns, so memory stays flat
+    header = read_header(path=path)
+    columns = header if usecols is None else [column for column in header if column in usecols]
+    missing = sorted(set(usecols or list()) - set(header))
+    if missing:
+        raise ValueError('{} has no columns {}'.format(path, ', '.join(missing)))
+    # the Notes column marks the Total rows, so it is read even when it is not asked for
+    read_columns = columns if NOTES not in header or NOTES in columns else [NOTES] + columns
+    with open(file=path, mode='rb') as input_fp:
+        # the parser only applies thousands separators to numpy numbers, so the numbers come in as float64 (exact for
+        # any count WONDER reports) and take their nullable types a chunk at a time
+        numbers = {key: value for key, value in DTYPES.items() if key in read_columns}
+        reader = read_csv(chunksize=chunksize, dtype={key: 'float64' for key in numbers.keys()}, encoding=ENCODING,
+                          filepath_or_buffer=WonderBody(raw=input_fp), na_values=NULL_MARKERS, sep='\t',
+                          thousands=',', usecols=read_columns)
+        for chunk_df in reader:
+            chunk_df = chunk_df.astype(numbers)
+            if NOTES in chunk_df.columns:
+                # data rows have no note; subtotal rows say Total and carry blanks for the dimensions they sum over
+                chunk_df = chunk_df[chunk_df[NOTES].isna()]
+                if NOTES not in columns:
+                    chunk_df = chunk_df.drop(columns=[NOTES])
+            yield chunk_df[columns].reset_index(drop=True)
+
+
+def read_wonder(path: str, usecols: Optional[list[str]] = None, chunksize: int = 100000) -> DataFrame:
+    chunks = list(wonder_chunks(chunksize=chunksize, path=path, usecols=usecols))
+    return concat(chunks, ignore_index=True) if chunks else DataFrame(columns=usecols or read_header(path=path))
+
+
+BLOCK_BYTES = 1 << 20
+# numbers WONDER writes for every query; dimension columns such as names and codes stay strings
+DTYPES = {'Births': 'Int64', 'Crude Rate': 'Float64', 'Deaths': 'Int64', 'Population': 'Int64', 'Year': 'Int16',
+          'Year Code': 'Int16'}
+ENCODING = 'utf-8'
+NOTES = 'Notes'
+# markers WONDER writes in place of a number; they all read as a typed null
+NULL_MARKERS = ['Missing', 'Not Applicable', 'Not Available', 'Suppressed', 'Unreliable']
+TRAILER = b'\n"---"'